@@ -16,6 +16,118 @@ class Settings(BaseSettings):
     # Set to True if you don't have an API Key yet or no Internet
     USE_MOCK_LLM: bool = True 
     OPENAI_API_KEY: Optional[str] = None 
+    OPENAI_BASE_URL: Optional[str] = None   # e.g. http://127.0.0.1:9100/v1 (mock_llm_server.py)
+    LLM_MODEL: str = "gpt-3.5-turbo"        # Or gpt-4o if you have budget
+    LLM_TIMEOUT_SEC: float = 30.0
+    LLM_MAX_CONCURRENCY: int = 4            # Upstream calls in flight at once
+    LLM_CACHE_TTL_SEC: float = 30.0
+    LLM_CACHE_SIZE: int = 256
+    LLM_SNAPSHOT_STEP_AMPS: float = 0.5     # Grid readings are rounded to this for the cache key
+
+    # --- DATABASE ---
+    # Point replays / load tests at a scratch file instead of the live grid.db
+    DATABASE_URL: str = "sqlite:///./grid.db"
+    DB_READ_POOL_SIZE: int = 8          # Async read connections for the API (the ingest writer has its own)
+    DB_READ_POOL_TIMEOUT: float = 30.0  # Seconds a request waits for a free read connection
+
+    # --- DATABASE WRITE-BEHIND ---
+    # False = old behaviour (one commit per MQTT message)
+    DB_WRITE_BEHIND: bool = True
+    DB_QUEUE_SIZE: int = 10000       # Max messages (row groups) waiting in memory
+    DB_BATCH_SIZE: int = 500         # Flush when this many rows are queued...
+    DB_FLUSH_INTERVAL: float = 0.5   # ...or after this many seconds
+
+    # --- HOT CACHE (served without SQLite) ---
+    HOT_CACHE_READINGS_PER_SENSOR: int = 50
+    HOT_CACHE_READINGS: int = 200            # Newest readings across all sensors
+    HOT_CACHE_EVENTS: int = 100
+
+    # --- OUTBOUND ALERTS (SMS / relay commands) ---
+    DISPATCH_QUEUE_SIZE: int = 10000      # Per channel
+    DISPATCH_MAX_RETRIES: int = 3
+    DISPATCH_BACKOFF_SEC: float = 0.5     # Doubles on every retry
+    DISPATCH_SMS_CONCURRENCY: int = 4
+    DISPATCH_CONTROL_CONCURRENCY: int = 1
+    # "sms" = real gateway, "file" / "http" = offline stand-ins for load tests
+    ALERT_TRANSPORT: str = "sms"
+    ALERT_FILE_PATH: str = "alerts_outbox.jsonl"
+    ALERT_HTTP_URL: Optional[str] = None
+
+    # --- AUDIO (hum distortion FFT, micro-batched at ingest) ---
+    AUDIO_BATCH_SIZE: int = 64               # Waveforms scored in one 2-D FFT...
+    AUDIO_BATCH_WAIT_SEC: float = 0.05       # ...or after this long (a lone sensor is scored at once)
+
+    # --- METRICS (Prometheus text on /metrics) ---
+    METRICS_ENABLED: bool = True
+    # Max bookkeeping cost per MQTT message; above it stage timings are sampled
+    METRICS_OVERHEAD_BUDGET_US: float = 20.0
+
+    # --- LOGGING (queue + listener thread, so log I/O never blocks ingest) ---
+    LOG_LEVEL: str = "DEBUG"
+    LOG_FILE: str = "grid.log"
+    LOG_CONSOLE_FORMAT: str = "text"          # text | json
+    LOG_FILE_FORMAT: str = "json"             # One JSON object per line
+    LOG_QUEUE_SIZE: int = 10000               # Records beyond this are dropped (and counted)
+    LOG_RATE_INTERVAL_SEC: float = 5.0        # Repetitive lines (MONITOR, PREDICTION...): per key and interval,
+    LOG_RATE_BURST: int = 1                   # at most this many lines get through (0 interval = no limit)
+
+    # --- GRID TOPOLOGY (substation -> transformer -> feeder -> meter) ---
+    # JSON tree. If the file is missing, the built-in demo wiring is used.
+    TOPOLOGY_FILE: str = "topology.json"
+
+    # --- MULTI-WORKER (uvicorn --workers N) ---
+    # One process owns MQTT ingest (flock election), the others serve HTTP
+    # from a shared-memory copy of the Digital Twin.
+    INGEST_ROLE: str = "auto"                 # auto | owner | reader
+    INGEST_LOCK_FILE: str = "grid_ingest.lock"
+    TWIN_SNAPSHOT_FILE: str = "grid_twin.snap"
+    TWIN_SNAPSHOT_SIZE_MB: int = 8
+    TWIN_SNAPSHOT_INTERVAL: float = 0.2       # Seconds between publishes / polls
+
+    # --- COLUMNAR ARCHIVE (offline analytics, /history/export) ---
+    EXPORT_DIR: str = "exports"
+    EXPORT_BATCH_ROWS: int = 50000            # Rows per keyset batch while exporting
+
+    # --- RETENTION (keeps grid.db from growing forever, 0 days = keep forever) ---
+    RETAIN_RAW_DAYS: int = 30                 # Raw readings (rolled up before they go)
+    RETAIN_ROLLUP_1M_DAYS: int = 180
+    RETAIN_ROLLUP_1H_DAYS: int = 0
+    RETAIN_EVENTS_DAYS: int = 0               # Only audited events are pruned, behind a signed anchor
+    RETENTION_INTERVAL_SEC: float = 3600.0    # 0 = no background job (POST /admin/retention/run only)
+    RETENTION_BATCH_ROWS: int = 2000          # Rows per delete transaction
+    RETENTION_BATCH_PAUSE_SEC: float = 0.05   # Breather for the ingest writer between batches
+    RETENTION_EXPORT_FIRST: bool = False      # Run the columnar export before pruning raw rows
+    VACUUM_PAGES_PER_STEP: int = 1000
+
+    # --- INSULATION AGING (IEEE C57.91) ---
+    AGING_MAX_GAP_SEC: float = 300.0          # Longer gaps between readings (sensor offline) are not aged
+    AGING_PERSIST_SEC: float = 60.0           # How often the cumulative totals are written to grid.db
+
+    # --- THERMAL WHAT-IF SIMULATION (IEEE C57.91 clause 7, defaults for a 65°C rise ONAN unit) ---
+    THERMAL_AMBIENT_C: float = 30.0
+    THERMAL_TOP_OIL_RISE_C: float = 45.0      # Over ambient at rated load
+    THERMAL_HOTSPOT_RISE_C: float = 35.0      # Over top oil at rated load (45 + 35 + 30 = 110°C)
+    THERMAL_LOSS_RATIO: float = 4.5           # Load losses / no-load losses
+    THERMAL_OIL_EXPONENT: float = 0.8
+    THERMAL_WINDING_EXPONENT: float = 0.8
+    THERMAL_OIL_TAU_MIN: float = 180.0
+    THERMAL_WINDING_TAU_MIN: float = 7.0
+    THERMAL_HOTSPOT_LIMIT_C: float = 140.0    # C57.91 short-time emergency limit
+    THERMAL_MAX_CELLS: int = 20_000_000       # transformers x steps per request
+    THERMAL_CONCURRENCY: int = 1              # Simulations running at once
+
+    # --- ALERT INCIDENTS (hysteresis per sensor and alert type) ---
+    INCIDENT_RAISE_HOLD_SEC: float = 2.0      # Theft / aging / audio must persist this long before an incident opens
+    INCIDENT_CLEAR_HOLD_SEC: float = 30.0     # ...and stay under the clear threshold this long before it closes
+    INCIDENT_STALE_SEC: float = 300.0         # Open incidents without a reading for this long are closed
+    INCIDENT_PERSIST_SEC: float = 10.0        # How often count / peak / last seen of open incidents are written
+
+    # --- AUDIT (BLACK BOX VERIFICATION) ---
+    AUDIT_SIGNING_KEY: Optional[str] = None   # Falls back to ADMIN_SECRET
+    AUDIT_CHUNK_SIZE: int = 5000              # Rows fetched per round trip
+    AUDIT_WORKERS: int = 0                    # Hashing processes for full re-audits (0 = all cores)
+    AUDIT_CONCURRENCY: int = 2                # /audit/verify calls running at once (own threads, not the API threadpool)
+    LEDGER_BLOCK_SIZE: int = 64               # Events per Merkle block (sealed at ingest)
 
     class Config:
         env_file = ".env"
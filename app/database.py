@@ -1,17 +1,105 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from app.config import settings
 from app.models import Base
 
-# This creates a file named 'grid.db' in your project folder
-DATABASE_URL = "sqlite:///./grid.db"
+# Default creates a file named 'grid.db' in your project folder
+DATABASE_URL = settings.DATABASE_URL
 
 # "check_same_thread=False" is needed only for SQLite
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: dashboard reads no longer block the ingest writer (and vice versa)
+    cursor = dbapi_connection.cursor()
+    # Lets retention hand freed pages back in small steps. Must come before journal_mode:
+    # switching to WAL writes the file header, after which only a VACUUM can change it (see _migrate)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, far fewer fsyncs
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+event.listen(engine, "connect", _sqlite_pragmas)
+
+# Bound parameters per statement in a stock SQLite build (999 before 3.32)
+SQLITE_MAX_VARIABLES = 32766
+
+def row_batches(rows: list, max_vars: int = SQLITE_MAX_VARIABLES):
+    """Splits dict rows so one multi-VALUES statement stays under the bind parameter limit."""
+    if not rows:
+        return
+    size = max(1, max_vars // len(rows[0]))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
 # The SessionLocal is what we use to actually write data
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- ASYNC READ POOL (API handlers) ---
+# Same file through aiosqlite: each connection runs its queries on its own thread,
+# so a slow history query waits on SQLite, not on Starlette's threadpool.
+# The pool is bounded (no overflow): past DB_READ_POOL_SIZE requests queue for a connection.
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=settings.DB_READ_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=settings.DB_READ_POOL_TIMEOUT,
+)
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _sqlite_read_pragmas(dbapi_connection, connection_record):
+    _sqlite_pragmas(dbapi_connection, connection_record)
+    # Readers never write: the ingest writer stays the only one holding the write lock
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# Dependency: Get DB Session (sync handlers: exports, admin)
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency: Get async read session (history, alerts)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _migrate():
+    """Brings databases created by older versions up to the current schema"""
+    inspector = inspect(engine)
+    if "readings" not in inspector.get_table_names():
+        return
+
+    columns = {col["name"] for col in inspector.get_columns("readings")}
+    if "sensor_id" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE readings ADD COLUMN sensor_id VARCHAR NOT NULL DEFAULT 'UNKNOWN'"))
+        print("🔧 Migrated 'readings': added sensor_id")
+
+    # create_all() skips indexes on tables that already exist
+    readings = Base.metadata.tables["readings"]
+    for index in readings.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+    # Files created before retention existed have auto_vacuum=NONE, which only a full VACUUM can change
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 0:
+            print("🔧 Migrating grid.db to incremental auto-vacuum (one-time full VACUUM)...")
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.commit()
+            conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+
 def init_db():
     """Creates the tables if they don't exist"""
     Base.metadata.create_all(bind=engine)
-    print("✅ Database Tables Created Successfully")
\ No newline at end of file
+    _migrate()
+    print("✅ Database Tables Created Successfully")
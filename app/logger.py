@@ -1,22 +1,141 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from app.config import settings
 
 # Configure the logger
 logger = logging.getLogger("grid_sentinel")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(getattr(logging, settings.LOG_LEVEL.upper(), logging.DEBUG))
+logger.propagate = False
 
+
+# --- 1. FORMATS ---
 # Format: Time | Level | Message
 formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s", datefmt="%H:%M:%S")
 
+# Attributes every LogRecord has; anything else came in through extra={...}
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, extra={...} fields included (ELK / Loki friendly)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for name, value in vars(record).items():
+            if name not in _STANDARD:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _formatter(kind: str) -> logging.Formatter:
+    return JsonFormatter() if kind == "json" else formatter
+
+
+# --- 2. RATE LIMITING (runs in the caller's thread, before anything is formatted) ---
+class RateLimitFilter(logging.Filter):
+    """
+    Repetitive lines carry extra={"key": ...} (e.g. "monitor:TX_MAIN_01").
+    Each key may log 'burst' records per 'interval' seconds; the rest are
+    dropped and counted, and the next line that gets through says how many
+    were suppressed. Records without a key always pass.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, interval=5.0, burst=1):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}   # key -> [window_start, emitted, suppressed]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "key", None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= self.MAX_KEYS:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, 0]
+            elif now - window[0] >= self.interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+            window[1] += 1
+            dropped, window[2] = window[2], 0
+        if dropped:
+            record.suppressed = dropped
+            record.msg = f"{record.msg} (+{dropped} similar suppressed)"
+        return True
+
+
+# --- 3. NON-BLOCKING HANDOFF ---
+class DroppingQueueHandler(QueueHandler):
+    """
+    The calling thread only formats the message and enqueues it; console and
+    file I/O happen on the listener thread. If the queue is full (disk or
+    terminal cannot keep up) the record is dropped, never waited for.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 # 1. Console Handler (What you see in terminal)
 console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+console_handler.setFormatter(_formatter(settings.LOG_CONSOLE_FORMAT))
 
 # 2. File Handler (Saves to grid.log)
-file_handler = logging.FileHandler("grid.log")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+file_handler = logging.FileHandler(settings.LOG_FILE)
+file_handler.setFormatter(_formatter(settings.LOG_FILE_FORMAT))
+
+rate_limiter = RateLimitFilter(interval=settings.LOG_RATE_INTERVAL_SEC, burst=settings.LOG_RATE_BURST)
+queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+logger.addFilter(rate_limiter)
+logger.addHandler(queue_handler)
+
+listener = QueueListener(queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+listener.start()
+# Flush whatever is still queued when the process exits
+atexit.register(listener.stop)
+
 
 def get_logger():
-    return logger
\ No newline at end of file
+    return logger
+
+
+def log_stats() -> dict:
+    return {
+        "queue_depth": queue_handler.queue.qsize(),
+        "queue_capacity": queue_handler.queue.maxsize,
+        "dropped": queue_handler.dropped,
+        "rate_limited": rate_limiter.suppressed,
+    }
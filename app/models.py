@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
@@ -7,6 +7,7 @@ Base = declarative_base()
 class Reading(Base):
     __tablename__ = "readings"
     id = Column(Integer, primary_key=True, index=True)
+    sensor_id = Column(String, nullable=False, default="UNKNOWN")
     temperature = Column(Float)
     current = Column(Float)
     vibration = Column(Float)
@@ -14,6 +15,39 @@ class Reading(Base):
     # AI Prediction Field
     predicted_failure_min = Column(Integer, nullable=True)
 
+    __table_args__ = (
+        # One transformer over a time window = index range scan
+        Index("ix_readings_sensor_time", "sensor_id", "timestamp"),
+        # Fleet-wide "latest N" without sorting the table
+        Index("ix_readings_time", "timestamp"),
+    )
+
+class ReadingRollup(Base):
+    """
+    Pre-aggregated readings per sensor and bucket (60s / 3600s).
+    Sums (not averages) are stored so partial buckets can be merged.
+    """
+    __tablename__ = "reading_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    sensor_id = Column(String, nullable=False)
+    resolution = Column(Integer, nullable=False)     # Bucket width in seconds
+    bucket_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    temperature_min = Column(Float)
+    temperature_max = Column(Float)
+    temperature_sum = Column(Float)
+    current_min = Column(Float)
+    current_max = Column(Float)
+    current_sum = Column(Float)
+    vibration_min = Column(Float)
+    vibration_max = Column(Float)
+    vibration_sum = Column(Float)
+
+    __table_args__ = (
+        Index("ux_rollups_sensor_res_bucket", "sensor_id", "resolution", "bucket_start", unique=True),
+    )
+
 class Event(Base):
     __tablename__ = "events"
     id = Column(Integer, primary_key=True, index=True)
@@ -25,4 +59,78 @@ class Event(Base):
 
     # --- THE BLACK BOX FIELDS ---
     previous_hash = Column(String, default="GENESIS") 
-    event_hash = Column(String)
\ No newline at end of file
+    event_hash = Column(String)
+
+class EventBlock(Base):
+    """
+    A sealed run of LEDGER_BLOCK_SIZE consecutive events: Merkle root over
+    their event_hash values, chained to the previous block's header hash.
+    id = block height (1, 2, ...).
+    """
+    __tablename__ = "event_blocks"
+    id = Column(Integer, primary_key=True, index=True)
+    first_event_id = Column(Integer, nullable=False)
+    last_event_id = Column(Integer, nullable=False, index=True)
+    event_count = Column(Integer, nullable=False)
+    merkle_root = Column(String, nullable=False)
+    previous_block_hash = Column(String, nullable=False)
+    block_hash = Column(String, nullable=False)
+    sealed_at = Column(DateTime, default=datetime.now)
+
+class TransformerAging(Base):
+    """Cumulative IEEE C57.91 insulation aging per transformer (saved by the AgingEngine)."""
+    __tablename__ = "transformer_aging"
+    sensor_id = Column(String, primary_key=True)
+    equivalent_aging_hours = Column(Float, nullable=False, default=0.0)   # Σ FAA·Δt
+    elapsed_hours = Column(Float, nullable=False, default=0.0)            # Σ Δt
+    hotspot_temp = Column(Float)
+    aging_factor = Column(Float)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class Incident(Base):
+    """
+    One alert condition from raise to clear, per (sensor_id, event_type).
+    Repeat readings only bump count / peak / last_seen_at (see IncidentEngine).
+    """
+    __tablename__ = "incidents"
+    id = Column(Integer, primary_key=True, index=True)
+    sensor_id = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="OPEN")   # OPEN | CLEARED
+    event_id = Column(Integer)            # The Event row written when it opened
+    message = Column(String)
+    count = Column(Integer, nullable=False, default=1)        # Readings over the raise threshold
+    peak_value = Column(Float)
+    last_value = Column(Float)
+    opened_at = Column(DateTime, default=datetime.now)
+    last_seen_at = Column(DateTime)
+    cleared_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_incidents_sensor_type", "sensor_id", "event_type", "opened_at"),
+        Index("ix_incidents_status", "status"),
+        Index("ix_incidents_opened", "opened_at"),
+    )
+
+class AuditCheckpoint(Base):
+    """Signed 'verified-up-to' marker so the next audit only checks the new tail."""
+    __tablename__ = "audit_checkpoints"
+    id = Column(Integer, primary_key=True, index=True)
+    last_event_id = Column(Integer)
+    last_event_hash = Column(String)
+    events_verified = Column(Integer)   # Cumulative chain length up to last_event_id
+    verified_at = Column(DateTime, default=datetime.now)
+    signature = Column(String)
+
+class ChainAnchor(Base):
+    """
+    Signed marker left behind when retention prunes the head of the events
+    chain: the first remaining event must link to last_event_hash.
+    """
+    __tablename__ = "chain_anchors"
+    id = Column(Integer, primary_key=True, index=True)
+    last_event_id = Column(Integer)       # Newest pruned event
+    last_event_hash = Column(String)
+    events_pruned = Column(Integer)       # Cumulative, so chain_length still counts from GENESIS
+    pruned_at = Column(DateTime, default=datetime.now)
+    signature = Column(String)
@@ -1,28 +1,23 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models import Reading, Event
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.models import Event
+from app.services.state import grid_state
 # If you have specific schemas, import them, otherwise we return ORM models directly
 # from app.schemas import ... 
 
 router = APIRouter()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # --- 1. THE ENDPOINT YOUR FRONTEND IS SCREAMING FOR ---
+# Served from the Digital Twin's hot cache: no SQLite round trip per poll
 @router.get("/api/live")
-def get_live_data(db: Session = Depends(get_db)):
+async def get_live_data():
     # Get the very latest reading from the Transformer
-    tx = db.query(Reading).order_by(Reading.timestamp.desc()).first()
+    tx = grid_state.latest_reading
     
     # Get the latest 5 alerts
-    alerts = db.query(Event).order_by(Event.timestamp.desc()).limit(5).all()
+    alerts = grid_state.latest_events(5)
     
     # Return them in the format the React hook expects
     return {
@@ -32,5 +27,7 @@ def get_live_data(db: Session = Depends(get_db)):
 
 # --- 2. ENDPOINT FOR HISTORY/ALERTS TAB ---
 @router.get("/api/alerts")
-def get_alerts(db: Session = Depends(get_db)):
-    return db.query(Event).order_by(Event.timestamp.desc()).limit(20).all()
+async def get_alerts(db: AsyncSession = Depends(get_async_db)):
+    if grid_state.can_serve_events(20):
+        return grid_state.latest_events(20)
+    return (await db.scalars(select(Event).order_by(Event.timestamp.desc()).limit(20))).all()
@@ -1,51 +1,348 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from functools import partial
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from pydantic import BaseModel
-from app.database import SessionLocal
-from app.models import Reading, Event
+from typing import Annotated, Dict, List, Optional
+from datetime import datetime, timedelta
+from pydantic import BaseModel, Field
+from app.database import get_db, get_async_db
+from app.models import Reading, ReadingRollup, Event, EventBlock, AuditCheckpoint, ChainAnchor, TransformerAging, Incident
 from app.schemas import ReadingResponse, EventResponse
 from app.services.state import grid_state 
 from app.services.control import grid_controller
 from app.config import settings
-from app.services.llm import ask_grid_sentinel
-from app.services.crypto import generate_event_hash # <-- Import Crypto Service
+from app.services.llm import grid_gpt
+from app.services.audit import chain_verifier, audit_jobs # <-- Black Box Verification
+from app.services.writer import db_writer
+from app.services.prediction import oracle
+from app.services.rollups import rollup_engine, chart_series
+from app.services.broadcast import telemetry_hub
+from app.services.dispatch import alert_dispatcher
+from app.services.topology import topology
+from app.services.cluster import twin_cluster
+from app.services.archive import archive
+from app.services.retention import retention_engine
+from app.services.ledger import event_ledger, inclusion_proof
+from app.services.aging import aging_engine
+from app.services.incidents import incident_engine
+from app.services.thermal import thermal_simulator, check_params as check_thermal_params
 
 router = APIRouter()
 
-# Dependency: Get DB Session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# What-if simulations are CPU-heavy NumPy work: same idea, their own small limiter
+thermal_limiter = anyio.CapacityLimiter(settings.THERMAL_CONCURRENCY)
+
+# Audits hash the chain on their own threads, never more than AUDIT_CONCURRENCY at once,
+# so a burst of /audit/verify cannot take every slot of the shared threadpool
+audit_limiter = anyio.CapacityLimiter(settings.AUDIT_CONCURRENCY)
 
 # ---------------------------------------------------------
 # MONITORING ENDPOINTS (Read-Only)
 # ---------------------------------------------------------
 
 @router.get("/status/live")
-def get_live_status():
+async def get_live_status():
     """Returns the instant state of the grid (Digital Twin)"""
     return {
         "transformer_current": grid_state.transformer_current,
-        "total_load": sum(grid_state.smart_meters.values()),
+        "total_load": grid_state.total_meter_load,
         "theft_detected": grid_state.check_for_theft(),
         "status": "ONLINE"
     }
 
+def _owner_view(section: str, local):
+    """HTTP-only workers answer from the ingest owner's last snapshot."""
+    remote = twin_cluster.remote(section)
+    return remote if remote is not None else local()
+
+@router.get("/status/writer")
+def get_writer_status():
+    """Returns queue depth and flush latency of the write-behind DB writer"""
+    return _owner_view("writer", db_writer.stats)
+
+@router.get("/status/dispatcher")
+def get_dispatcher_status():
+    """Queue depth, retries and delivery latency of outbound alerts per channel"""
+    return _owner_view("dispatcher", alert_dispatcher.stats)
+
+@router.get("/status/predictions")
+def get_fleet_predictions(limit_temp: float = 100.0):
+    """Minutes-to-limit for every transformer currently heating up (one batch pass)"""
+    if limit_temp == 100.0:
+        # The owner publishes the fleet forecast at the default limit only
+        return _owner_view("predictions", oracle.predict_fleet)
+    if twin_cluster.is_reader:
+        # This worker's oracle never sees a reading: an empty answer would look like "all safe"
+        raise HTTPException(status_code=409, detail="Custom limit_temp is only available on the ingest owner")
+    return oracle.predict_fleet(limit_temp=limit_temp)
+
+def _encode_cursor(reading) -> str:
+    return f"{reading.timestamp.isoformat()}_{reading.id}"
+
+def _cached_cursor(rows: list) -> str:
+    """Cursor after a hot-cache page: its lowest (timestamp, id), so page 2 never repeats a row."""
+    keys = []
+    for row in rows:
+        ts = row["timestamp"]
+        # Snapshots from the ingest owner carry ISO strings
+        keys.append((datetime.fromisoformat(ts) if isinstance(ts, str) else ts, row["id"]))
+    ts, row_id = min(keys)
+    return f"{ts.isoformat()}_{row_id}"
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, row_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/status/topology")
+def get_energy_balance(min_imbalance: float = 0.0):
+    """Imbalance (input - metered load) per transformer and feeder segment, worst first"""
+    remote = twin_cluster.remote("topology")
+    if remote is not None and min_imbalance >= 0:
+        return [row for row in remote if row["imbalance"] >= min_imbalance]
+    return topology.report(threshold=min_imbalance)
+
+@router.get("/aging")
+def get_fleet_aging(limit: int = Query(100, ge=1, le=10000)):
+    """
+    Cumulative insulation aging (IEEE C57.91) of every transformer, fastest-aging first:
+    current aging factor, FEQA, equivalent aging hours and % loss of life.
+    """
+    remote = twin_cluster.remote("aging")
+    return remote[:limit] if remote is not None else aging_engine.report(limit=limit)
+
+@router.get("/aging/{sensor_id}")
+def get_transformer_aging(sensor_id: str):
+    """Cumulative insulation aging of one transformer"""
+    remote = twin_cluster.remote("aging")
+    rows = [row for row in remote if row["sensor_id"] == sensor_id] if remote is not None else aging_engine.report(sensor_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No aging data for this sensor")
+    return rows[0]
+
+@router.get("/status/cluster")
+def get_cluster_status():
+    """Which worker owns MQTT ingest, and how fresh this worker's copy of the twin is"""
+    return twin_cluster.stats()
+
 @router.get("/history/readings", response_model=List[ReadingResponse])
-def get_history(limit: int = 100, db: Session = Depends(get_db)):
-    """Returns the last N readings for graphs"""
-    readings = db.query(Reading).order_by(Reading.timestamp.desc()).limit(limit).all()
+async def get_history(
+    response: Response,
+    sensor_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Returns readings for graphs, newest first by default.
+    Filter by sensor_id and [start, end]. For the next page, pass back the
+    X-Next-Cursor response header as ?cursor= (keyset pagination, no OFFSET).
+    """
+    # Plain "latest N" requests are answered from the twin's hot cache
+    if start is None and end is None and cursor is None and order == "desc":
+        cached = grid_state.latest_readings(limit, sensor_id)
+        if cached is not None:
+            if len(cached) == limit:
+                response.headers["X-Next-Cursor"] = _cached_cursor(cached)
+            return cached
+
+    query = select(Reading)
+    if sensor_id is not None:
+        query = query.where(Reading.sensor_id == sensor_id)
+    if start is not None:
+        query = query.where(Reading.timestamp >= start)
+    if end is not None:
+        query = query.where(Reading.timestamp <= end)
+
+    # (timestamp, id) is unique, so the cursor never skips or repeats rows
+    key = tuple_(Reading.timestamp, Reading.id)
+    if cursor:
+        query = query.where(key < _decode_cursor(cursor) if order == "desc" else key > _decode_cursor(cursor))
+    if order == "desc":
+        query = query.order_by(Reading.timestamp.desc(), Reading.id.desc())
+    else:
+        query = query.order_by(Reading.timestamp.asc(), Reading.id.asc())
+
+    readings = (await db.scalars(query.limit(limit))).all()
+    if len(readings) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(readings[-1])
     return readings
 
+@router.get("/history/chart")
+async def get_chart(
+    sensor_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_points: int = Query(500, ge=10, le=5000),
+    resolution: str = Query("auto", pattern="^(auto|raw|1m|1h)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Chart-ready history for one sensor (default: last hour).
+    Picks raw rows or the 1m / 1h rollups depending on the window, then
+    downsamples (LTTB for raw, bucket merging for rollups) to max_points.
+    """
+    end = end or datetime.now()
+    start = start or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return await chart_series(db, rollup_engine, sensor_id, start, end, max_points, resolution, raw_since=retention_engine.raw_cutoff())
+
 @router.get("/history/alerts", response_model=List[EventResponse])
-def get_alerts(limit: int = 20, db: Session = Depends(get_db)):
+async def get_alerts(limit: int = 20, db: AsyncSession = Depends(get_async_db)):
     """Returns the latest critical events"""
-    alerts = db.query(Event).order_by(Event.timestamp.desc()).limit(limit).all()
-    return alerts
+    if grid_state.can_serve_events(limit):
+        return grid_state.latest_events(limit)
+    alerts = await db.scalars(select(Event).order_by(Event.timestamp.desc()).limit(limit))
+    return alerts.all()
+
+@router.get("/incidents")
+def get_open_incidents():
+    """
+    Alert conditions going on right now, one per sensor and alert type, with
+    live count / peak / last seen (repeat readings never add alert rows).
+    """
+    return _owner_view("incidents", incident_engine.report)
+
+@router.get("/history/incidents")
+async def get_incident_history(
+    sensor_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(OPEN|CLEARED)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Incidents newest first. Counts of open ones are stored every INCIDENT_PERSIST_SEC."""
+    query = select(Incident)
+    if sensor_id:
+        query = query.where(Incident.sensor_id == sensor_id)
+    if event_type:
+        query = query.where(Incident.event_type == event_type)
+    if status:
+        query = query.where(Incident.status == status)
+    rows = await db.scalars(query.order_by(Incident.opened_at.desc(), Incident.id.desc()).limit(limit))
+    return [
+        {
+            "incident_id": row.id,
+            "sensor_id": row.sensor_id,
+            "event_type": row.event_type,
+            "status": row.status,
+            "event_id": row.event_id,
+            "message": row.message,
+            "count": row.count,
+            "peak_value": row.peak_value,
+            "last_value": row.last_value,
+            "opened_at": row.opened_at,
+            "last_seen_at": row.last_seen_at,
+            "cleared_at": row.cleared_at,
+        }
+        for row in rows.all()
+    ]
+
+@router.get("/history/export")
+def export_history(
+    kind: str = Query("readings", pattern="^(readings|events)$"),
+    sensor_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    refresh: bool = False,
+    secret: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Streams a tar of columnar .npy chunks (plus manifest.json) for offline analysis.
+    With refresh (admin secret required), rows added since the last export are
+    exported first (incremental). Unpack and use np.load(path, mmap_mode="r").
+    """
+    if refresh:
+        if secret != settings.ADMIN_SECRET:
+            raise HTTPException(status_code=403, detail="Wrong Secret")
+        archive.export(db)
+    filename = f"grid_{kind}{'_' + sensor_id if sensor_id else ''}.tar"
+    return StreamingResponse(
+        archive.stream_tar(kind, sensor_id, start, end),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/history/export/run")
+def run_export(secret: str, db: Session = Depends(get_db)):
+    """Exports everything newer than the last exported id into EXPORT_DIR"""
+    if secret != settings.ADMIN_SECRET:
+        raise HTTPException(status_code=403, detail="Wrong Secret")
+    return archive.export(db)
+
+@router.get("/status/export")
+def get_export_status():
+    """Rows / chunks in the columnar archive and the last export run"""
+    return archive.stats()
+
+# ---------------------------------------------------------
+# LIVE STREAM (Push instead of polling)
+# ---------------------------------------------------------
+
+def _sensor_filter(sensor_id: Optional[str]):
+    return set(sensor_id.split(",")) if sensor_id else None
+
+@router.get("/stream/live")
+async def stream_live(request: Request, sensor_id: Optional[str] = None):
+    """
+    Server-Sent Events feed of live deltas (readings, alerts, grid totals).
+    Optional ?sensor_id=A,B limits readings/alerts to those sensors.
+    """
+    try:
+        sub = telemetry_hub.subscribe(_sensor_filter(sensor_id))
+    except ConnectionRefusedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def event_stream():
+        try:
+            async for batch in telemetry_hub.listen(sub):
+                if await request.is_disconnected():
+                    break
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(f"data: {message}\n\n" for message in batch)
+        finally:
+            telemetry_hub.unsubscribe(sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/ws/live")
+async def websocket_live(websocket: WebSocket, sensor_id: Optional[str] = None):
+    """WebSocket version of /stream/live (same messages, one JSON per frame)."""
+    try:
+        sub = telemetry_hub.subscribe(_sensor_filter(sensor_id))
+    except ConnectionRefusedError:
+        await websocket.close(code=1013)  # Try again later
+        return
+
+    await websocket.accept()
+    try:
+        async for batch in telemetry_hub.listen(sub):
+            if not batch:
+                await websocket.send_text('{"type": "ping"}')
+            for message in batch:
+                await websocket.send_text(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        telemetry_hub.unsubscribe(sub)
+
+@router.get("/status/stream")
+def get_stream_status():
+    """Subscriber count, coalescing and backpressure counters of the live feed"""
+    return telemetry_hub.stats()
 
 # ---------------------------------------------------------
 # CONTROL ENDPOINTS (Actionable)
@@ -71,72 +368,197 @@ class ChatRequest(BaseModel):
     question: str
 
 @router.post("/chat/ask")
-def chat_with_grid(request: ChatRequest):
+async def chat_with_grid(request: ChatRequest):
     """
     Ask the AI Operator about grid health.
     Uses RAG to inject live telemetry into the LLM prompt.
+    Repeated questions for the same grid state are served from cache.
     """
-    response_text = ask_grid_sentinel(request.question)
+    response_text, source = await grid_gpt.ask(request.question)
     return {
         "role": "SENTINEL_AI", 
         "answer": response_text,
-        "mode": "MOCK" if settings.USE_MOCK_LLM else "LIVE_OPENAI"
+        "mode": "MOCK" if source == "MOCK" else "LIVE_OPENAI",
+        "source": source
     }
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Same as /chat/ask, but tokens are pushed as Server-Sent Events while the
+    model writes them: 'data: {"delta": ...}' frames, then 'event: done'.
+    """
+    meta = {}
+
+    async def token_stream():
+        async for chunk in grid_gpt.stream(request.question, meta):
+            yield f"data: {json.dumps({'delta': chunk})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'source': meta.get('source')})}\n\n"
+
+    return StreamingResponse(token_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/status/chat")
+def get_chat_status():
+    """Cache hits, coalesced questions and upstream calls of Grid-GPT"""
+    return grid_gpt.stats()
+
+# ---------------------------------------------------------
+# THERMAL WHAT-IF (IEEE C57.91 top-oil / hot-spot simulation)
+# ---------------------------------------------------------
+
+# Per-unit load values (0 = off, 3 = 300% of rating)
+LoadValue = Annotated[float, Field(ge=0, le=3)]
+
+class LoadStep(BaseModel):
+    load: float = Field(..., ge=0, le=3)   # Per-unit of rated load
+    start_hour: float = Field(0.0, ge=0)
+    hours: float = Field(..., gt=0)
+
+class ThermalScenario(BaseModel):
+    sensor_ids: Optional[List[str]] = None             # Default: every transformer in the twin
+    hours: float = Field(24.0, gt=0, le=14 * 24)
+    step_minutes: float = Field(1.0, gt=0, le=60)
+    load_profile: List[LoadValue] = Field([1.0], min_length=1)   # Per-unit load, stretched over 'hours'
+    load_profiles: Dict[str, Annotated[List[LoadValue], Field(min_length=1)]] = {}   # Per-transformer profiles
+    load_steps: List[LoadStep] = []                      # e.g. 130% for 2 hours, on top of the profiles
+    ambient: List[Annotated[float, Field(ge=-60, le=70)]] = []   # °C, one value or a profile (default THERMAL_AMBIENT_C)
+    params: Dict[str, float] = {}                        # Overrides of the C57.91 parameters
+    start_from_live: bool = True                         # Start at the last measured temperature
+    hotspot_limit: Optional[float] = Field(None, gt=0, le=300)
+    include_series: bool = False                         # Hot-spot curve per transformer (max 20)
+
+@router.post("/thermal/simulate")
+async def simulate_thermal(scenario: ThermalScenario):
+    """
+    What happens to these transformers under this load (and ambient) profile?
+    Peak top-oil / hot-spot temperature, minutes over the hot-spot limit and
+    insulation loss of life, for all of them in one vectorized run.
+    """
+    live = grid_state.latest_temperatures()
+    sensor_ids = scenario.sensor_ids or sorted(live)
+    if not sensor_ids:
+        raise HTTPException(status_code=400, detail="No transformers: pass sensor_ids")
+    problems = check_thermal_params(scenario.params)
+    if problems:
+        raise HTTPException(status_code=400, detail="; ".join(problems))
+    steps = scenario.hours * 60.0 / scenario.step_minutes
+    if len(sensor_ids) * steps > settings.THERMAL_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"Too large: transformers x steps must stay under {settings.THERMAL_MAX_CELLS:,}")
+    if scenario.include_series and len(sensor_ids) > 20:
+        raise HTTPException(status_code=400, detail="include_series is limited to 20 transformers")
+
+    run = partial(
+        thermal_simulator.what_if,
+        sensor_ids,
+        live if scenario.start_from_live else {},
+        scenario.hours,
+        scenario.step_minutes,
+        scenario.load_profile,
+        load_profiles=scenario.load_profiles,
+        load_steps=[step.model_dump() for step in scenario.load_steps],
+        ambient=scenario.ambient,
+        params=scenario.params,
+        hotspot_limit=scenario.hotspot_limit,
+        include_series=scenario.include_series,
+    )
+    return await anyio.to_thread.run_sync(run, limiter=thermal_limiter)
+
 # ---------------------------------------------------------
 # AUDIT ENDPOINT (The "Sherlock Holmes" Tool)
 # ---------------------------------------------------------
 
 @router.get("/audit/verify")
-def verify_blockchain(db: Session = Depends(get_db)):
+async def verify_blockchain(
+    start_id: Optional[int] = None,
+    end_id: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    full: bool = False,
+):
     """
-    Re-calculates every hash in the database to prove data integrity.
-    Returns: 'VALID' or 'CORRUPTED'
+    Re-calculates hashes in the database to prove data integrity.
+    By default only the tail after the last signed checkpoint is verified.
+    Pass an id/time range to audit a window, or full=true to re-audit everything.
+    Returns: 'SECURE' or 'CORRUPTED' (+ throughput)
     """
-    events = db.query(Event).order_by(Event.id.asc()).all()
-    
-    if not events:
-        return {"status": "EMPTY_CHAIN"}
+    verify = partial(
+        chain_verifier.verify,
+        start_id=start_id, end_id=end_id,
+        start_time=start_time, end_time=end_time,
+        full=full,
+    )
+    return await anyio.to_thread.run_sync(verify, limiter=audit_limiter)
 
-    broken_links = []
-    
-    # Iterate through the chain
-    for i in range(len(events)):
-        current = events[i]
-        
-        # 1. Determine what the 'previous_hash' SHOULD be
-        if i == 0:
-            expected_prev = "GENESIS_BLOCK"
-        else:
-            expected_prev = events[i-1].event_hash
-            
-        # 2. Check Link Integrity
-        if current.previous_hash != expected_prev:
-            broken_links.append(f"Broken Link at ID {current.id}: Expected {expected_prev[:8]}, Got {current.previous_hash[:8]}")
-            continue
-
-        # 3. Check Data Integrity (Did someone edit the value?)
-        # Re-generate hash from raw data to see if it matches the signature
-        recalc_hash = generate_event_hash(
-            current.sensor_id, 
-            current.event_type, 
-            current.value, 
-            current.timestamp, 
-            current.previous_hash
+@router.get("/audit/blocks/verify")
+async def verify_blocks(start_height: Optional[int] = None, end_height: Optional[int] = None):
+    """
+    Verifies the sealed Merkle blocks (all, or a height range) in parallel,
+    one block per pool task, plus the chain of block headers.
+    Returns: 'SECURE' or 'CORRUPTED' (+ throughput)
+    """
+    verify = partial(chain_verifier.verify_blocks, start_height=start_height, end_height=end_height)
+    return await anyio.to_thread.run_sync(verify, limiter=audit_limiter)
+
+@router.get("/audit/proof/{event_id}")
+async def get_inclusion_proof(event_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Merkle inclusion proof for one event: its hash, the log2(block size)
+    sibling hashes up to the block's root, and the block header.
+    Re-hash: leaf = sha256(0x00 || event_hash), node = sha256(0x01 || left || right).
+    """
+    proof = await inclusion_proof(db, event_id)
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Unknown event")
+    return proof
+
+@router.get("/status/ledger")
+def get_ledger_status():
+    """Block height, chain head and events waiting for the next Merkle block"""
+    return _owner_view("ledger", event_ledger.stats)
+
+@router.post("/audit/verify/jobs")
+async def start_verify_job(
+    start_id: Optional[int] = None,
+    end_id: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    full: bool = True,
+):
+    """Starts a background audit (full re-audit by default). Poll the returned job_id."""
+    try:
+        job = audit_jobs.start(
+            start_id=start_id, end_id=end_id,
+            start_time=start_time, end_time=end_time,
+            full=full,
         )
-        
-        if recalc_hash != current.event_hash:
-            broken_links.append(f"Data Tampering at ID {current.id}: Content does not match Hash!")
+    except ConnectionRefusedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
 
-    if broken_links:
-        return {"status": "CORRUPTED", "errors": broken_links}
-    else:
-        return {"status": "SECURE", "chain_length": len(events), "message": "All Cryptographic Signatures Valid."}
+@router.get("/audit/verify/jobs/{job_id}")
+async def get_verify_job(job_id: str):
+    """Progress, throughput (events/sec) and final result of a background audit"""
+    job = audit_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown audit job")
+    return job.to_dict()
 
 # ---------------------------------------------------------
 # ADMIN ENDPOINTS (Demo Management)
 # ---------------------------------------------------------
 
+@router.post("/admin/retention/run")
+def run_retention(secret: str):
+    """Runs one retention pass now (rollup backfill, pruning, incremental VACUUM)"""
+    if secret != settings.ADMIN_SECRET:
+        raise HTTPException(status_code=403, detail="Wrong Secret")
+    return retention_engine.run_once()
+
+@router.get("/status/retention")
+def get_retention_status():
+    """Retention policy, cutoffs and what the last passes removed"""
+    return retention_engine.stats()
+
 @router.delete("/admin/reset")
 def reset_system(secret: str, db: Session = Depends(get_db)):
     """Wipes all data for the next demo. Requires secret from .env"""
@@ -145,11 +567,16 @@ def reset_system(secret: str, db: Session = Depends(get_db)):
     
     # Delete all rows in the database
     db.query(Reading).delete()
+    db.query(ReadingRollup).delete()
     db.query(Event).delete()
+    db.query(AuditCheckpoint).delete()
+    db.query(ChainAnchor).delete()
+    db.query(EventBlock).delete()
+    db.query(TransformerAging).delete()
+    db.query(Incident).delete()
     db.commit()
     
-    # Reset In-Memory State (The Digital Twin)
-    grid_state.transformer_current = 0.0
-    grid_state.smart_meters = {}
+    # Reset In-Memory State (The Digital Twin), in the ingest owner too if that is another worker
+    twin_cluster.reset_twin()
     
     return {"status": "SYSTEM_WIPED", "ready_for": "NEXT_JUDGE"}
\ No newline at end of file
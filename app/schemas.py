@@ -1,15 +1,38 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import numpy as np
+from pydantic import AfterValidator, BaseModel, Field, PlainSerializer, PlainValidator
+from typing import Annotated, Optional
 from datetime import datetime
 
+def _to_waveform(value) -> np.ndarray:
+    # One C-level conversion instead of validating every sample as a Python float
+    try:
+        samples = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("audio_waveform must be a list of numbers")
+    if samples.ndim != 1:
+        raise ValueError("audio_waveform must be a flat list of numbers")
+    return samples
+
+# JSON list in, float64 array out (and back to a list when dumped)
+Waveform = Annotated[np.ndarray, PlainValidator(_to_waveform), PlainSerializer(lambda samples: samples.tolist())]
+
+def _to_sensor_id(value: str) -> str:
+    # Sensor ids end up in file paths (columnar archive): no '.' / '..'
+    if value in (".", ".."):
+        raise ValueError("sensor_id must not be '.' or '..'")
+    return value
+
+SensorId = Annotated[str, AfterValidator(_to_sensor_id)]
+
 # Input Schema (Keep as is)
 class SensorData(BaseModel):
-    sensor_id: str
+    """Use SensorData.model_validate_json(payload_bytes): one pass, no intermediate dict."""
+    sensor_id: SensorId
     device_type: str = "TRANSFORMER" 
     temperature: float
     current: float
     vibration: float
-    audio_waveform: Optional[List[float]] = None 
+    audio_waveform: Optional[Waveform] = None 
     timestamp: datetime = Field(default_factory=datetime.now)
 
 # Output Schema (Updated)
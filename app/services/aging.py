@@ -0,0 +1,207 @@
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+from app.config import settings
+from app.models import TransformerAging
+from app.database import row_batches
+from app.services.physics import HST_GRADIENT, REFERENCE_HOTSPOT_K, HOTSPOT_RISE_C
+from app.services.registry import sensor_registry
+
+# IEEE C57.91 normal insulation life (hours) at the 110°C reference hot spot
+NORMAL_LIFE_HOURS = 180000.0
+
+# Column layout of the per-slot accumulator table
+EQA, ELAPSED, HOTSPOT, FAA, LAST_TIME, SAMPLES = range(6)
+
+
+def upsert_aging(db, rows: list):
+    """Writer row: stores the cumulative aging of every transformer (one statement per batch)."""
+    for batch in row_batches(rows):
+        stmt = insert(TransformerAging).values(batch)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["sensor_id"],
+            set_={name: stmt.excluded[name] for name in ("equivalent_aging_hours", "elapsed_hours", "hotspot_temp", "aging_factor", "updated_at")},
+        ))
+
+
+class AgingEngine:
+    """
+    Cumulative insulation aging per transformer (IEEE C57.91 clause 5):
+
+        FAA  = exp(15000/383 - 15000/(hot spot + 273))
+        FEQA = Σ FAA·Δt / Σ Δt
+        loss of life % = Σ FAA·Δt / 180000 h · 100
+
+    The MQTT thread only appends (slot, hot spot, time) to a sample buffer.
+    flush() integrates the whole buffer with one np.exp and np.add.at: each
+    sample ages its transformer for the time since that transformer's
+    previous sample (gaps longer than max_gap are not counted).
+    Reading the fleet is a flush plus array slicing, never a DB scan.
+    """
+
+    def __init__(self, registry=sensor_registry, buffer_size=4096, max_gap=300.0, persist_interval=60.0, initial_capacity=64):
+        self.registry = registry
+        self.max_gap = max_gap
+        self.persist_interval = persist_interval
+        self._last_persist = time.monotonic()
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        # A plain list: appending a tuple is far cheaper than three NumPy item stores
+        self._samples = []
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity: int):
+        self.table = np.zeros((capacity, 6), dtype=np.float64)
+        self.table[:, LAST_TIME] = np.nan
+
+    def _ensure_capacity(self, slot: int):
+        capacity = self.table.shape[0]
+        if slot < capacity:
+            return
+        # Double the storage so growth is amortized O(1) (caller holds the lock)
+        old = self.table
+        self._allocate(max(capacity * 2, slot + 1))
+        self.table[:capacity] = old
+
+    # --- 1. INGEST (MQTT thread) ---
+    def record(self, slot: int, temp_c: float, timestamp_sec: float):
+        """
+        Buffers one top-oil reading. O(1), no math.
+        Returns a writer row (callable) when the totals are due to be stored, else None.
+        """
+        with self._lock:
+            self._samples.append((slot, temp_c + HOTSPOT_RISE_C, timestamp_sec))
+            if len(self._samples) >= self.buffer_size:
+                self._integrate()
+        if self.persist_interval > 0 and time.monotonic() - self._last_persist >= self.persist_interval:
+            self._last_persist = time.monotonic()
+            return self.to_row()
+        return None
+
+    def flush(self):
+        with self._lock:
+            self._integrate()
+
+    def _integrate(self):
+        if not self._samples:
+            return
+        samples = np.array(self._samples, dtype=np.float64)
+        self._samples = []
+        n = len(samples)
+        slots = samples[:, 0].astype(np.int64)
+        self._ensure_capacity(int(slots.max()))
+
+        # Group by transformer, keeping arrival order inside each group
+        order = np.argsort(slots, kind="stable")
+        slot = slots[order]
+        hotspot = samples[order, 1]
+        ts = samples[order, 2]
+
+        first = np.ones(n, dtype=bool)
+        first[1:] = slot[1:] != slot[:-1]
+        last = np.ones(n, dtype=bool)
+        last[:-1] = first[1:]
+
+        prev = np.empty(n, dtype=np.float64)
+        prev[1:] = ts[:-1]
+        prev[first] = self.table[slot[first], LAST_TIME]
+        with np.errstate(invalid="ignore"):
+            dt = ts - prev
+        # First sample ever (NaN), clock going backwards, or the sensor was offline
+        dt[~((dt > 0) & (dt <= self.max_gap))] = 0.0
+
+        faa = np.exp(HST_GRADIENT / REFERENCE_HOTSPOT_K - HST_GRADIENT / (hotspot + 273.0))
+        np.add.at(self.table[:, EQA], slot, faa * dt / 3600.0)
+        np.add.at(self.table[:, ELAPSED], slot, dt / 3600.0)
+        np.add.at(self.table[:, SAMPLES], slot, 1.0)
+        self.table[slot[last], HOTSPOT] = hotspot[last]
+        self.table[slot[last], FAA] = faa[last]
+        self.table[slot[last], LAST_TIME] = ts[last]
+
+    # --- 2. FLEET VIEW ---
+    def fleet(self) -> dict:
+        """Column arrays for every transformer seen so far, indexed alike."""
+        self.flush()
+        with self._lock:
+            total = min(len(self.registry), self.table.shape[0])
+            seen = np.flatnonzero(self.table[:total, SAMPLES] > 0)
+            table = self.table[seen]
+        eqa, elapsed = table[:, EQA], table[:, ELAPSED]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            feqa = np.where(elapsed > 0, eqa / elapsed, table[:, FAA])
+        return {
+            "slots": seen,
+            "aging_factor": table[:, FAA],
+            "hotspot_temp": table[:, HOTSPOT],
+            "equivalent_aging_hours": eqa,
+            "elapsed_hours": elapsed,
+            "feqa": feqa,
+            "loss_of_life_pct": eqa / NORMAL_LIFE_HOURS * 100.0,
+            "last_time": table[:, LAST_TIME],
+        }
+
+    def report(self, sensor_id: str = None, limit: int = None) -> list:
+        """Per-transformer aging, most worn first (or just one sensor). Only the returned rows become dicts."""
+        cols = self.fleet()
+        if sensor_id is not None:
+            state = self.registry.peek(sensor_id)
+            picked = np.flatnonzero(cols["slots"] == state.slot) if state is not None else []
+        else:
+            picked = np.argsort(-cols["loss_of_life_pct"], kind="stable")[:limit]
+        rows = []
+        for i in picked:
+            rows.append({
+                "sensor_id": self.registry.by_slot(int(cols["slots"][i])).sensor_id,
+                "hotspot_temp": round(float(cols["hotspot_temp"][i]), 2),
+                "aging_factor": round(float(cols["aging_factor"][i]), 4),
+                "feqa": round(float(cols["feqa"][i]), 4),
+                "equivalent_aging_hours": round(float(cols["equivalent_aging_hours"][i]), 6),
+                "elapsed_hours": round(float(cols["elapsed_hours"][i]), 6),
+                "loss_of_life_pct": round(float(cols["loss_of_life_pct"][i]), 8),
+                "last_update": None if np.isnan(cols["last_time"][i]) else datetime.fromtimestamp(float(cols["last_time"][i])).isoformat(),
+            })
+        return rows
+
+    # --- 3. PERSISTENCE (the totals outlive restarts) ---
+    def to_row(self):
+        """Writer row (callable) storing the current totals, or None if nothing was recorded."""
+        cols = self.fleet()
+        if not len(cols["slots"]):
+            return None
+        now = datetime.now()
+        rows = [
+            {
+                "sensor_id": self.registry.by_slot(int(slot)).sensor_id,
+                "equivalent_aging_hours": float(cols["equivalent_aging_hours"][i]),
+                "elapsed_hours": float(cols["elapsed_hours"][i]),
+                "hotspot_temp": float(cols["hotspot_temp"][i]),
+                "aging_factor": float(cols["aging_factor"][i]),
+                "updated_at": now,
+            }
+            for i, slot in enumerate(cols["slots"].tolist())
+        ]
+        return lambda db: upsert_aging(db, rows)
+
+    def prime(self, db):
+        """Continues the totals stored by the previous run."""
+        stored = db.query(TransformerAging).all()
+        with self._lock:
+            for row in stored:
+                slot = self.registry.get(row.sensor_id).slot
+                self._ensure_capacity(slot)
+                # LAST_TIME stays NaN: aging resumes with the next reading, the downtime is not counted
+                self.table[slot] = (
+                    row.equivalent_aging_hours, row.elapsed_hours, row.hotspot_temp or 0.0,
+                    row.aging_factor or 0.0, np.nan, 1.0,
+                )
+
+    def reset(self):
+        with self._lock:
+            self._samples = []
+            self._allocate(self.table.shape[0])
+
+
+# Global Instance
+aging_engine = AgingEngine(max_gap=settings.AGING_MAX_GAP_SEC, persist_interval=settings.AGING_PERSIST_SEC)
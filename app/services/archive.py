@@ -0,0 +1,358 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Reading, Event
+from app.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process lock is all we get
+    fcntl = None
+
+log = get_logger()
+
+# Column -> numpy dtype ("U" = fixed-width unicode, sized per chunk).
+# sensor_id is not stored per row: it is the partition key.
+SCHEMAS = {
+    "readings": (Reading, {
+        "id": "int64",
+        "timestamp": "datetime64[us]",
+        "temperature": "float64",
+        "current": "float64",
+        "vibration": "float64",
+        "predicted_failure_min": "float64",   # NaN = no prediction
+    }),
+    "events": (Event, {
+        "id": "int64",
+        "timestamp": "datetime64[us]",
+        "event_type": "U",
+        "value": "float64",
+        "message": "U",
+        "previous_hash": "U",
+        "event_hash": "U",
+    }),
+}
+
+
+def _sensor_folder(sensor_id: str) -> str:
+    """
+    Folder of one sensor's chunks: readable prefix + hash of the raw id, so ids
+    that sanitize alike ('TX/1', 'TX_1') never share a folder. No dots, so
+    '.' / '..' can never leave the kind's directory.
+    """
+    prefix = re.sub(r"[^A-Za-z0-9_-]", "_", sensor_id)[:48]
+    digest = hashlib.sha256(sensor_id.encode()).hexdigest()[:12]
+    return f"{prefix}-{digest}"
+
+
+def _column(values: list, dtype: str) -> np.ndarray:
+    if dtype == "U":
+        return np.array(["" if v is None else v for v in values], dtype=str)
+    if dtype == "float64":
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(values, dtype=dtype)
+
+
+class ColumnarArchive:
+    """
+    Append-only export of readings / events into .npy columns:
+
+        EXPORT_DIR/manifest.json
+        EXPORT_DIR/readings/<sensor>-<hash>/<YYYY-MM-DD>/<column>.npy
+        EXPORT_DIR/events/<sensor>-<hash>/<YYYY-MM-DD>/<column>.npy
+
+    Every run continues after the manifest's last exported id (keyset scan,
+    never OFFSET), so it only touches new rows. There is one chunk per
+    (sensor, day): new rows are appended to it, so the chunk count and the
+    manifest grow with sensor-days, not with export runs. Chunks are plain
+    .npy files, which np.load(mmap_mode="r") maps without reading them, so
+    months of history load without the live database.
+
+    A chunk's manifest "rows" is the committed length: rows past it (written
+    before a crash, or by a run still in progress) are ignored by readers and
+    overwritten by the next append.
+    """
+
+    def __init__(self, root="exports", batch_rows=50000, checkpoint_sec=30.0):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.checkpoint_sec = checkpoint_sec
+        self._lock = threading.Lock()
+        self._cached = None          # ((mtime_ns, size), manifest) for the read side
+        self.last_run = None
+
+    # --- MANIFEST ---
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 1, **{kind: {"last_id": 0, "rows": 0, "chunks": []} for kind in SCHEMAS}}
+
+    def manifest(self) -> dict:
+        """The committed manifest (read-only: parsed again only after the file changed)."""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return self._read_manifest()
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._cached
+        if cached is None or cached[0] != key:
+            cached = self._cached = (key, self._read_manifest())
+        return cached[1]
+
+    def _save_manifest(self, manifest: dict):
+        # Write + rename, so a reader never sees half a manifest
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    @contextmanager
+    def _exclusive(self):
+        """One exporter at a time, across threads and uvicorn workers."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, ".lock"), "w") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --- 1. EXPORT (incremental) ---
+    def export(self, db=None) -> dict:
+        """Exports every row newer than the manifest's last_id. Returns rows/chunks written per kind."""
+        started = time.perf_counter()
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            with self._exclusive():
+                manifest = self._read_manifest()
+                summary = {kind: self._export_kind(db, kind, manifest) for kind in SCHEMAS}
+        finally:
+            if own_session:
+                db.close()
+        self.last_run = {**summary, "elapsed_sec": round(time.perf_counter() - started, 3), "at": datetime.now().isoformat()}
+        if any(s["rows"] for s in summary.values()):
+            log.info(f"🗄️ Exported {summary['readings']['rows']} readings / {summary['events']['rows']} events to {self.root}")
+        return self.last_run
+
+    def _export_kind(self, db, kind: str, manifest: dict) -> dict:
+        model, schema = SCHEMAS[kind]
+        section = manifest[kind]
+        columns = [getattr(model, name) for name in schema]
+        written = {"rows": 0, "chunks": 0}
+        # (sensor, day) -> open chunk. Older exports may hold several per key: append to the newest
+        index = {(c["sensor_id"], c["day"]): c for c in section["chunks"]}
+        checkpoint = time.monotonic()
+
+        while True:
+            batch = (
+                db.query(model.sensor_id, *columns)
+                .filter(model.id > section["last_id"])
+                .order_by(model.id)
+                .limit(self.batch_rows)
+                .all()
+            )
+            if not batch:
+                if written["rows"]:
+                    self._save_manifest(manifest)
+                return written
+            for chunk in self._write_batch(kind, schema, batch, index):
+                section["chunks"].append(chunk)
+                written["chunks"] += 1
+            section["last_id"] = batch[-1][1]
+            section["rows"] += len(batch)
+            written["rows"] += len(batch)
+            # Checkpoint now and then: a crash costs at most checkpoint_sec of rework
+            if time.monotonic() - checkpoint >= self.checkpoint_sec:
+                self._save_manifest(manifest)
+                checkpoint = time.monotonic()
+
+    def _append(self, folder: str, name: str, committed: int, values: np.ndarray):
+        """Rewrites one column as its committed rows + 'values' (write + rename)."""
+        target = os.path.join(folder, f"{name}.npy")
+        if committed:
+            values = np.concatenate([np.load(target, mmap_mode="r")[:committed], values])
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp, target)
+
+    def _write_batch(self, kind: str, schema: dict, batch: list, index: dict) -> list:
+        """
+        Splits one id-ordered batch by (sensor, day) and appends each group to
+        its chunk. Returns the chunks created by this batch (the others are
+        updated in place).
+        """
+        sensors = np.array(["" if row[0] is None else row[0] for row in batch], dtype=str)
+        stamps = _column([row[2] for row in batch], "datetime64[us]")
+        sensor_codes, sensor_index = np.unique(sensors, return_inverse=True)
+        days = stamps.astype("datetime64[D]").astype(np.int64)
+        # Stable sort keeps id order inside each (sensor, day) group
+        order = np.lexsort((days, sensor_index))
+        keys = np.stack([sensor_index[order], days[order]], axis=1)
+        bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+
+        raw = {name: [row[i + 1] for row in batch] for i, name in enumerate(schema)}
+        created = []
+        for group in np.split(order, bounds):
+            sensor_id = str(sensor_codes[sensor_index[group[0]]])
+            day = str(stamps[group[0]].astype("datetime64[D]"))
+            first_id, last_id = int(batch[group[0]][1]), int(batch[group[-1]][1])
+            chunk_stamps = stamps[group]
+            start, end = str(chunk_stamps.min()), str(chunk_stamps.max())
+
+            path = os.path.join(kind, _sensor_folder(sensor_id), day)
+            chunk = index.get((sensor_id, day))
+            # Chunks from older exports may sit in a folder shared with another id: start a new one
+            if chunk is None or chunk["path"] != path:
+                chunk = index[(sensor_id, day)] = {
+                    "sensor_id": sensor_id,
+                    "day": day,
+                    "path": path,
+                    "rows": 0,
+                    "first_id": first_id,
+                    "last_id": last_id,
+                    "start": start,
+                    "end": end,
+                }
+                created.append(chunk)
+            folder = os.path.join(self.root, chunk["path"])
+            os.makedirs(folder, exist_ok=True)
+            for name, dtype in schema.items():
+                values = [raw[name][i] for i in group]
+                self._append(folder, name, chunk["rows"], _column(values, dtype))
+            chunk["rows"] += len(group)
+            chunk["last_id"] = last_id
+            chunk["start"] = min(chunk["start"], start)
+            chunk["end"] = max(chunk["end"], end)
+        return created
+
+    # --- 2. READ (memory-mapped) ---
+    def chunks(self, kind="readings", sensor_id=None, start: datetime = None, end: datetime = None, manifest=None) -> list:
+        """Manifest entries overlapping the filters, in id order."""
+        manifest = manifest or self.manifest()
+        # Same text format as the manifest, so plain string comparison orders correctly
+        start_s = str(np.datetime64(start, "us")) if start else None
+        end_s = str(np.datetime64(end, "us")) if end else None
+        selected = []
+        for chunk in manifest[kind]["chunks"]:
+            if sensor_id is not None and chunk["sensor_id"] != sensor_id:
+                continue
+            if start_s and chunk["end"] < start_s:
+                continue
+            if end_s and chunk["start"] > end_s:
+                continue
+            selected.append(chunk)
+        selected.sort(key=lambda c: c["first_id"])
+        return selected
+
+    def load(self, kind="readings", sensor_id=None, start: datetime = None, end: datetime = None, columns=None) -> dict:
+        """
+        {column: ndarray} for the matching rows, without touching SQLite.
+        Chunks are mmap'd; only a multi-chunk result (or a time filter) copies.
+        Without 'sensor_id' a 'sensor_id' column is added.
+        """
+        schema = SCHEMAS[kind][1]
+        names = list(columns or schema)
+        selected = self.chunks(kind, sensor_id, start, end)
+        if not selected:
+            empty = {name: np.empty(0, dtype=str if schema[name] == "U" else schema[name]) for name in names}
+            if sensor_id is None:
+                empty["sensor_id"] = np.empty(0, dtype=str)
+            return empty
+
+        parts = {name: [] for name in names}
+        stamps, sensors = [], []
+        for chunk in selected:
+            folder = os.path.join(self.root, chunk["path"])
+            rows = chunk["rows"]
+            for name in names:
+                parts[name].append(np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")[:rows])
+            if start or end:
+                stamps.append(np.load(os.path.join(folder, "timestamp.npy"), mmap_mode="r")[:rows])
+            if sensor_id is None:
+                sensors.append(np.full(chunk["rows"], chunk["sensor_id"]))
+
+        result = {name: arrays[0] if len(arrays) == 1 else np.concatenate(arrays) for name, arrays in parts.items()}
+        if sensor_id is None:
+            result["sensor_id"] = np.concatenate(sensors)
+        if start or end:
+            ts = np.concatenate(stamps)
+            mask = np.ones(len(ts), dtype=bool)
+            if start:
+                mask &= ts >= np.datetime64(start, "us")
+            if end:
+                mask &= ts <= np.datetime64(end, "us")
+            result = {name: values[mask] for name, values in result.items()}
+        return result
+
+    # --- 3. DOWNLOAD (streaming tar) ---
+    def stream_tar(self, kind="readings", sensor_id=None, start: datetime = None, end: datetime = None):
+        """
+        Yields an uncompressed tar of the matching chunks plus their manifest,
+        one file at a time (.npy is already binary, and stays mmap-able once
+        unpacked).
+        """
+        manifest = self.manifest()
+        selected = self.chunks(kind, sensor_id, start, end, manifest=manifest)
+        subset = {
+            "version": manifest["version"],
+            kind: {"last_id": manifest[kind]["last_id"], "rows": sum(c["rows"] for c in selected), "chunks": selected},
+        }
+
+        spool = io.BytesIO()
+        with tarfile.open(fileobj=spool, mode="w|") as tar:
+            body = json.dumps(subset, indent=1).encode()
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(body)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(body))
+            for chunk in selected:
+                for name in SCHEMAS[kind][1]:
+                    relative = os.path.join(chunk["path"], f"{name}.npy")
+                    # Committed rows only: an export may be appending to this chunk
+                    column = io.BytesIO()
+                    np.save(column, np.load(os.path.join(self.root, relative), mmap_mode="r")[:chunk["rows"]])
+                    info = tarfile.TarInfo(relative)
+                    info.size = column.tell()
+                    info.mtime = int(time.time())
+                    column.seek(0)
+                    tar.addfile(info, column)
+                    yield spool.getvalue()
+                    spool.seek(0)
+                    spool.truncate()
+        yield spool.getvalue()
+
+    def stats(self) -> dict:
+        manifest = self.manifest()
+        return {
+            "root": self.root,
+            **{f"{kind}_last_id": manifest[kind]["last_id"] for kind in SCHEMAS},
+            **{f"{kind}_rows": manifest[kind]["rows"] for kind in SCHEMAS},
+            **{f"{kind}_chunks": len(manifest[kind]["chunks"]) for kind in SCHEMAS},
+            "last_run": self.last_run,
+        }
+
+
+# Global Instance
+archive = ColumnarArchive(root=settings.EXPORT_DIR, batch_rows=settings.EXPORT_BATCH_ROWS)
@@ -1,10 +1,77 @@
+import threading
+import time
+from functools import lru_cache
 import numpy as np
-from scipy.fft import fft
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft
+from app.config import settings
+
+# Waveforms shorter than this are ignored (score 0.0)
+MIN_SAMPLES = 10
+
+
+@lru_cache(maxsize=32)
+def _window(size: int, dtype) -> np.ndarray:
+    """Hann window, built once per frame size."""
+    return np.hanning(size).astype(dtype)
+
+
+def _scores(magnitudes: np.ndarray) -> np.ndarray:
+    """
+    Distortion score per row of a magnitude spectrum (already cut to N//2 bins).
+    Same formula as the original single-waveform analyzer.
+    """
+    # Reduce in float64 so float32 spectra still round like the original
+    peak_energy = magnitudes.max(axis=-1).astype(np.float64)
+    total_energy = magnitudes.sum(axis=-1, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        noise_ratio = 1.0 - (peak_energy / total_energy)
+    scores = np.round(noise_ratio * 10, 2)
+    return np.where(total_energy == 0, 0.0, scores)
+
 
 class AudioAnalyzer:
-    def __init__(self, sample_rate=1000):
+    """
+    FFT health check for transformer hum.
+
+    - analyze_health(): one waveform, bit-for-bit compatible score (float64).
+    - analyze_batch(): many sensors at once, one 2-D real FFT per waveform length
+      over a reused buffer (float32 by default).
+    - analyze_frames(): opt-in, long captures split into overlapping, windowed frames.
+    - submit() / drain(): the ingest side: packets are micro-batched into a float64
+      analyze_batch() over the whole capture, so the scores equal analyze_health().
+
+    Real FFTs only compute the non-negative half of the spectrum, which is all
+    the score ever used. scipy.fft caches its plans per size, so repeated
+    lengths skip the planning step.
+    """
+
+    def __init__(self, sample_rate=1000, frame_size=256, hop=128, dtype=np.float32, batch_size=64, batch_wait=0.05):
         # We assume the ESP32 sends 1000 data points per second (1kHz)
         self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.hop = hop
+        self.dtype = dtype
+
+        # Preallocated input buffers per (waveform length, dtype), grown on demand
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+        # Ingest micro-batching: waveforms wait here until the batch is full or batch_wait passed
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._pending = []          # (sensor_id, waveform, timestamp, epoch seconds)
+        self._pending_lock = threading.Lock()
+        self._last_drain = 0.0
+        self.batches = 0
+        self.waveforms = 0
+
+    def _buffer(self, rows: int, length: int, dtype) -> np.ndarray:
+        buf = self._buffers.get((length, dtype))
+        if buf is None or buf.shape[0] < rows:
+            buf = np.empty((max(rows, 2 * (buf.shape[0] if buf is not None else 0)), length), dtype=dtype)
+            self._buffers[(length, dtype)] = buf
+        return buf[:rows]
 
     def analyze_health(self, waveform):
         """
@@ -12,39 +79,96 @@ class AudioAnalyzer:
         0.0 = Pure Sine Wave (Healthy)
         1.0+ = Noisy/Distorted (Critical)
         """
-        if not waveform or len(waveform) < 10:
+        if waveform is None or len(waveform) < MIN_SAMPLES:
             return 0.0
 
-        # 1. Convert List to Numpy Array
-        data = np.array(waveform)
+        # 1. No copy if the decoder already handed us a float64 array
+        data = np.asarray(waveform, dtype=np.float64)
         N = len(data)
 
-        # 2. Perform FFT (The Magic)
-        # This converts "Time" data into "Frequency" data
-        fft_values = fft(data)
-        
-        # Get the magnitude of each frequency
-        magnitudes = np.abs(fft_values)[:N//2]
-        
-        # 3. Analyze the Spectrum
-        # Find the loudest frequency (Peak)
-        peak_index = np.argmax(magnitudes)
-        
-        # Calculate "Total Energy" vs "Peak Energy"
-        total_energy = np.sum(magnitudes)
-        peak_energy = magnitudes[peak_index]
-        
-        # If the Peak (50Hz) accounts for most of the energy, it's clean.
-        # If there is energy spread everywhere (Noise), this ratio drops.
-        
-        if total_energy == 0: return 0.0
-        
-        # Noise Ratio: How much sound is NOT the main hum?
-        noise_ratio = 1.0 - (peak_energy / total_energy)
-        
-        # Make the score easier to read (0 to 10 scale)
-        distortion_score = round(noise_ratio * 10, 2)
-        
-        return distortion_score
+        # 2. Real FFT: the first N//2 bins equal the old complex FFT's
+        magnitudes = np.abs(rfft(data))[:N//2]
+
+        # 3. Noise Ratio: How much sound is NOT the main hum? (0 to 10 scale)
+        return float(_scores(magnitudes))
+
+    def analyze_batch(self, waveforms: list, dtype=None) -> np.ndarray:
+        """
+        Scores many waveforms (e.g. one per sensor) in as few FFT calls as possible.
+        Waveforms of equal length share one 2-D transform. Returns scores in input order.
+        dtype=np.float64 gives exactly the analyze_health() scores (default: self.dtype).
+        """
+        dtype = np.dtype(dtype or self.dtype)
+        scores = np.zeros(len(waveforms), dtype=np.float64)
+
+        groups = {}
+        for i, waveform in enumerate(waveforms):
+            if waveform is not None and len(waveform) >= MIN_SAMPLES:
+                groups.setdefault(len(waveform), []).append(i)
+
+        with self._lock:
+            for length, indices in groups.items():
+                block = self._buffer(len(indices), length, dtype)
+                for row, i in enumerate(indices):
+                    block[row] = waveforms[i]
+                # The buffer is scratch space, so the FFT may overwrite it
+                magnitudes = np.abs(rfft(block, axis=1, overwrite_x=True))[:, :length // 2]
+                scores[indices] = _scores(magnitudes)
+        return scores
+
+    def submit(self, sensor_id: str, waveform, timestamp, time_sec: float) -> list:
+        """
+        MQTT thread: queues one packet's waveform and returns the scores that
+        are ready, [(sensor_id, timestamp, time_sec, score)]. A trickle of
+        packets (one per batch_wait or less) is scored at once; under load
+        packets collect for up to batch_wait and share one analyze_batch().
+        """
+        with self._pending_lock:
+            self._pending.append((sensor_id, waveform, timestamp, time_sec))
+            full = len(self._pending) >= self.batch_size
+        now = time.monotonic()
+        if full or now - self._last_drain >= self.batch_wait:
+            return self.drain(now)
+        return []
+
+    def due(self, now: float = None) -> bool:
+        """True when packets have waited batch_wait without a drain (traffic stopped)."""
+        now = now if now is not None else time.monotonic()
+        return bool(self._pending) and now - self._last_drain >= self.batch_wait
+
+    def drain(self, now: float = None) -> list:
+        """Scores every queued packet now, [(sensor_id, timestamp, time_sec, score)]."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            self._last_drain = now if now is not None else time.monotonic()
+        if not pending:
+            return []
+        # float64 over the whole capture: the same score analyze_health() gives
+        scores = self.analyze_batch([p[1] for p in pending], dtype=np.float64)
+        self.batches += 1
+        self.waveforms += len(pending)
+        return [(sensor_id, ts, time_sec, float(score)) for (sensor_id, _, ts, time_sec), score in zip(pending, scores)]
+
+    def analyze_frames(self, signal, frame_size: int = None, hop: int = None, window: bool = True) -> np.ndarray:
+        """
+        Splits a long capture into overlapping frames (frame_size, step hop),
+        applies a Hann window and returns one score per frame. Not used by
+        ingest: frame scores are not comparable with the whole-capture score.
+        """
+        frame_size = frame_size or self.frame_size
+        hop = hop or self.hop
+        data = np.asarray(signal, dtype=self.dtype)
+        if len(data) < frame_size:
+            return np.array([self.analyze_health(data)]) if len(data) >= MIN_SAMPLES else np.zeros(0)
+
+        # Strided view: no copy until the window multiply
+        frames = sliding_window_view(data, frame_size)[::hop]
+        if window:
+            frames = frames * _window(frame_size, self.dtype)
+        magnitudes = np.abs(rfft(frames, axis=1, overwrite_x=window))[:, :frame_size // 2]
+        return _scores(magnitudes)
 
-audio_engine = AudioAnalyzer()
\ No newline at end of file
+audio_engine = AudioAnalyzer(
+    batch_size=settings.AUDIO_BATCH_SIZE,
+    batch_wait=settings.AUDIO_BATCH_WAIT_SEC,
+)
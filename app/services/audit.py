@@ -0,0 +1,479 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Event, EventBlock, AuditCheckpoint, ChainAnchor
+from app.services.crypto import (
+    generate_block_hash,
+    generate_event_hash,
+    hash_event_rows,
+    seal_event_blocks,
+    sign_anchor,
+    sign_checkpoint,
+    verify_anchor_signature,
+    verify_checkpoint_signature,
+)
+from app.logger import get_logger
+
+log = get_logger()
+
+GENESIS_HASH = "GENESIS_BLOCK"
+MAX_REPORTED_ERRORS = 100
+
+# Only the columns we need. Plain tuples are far lighter than ORM objects.
+_COLUMNS = (
+    Event.id, Event.sensor_id, Event.event_type, Event.value,
+    Event.timestamp, Event.previous_hash, Event.event_hash,
+)
+
+
+def _short(value) -> str:
+    return str(value)[:8] if value else "NONE"
+
+
+class ChainVerifier:
+    """
+    Streams the 'events' chain in id order and re-checks links and hashes.
+
+    - Incremental: starts after the newest valid signed checkpoint.
+    - Ranged: verifies only an explicit id or time window.
+    - Full: re-audits from GENESIS, spreading SHA-256 work over a process pool.
+
+    Once retention has pruned the head of the chain, GENESIS is replaced by
+    the newest signed anchor (the last pruned event's hash).
+    """
+
+    def __init__(self, session_factory=SessionLocal, chunk_size=5000, workers=0):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def signing_key(self) -> str:
+        return settings.AUDIT_SIGNING_KEY or settings.ADMIN_SECRET
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # 'spawn' so children never inherit the MQTT / writer threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    # --- 1. CHECKPOINTS ---
+    def latest_checkpoint(self, db):
+        """Newest checkpoint whose signature is valid (forged ones are ignored)."""
+        checkpoints = db.query(AuditCheckpoint).order_by(AuditCheckpoint.id.desc()).limit(10).all()
+        for cp in checkpoints:
+            if verify_checkpoint_signature(self.signing_key, cp.last_event_id, cp.last_event_hash, cp.events_verified, cp.signature):
+                return cp
+            log.warning(f"⚠️ Ignoring audit checkpoint {cp.id}: bad signature")
+        return None
+
+    def latest_anchor(self, db):
+        """Newest chain anchor with a valid signature, or None if nothing was pruned."""
+        anchors = db.query(ChainAnchor).order_by(ChainAnchor.id.desc()).limit(10).all()
+        for anchor in anchors:
+            if verify_anchor_signature(self.signing_key, anchor.last_event_id, anchor.last_event_hash, anchor.events_pruned, anchor.signature):
+                return anchor
+            log.warning(f"⚠️ Ignoring chain anchor {anchor.id}: bad signature")
+        return None
+
+    def add_anchor(self, db, last_event_id, last_event_hash, events_pruned):
+        """Called by retention in the same transaction that deletes the rows."""
+        db.add(ChainAnchor(
+            last_event_id=last_event_id,
+            last_event_hash=last_event_hash,
+            events_pruned=events_pruned,
+            signature=sign_anchor(self.signing_key, last_event_id, last_event_hash, events_pruned),
+        ))
+
+    def _save_checkpoint(self, db, last_event_id, last_event_hash, events_verified):
+        db.add(AuditCheckpoint(
+            last_event_id=last_event_id,
+            last_event_hash=last_event_hash,
+            events_verified=events_verified,
+            signature=sign_checkpoint(self.signing_key, last_event_id, last_event_hash, events_verified),
+        ))
+        db.commit()
+
+    # --- 2. MAIN ENTRY POINT ---
+    def verify(self, start_id=None, end_id=None, start_time=None, end_time=None, full=False, progress=None) -> dict:
+        """
+        Verifies a slice of the chain. With no range and full=False, only the
+        tail after the last checkpoint is checked and a new checkpoint is saved.
+        'progress' is called as progress(events_done, events_total).
+        """
+        ranged = any(v is not None for v in (start_id, end_id, start_time, end_time))
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            base_count = 0
+            checkpoint = None
+            after_id = 0
+            expected_prev = GENESIS_HASH
+
+            anchor = self.latest_anchor(db)
+            if anchor is not None and not ranged:
+                # Pruned rows are gone: the chain now starts at the anchor
+                after_id = anchor.last_event_id
+                expected_prev = anchor.last_event_hash
+                base_count = anchor.events_pruned
+
+            if ranged:
+                # Time windows become id windows so the chain stays contiguous
+                window = self._resolve_time_range(db, start_id, end_id, start_time, end_time)
+                if window is None:
+                    return {"status": "EMPTY_RANGE", "chain_length": 0, "mode": "RANGE"}
+                start_id, end_id = window
+                after_id, expected_prev = self._range_start(db, start_id)
+            elif not full:
+                checkpoint = self.latest_checkpoint(db)
+                if checkpoint is not None and checkpoint.last_event_id >= after_id:
+                    after_id = checkpoint.last_event_id
+                    expected_prev = checkpoint.last_event_hash
+                    base_count = checkpoint.events_verified
+
+            query = db.query(*_COLUMNS).filter(Event.id > after_id)
+            if end_id is not None:
+                query = query.filter(Event.id <= end_id)
+
+            total = query.count()
+            result = self._scan(query, after_id, expected_prev, total, parallel=full, progress=progress)
+            elapsed = time.perf_counter() - started
+
+            chain_length = base_count + result["verified"]
+            if chain_length == 0 and not ranged:
+                return {"status": "EMPTY_CHAIN"}
+
+            # Only an unbounded, clean pass may move the checkpoint forward
+            if not ranged and not result["errors"] and result["last_id"] is not None:
+                self._save_checkpoint(db, result["last_id"], result["last_hash"], chain_length)
+
+            response = {
+                "status": "CORRUPTED" if result["errors"] else "SECURE",
+                "chain_length": chain_length,
+                "verified_now": result["verified"],
+                "from_id": result["first_id"],
+                "to_id": result["last_id"],
+                "resumed_from_checkpoint": checkpoint.last_event_id if checkpoint and after_id == checkpoint.last_event_id else None,
+                "anchored_at": anchor.last_event_id if anchor else None,
+                "mode": "RANGE" if ranged else ("FULL" if full else "INCREMENTAL"),
+                "elapsed_sec": round(elapsed, 3),
+                "events_per_sec": round(result["verified"] / elapsed, 1) if elapsed > 0 else None,
+            }
+            if result["errors"]:
+                response["errors"] = result["errors"]
+                response["error_count"] = result["error_count"]
+            else:
+                response["message"] = "All Cryptographic Signatures Valid."
+            return response
+        finally:
+            db.close()
+
+    def _resolve_time_range(self, db, start_id, end_id, start_time, end_time):
+        """
+        Narrows (start_id, end_id) to the first/last event inside the time window.
+        Returns None if no event falls inside it.
+        """
+        if start_time is not None:
+            first = db.query(Event.id).filter(Event.timestamp >= start_time).order_by(Event.id.asc()).first()
+            if first is None:
+                return None
+            start_id = max(start_id or 0, first.id)
+        if end_time is not None:
+            last = db.query(Event.id).filter(Event.timestamp <= end_time).order_by(Event.id.desc()).first()
+            if last is None:
+                return None
+            end_id = last.id if end_id is None else min(end_id, last.id)
+        return start_id, end_id
+
+    def _range_start(self, db, start_id):
+        """Finds the row before the window so its hash is the expected first link."""
+        prev = None
+        if start_id is not None:
+            prev = db.query(Event.id, Event.event_hash).filter(Event.id < start_id).order_by(Event.id.desc()).first()
+        if prev is not None:
+            return prev.id, prev.event_hash
+        # Window starts at the head of the chain: GENESIS, or the anchor after pruning
+        anchor = self.latest_anchor(db)
+        if anchor is not None:
+            return anchor.last_event_id, anchor.last_event_hash
+        return 0, GENESIS_HASH
+
+    # --- 3. STREAMING SCAN ---
+    def _chunks(self, query, after_id):
+        """Keyset pagination on the primary key: constant memory, no OFFSET."""
+        last_id = after_id
+        while True:
+            rows = query.filter(Event.id > last_id).order_by(Event.id.asc()).limit(self.chunk_size).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    def _scan(self, query, after_id, expected_prev, total, parallel=False, progress=None) -> dict:
+        state = {
+            "verified": 0, "first_id": None, "last_id": None, "last_hash": None,
+            "errors": [], "error_count": 0, "expected_prev": expected_prev,
+        }
+
+        if parallel and total > self.chunk_size:
+            # Keep a few chunks in flight so DB reads overlap with hashing
+            pool = self._get_pool()
+            in_flight = deque()
+            for rows in self._chunks(query, after_id):
+                in_flight.append((rows, pool.submit(hash_event_rows, [r[1:6] for r in rows])))
+                if len(in_flight) >= self.workers * 2:
+                    chunk, future = in_flight.popleft()
+                    self._check(chunk, future.result(), state, progress, total)
+            while in_flight:
+                chunk, future = in_flight.popleft()
+                self._check(chunk, future.result(), state, progress, total)
+        else:
+            for rows in self._chunks(query, after_id):
+                self._check(rows, [generate_event_hash(*r[1:6]) for r in rows], state, progress, total)
+        return state
+
+    def _check(self, rows, hashes, state, progress, total):
+        """Link + content checks for one chunk. Hashes are precomputed."""
+        expected_prev = state["expected_prev"]
+        for row, recalc_hash in zip(rows, hashes):
+            # 1. Check Link Integrity
+            if row.previous_hash != expected_prev:
+                self._error(state, f"Broken Link at ID {row.id}: Expected {_short(expected_prev)}, Got {_short(row.previous_hash)}")
+            # 2. Check Data Integrity (Did someone edit the value?)
+            elif recalc_hash != row.event_hash:
+                self._error(state, f"Data Tampering at ID {row.id}: Content does not match Hash!")
+            expected_prev = row.event_hash
+
+        state["expected_prev"] = expected_prev
+        if state["first_id"] is None:
+            state["first_id"] = rows[0].id
+        state["last_id"] = rows[-1].id
+        state["last_hash"] = rows[-1].event_hash
+        state["verified"] += len(rows)
+        if progress:
+            progress(state["verified"], total)
+
+    def _error(self, state, message):
+        state["error_count"] += 1
+        if len(state["errors"]) < MAX_REPORTED_ERRORS:
+            state["errors"].append(message)
+
+    # --- 4. MERKLE BLOCKS ---
+    def verify_blocks(self, start_height=None, end_height=None, progress=None) -> dict:
+        """
+        Verifies sealed blocks independently of each other: every block's
+        events are re-hashed and its Merkle root rebuilt in the process pool,
+        while this thread only checks the (tiny) header chain.
+        'progress' is called as progress(blocks_done, blocks_total).
+        """
+        started = time.perf_counter()
+        state = {"errors": [], "error_count": 0}
+        db = self.session_factory()
+        try:
+            query = db.query(EventBlock)
+            if start_height is not None:
+                query = query.filter(EventBlock.id >= start_height)
+            if end_height is not None:
+                query = query.filter(EventBlock.id <= end_height)
+            blocks = query.order_by(EventBlock.id.asc()).all()
+            if not blocks:
+                return {"status": "EMPTY_RANGE", "blocks_verified": 0, "mode": "BLOCKS"}
+
+            # 1. Header chain: each block commits to its root and to the block before it
+            prev = db.query(EventBlock.block_hash).filter(EventBlock.id == blocks[0].id - 1).scalar()
+            expected_prev = prev or GENESIS_HASH
+            for block in blocks:
+                if block.previous_block_hash != expected_prev:
+                    self._error(state, f"Broken Block Link at height {block.id}")
+                header = generate_block_hash(block.id, block.first_event_id, block.last_event_id, block.merkle_root, block.previous_block_hash)
+                if header != block.block_hash:
+                    self._error(state, f"Forged Block Header at height {block.id}")
+                expected_prev = block.block_hash
+
+            # 2. Contents: blocks are independent, so they are hashed in parallel.
+            # One pool task = as many whole blocks as fit in AUDIT_CHUNK_SIZE events.
+            anchor = self.latest_anchor(db)
+            pruned_upto = anchor.last_event_id if anchor else 0
+            live = [b for b in blocks if b.first_event_id > pruned_upto]
+            pruned = len(blocks) - len(live)   # Retention removed (part of) them: the anchor vouches for those
+            groups, group = [], []
+            for block in live:
+                group.append(block)
+                if sum(b.event_count for b in group) >= self.chunk_size:
+                    groups.append(group)
+                    group = []
+            if group:
+                groups.append(group)
+
+            pool = self._get_pool() if len(groups) > 1 else None
+            in_flight = deque()
+            checked = events = 0
+            for group in groups:
+                per_block = self._block_rows(db, group)
+                payload = [[r[1:6] for r in rows] for rows in per_block]
+                in_flight.append((group, per_block, pool.submit(seal_event_blocks, payload) if pool else seal_event_blocks(payload)))
+                if len(in_flight) >= self.workers * 2 or pool is None:
+                    checked, events = self._check_blocks(*in_flight.popleft(), state, checked, events)
+                    if progress:
+                        progress(checked + pruned, len(blocks))
+            while in_flight:
+                checked, events = self._check_blocks(*in_flight.popleft(), state, checked, events)
+                if progress:
+                    progress(checked + pruned, len(blocks))
+
+            elapsed = time.perf_counter() - started
+            response = {
+                "status": "CORRUPTED" if state["errors"] else "SECURE",
+                "mode": "BLOCKS",
+                "from_height": blocks[0].id,
+                "to_height": blocks[-1].id,
+                "blocks_verified": checked,
+                "blocks_pruned": pruned,
+                "events_verified": events,
+                "elapsed_sec": round(elapsed, 3),
+                "events_per_sec": round(events / elapsed, 1) if elapsed > 0 else None,
+            }
+            if state["errors"]:
+                response["errors"] = state["errors"]
+                response["error_count"] = state["error_count"]
+            else:
+                response["message"] = "All Merkle Roots Valid."
+            return response
+        finally:
+            db.close()
+
+    @staticmethod
+    def _block_rows(db, group) -> list:
+        """Events of consecutive blocks in one range scan, split back per block."""
+        rows = (
+            db.query(*_COLUMNS)
+            .filter(Event.id >= group[0].first_event_id, Event.id <= group[-1].last_event_id)
+            .order_by(Event.id.asc())
+            .all()
+        )
+        ids = [r.id for r in rows]
+        return [rows[bisect_left(ids, b.first_event_id):bisect_right(ids, b.last_event_id)] for b in group]
+
+    def _check_blocks(self, group, per_block, result, state, checked, events):
+        sealed = result if isinstance(result, list) else result.result()
+        for block, rows, (hashes, root) in zip(group, per_block, sealed):
+            events += self._check_block(block, rows, hashes, root, state)
+        return checked + len(group), events
+
+    def _check_block(self, block, rows, hashes, root, state) -> int:
+        """Count, links, event hashes and Merkle root of one block."""
+        if len(rows) != block.event_count:
+            self._error(state, f"Missing Events in block {block.id}: {len(rows)} of {block.event_count}")
+            return len(rows)
+        for i, (row, recalc_hash) in enumerate(zip(rows, hashes)):
+            if i and row.previous_hash != rows[i - 1].event_hash:
+                self._error(state, f"Broken Link at ID {row.id}: Expected {_short(rows[i - 1].event_hash)}, Got {_short(row.previous_hash)}")
+            elif recalc_hash != row.event_hash:
+                self._error(state, f"Data Tampering at ID {row.id}: Content does not match Hash!")
+        if root != block.merkle_root:
+            self._error(state, f"Merkle Root Mismatch in block {block.id}")
+        return len(rows)
+
+
+class AuditJob:
+    """A background verification run the client can poll for progress."""
+    __slots__ = ("job_id", "params", "status", "done", "total", "started_at", "finished_at", "result")
+
+    def __init__(self, params: dict):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.status = "QUEUED"
+        self.done = 0
+        self.total = 0
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = (end - self.started_at) if self.started_at else 0.0
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "params": self.params,
+            "events_done": self.done,
+            "events_total": self.total,
+            "progress_pct": round(100.0 * self.done / self.total, 1) if self.total else 0.0,
+            "events_per_sec": round(self.done / elapsed, 1) if elapsed > 0 else None,
+            "elapsed_sec": round(elapsed, 3),
+            "result": self.result,
+        }
+
+
+# Jobs in these states are finished and may be evicted
+FINAL_STATUSES = ("DONE", "FAILED")
+
+
+class AuditJobManager:
+    """Runs long audits in background threads so no HTTP call blocks for minutes."""
+
+    def __init__(self, verifier: ChainVerifier, max_jobs=50):
+        self.verifier = verifier
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, **params) -> AuditJob:
+        """Queues an audit. Raises ConnectionRefusedError when max_jobs are still unfinished."""
+        job = AuditJob(params)
+        with self._lock:
+            # Forget the oldest finished jobs so the dict stays bounded (never a running one:
+            # its thread keeps going and the caller would lose its progress and result)
+            if len(self._jobs) >= self.max_jobs:
+                finished = [job_id for job_id, old in self._jobs.items() if old.status in FINAL_STATUSES]
+                for job_id in finished[:len(self._jobs) - self.max_jobs + 1]:
+                    del self._jobs[job_id]
+            if len(self._jobs) >= self.max_jobs:
+                raise ConnectionRefusedError(f"{self.max_jobs} audit jobs are still running")
+            self._jobs[job.job_id] = job
+        threading.Thread(target=self._run, args=(job,), name=f"audit-{job.job_id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def _run(self, job: AuditJob):
+        def on_progress(done, total):
+            job.done = done
+            job.total = total
+
+        job.status = "RUNNING"
+        job.started_at = time.time()
+        try:
+            job.result = self.verifier.verify(progress=on_progress, **job.params)
+            job.status = "DONE"
+        except Exception as e:
+            log.error(f"⚠️ Audit job {job.job_id} failed: {e}")
+            job.result = {"error": str(e)}
+            job.status = "FAILED"
+        finally:
+            job.finished_at = time.time()
+
+
+# Global Instances
+chain_verifier = ChainVerifier(chunk_size=settings.AUDIT_CHUNK_SIZE, workers=settings.AUDIT_WORKERS)
+audit_jobs = AuditJobManager(chain_verifier)
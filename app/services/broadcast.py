@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from app.logger import get_logger
+
+log = get_logger()
+
+
+class Subscriber:
+    """
+    One connected dashboard.
+
+    State updates (latest reading per sensor, grid totals) are coalesced:
+    a slow client only ever gets the newest value per key. Alerts are
+    queued in a bounded backlog; a client that overflows it too often is
+    disconnected instead of growing memory.
+    """
+    __slots__ = ("sensor_filter", "pending", "alerts", "dropped", "event", "closed")
+
+    def __init__(self, sensor_filter=None, max_alerts=100):
+        self.sensor_filter = sensor_filter
+        self.pending = {}                       # (kind, key) -> encoded message
+        self.alerts = deque(maxlen=max_alerts)  # encoded alert messages
+        self.dropped = 0
+        self.event = asyncio.Event()
+        self.closed = False
+
+    def drain(self) -> list:
+        """Everything waiting for this client, alerts first."""
+        messages = list(self.alerts)
+        self.alerts.clear()
+        messages.extend(self.pending.values())
+        self.pending = {}
+        self.event.clear()
+        return messages
+
+
+class TelemetryHub:
+    """
+    Fan-out of live ingest updates to WebSocket / SSE clients.
+
+    publish() is called from the MQTT thread. It encodes the message once and
+    hops onto the asyncio loop; the loop copies the reference into every
+    subscriber. No database reads are involved.
+    """
+
+    def __init__(self, max_subscribers=500, max_alert_backlog=100, max_drops=1000):
+        self.max_subscribers = max_subscribers
+        self.max_alert_backlog = max_alert_backlog
+        self.max_drops = max_drops   # Alert drops before a slow client is evicted
+
+        self._loop = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        # --- COUNTERS ---
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.evicted = 0
+
+    def bind_loop(self, loop):
+        """Called once at startup with the server's event loop."""
+        self._loop = loop
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    # --- 1. SUBSCRIPTIONS (event loop) ---
+    def subscribe(self, sensor_filter=None) -> Subscriber:
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise ConnectionRefusedError("Too many live subscribers")
+            sub = Subscriber(sensor_filter, self.max_alert_backlog)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        sub.closed = True
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    # --- 2. PUBLISHING (any thread) ---
+    def publish(self, kind: str, key: str, data: dict, sensor_id: str = None):
+        """
+        kind = 'reading' | 'alert' | 'grid'. Updates with the same (kind, key)
+        replace each other for clients that have not caught up yet.
+        """
+        if not self._subscribers or self._loop is None:
+            return
+        message = json.dumps({"type": kind, "key": key, "data": data}, default=str)
+        self.published += 1
+        try:
+            self._loop.call_soon_threadsafe(self._fanout, kind, key, message, sensor_id)
+        except RuntimeError:
+            # Loop already closed (shutdown)
+            pass
+
+    def _fanout(self, kind, key, message, sensor_id):
+        for sub in tuple(self._subscribers):
+            if sub.sensor_filter and sensor_id and sensor_id not in sub.sensor_filter:
+                continue
+            if kind == "alert":
+                if len(sub.alerts) == sub.alerts.maxlen:
+                    sub.dropped += 1
+                    self.dropped += 1
+                    if sub.dropped > self.max_drops:
+                        # Backpressure limit: this client cannot keep up
+                        self.evicted += 1
+                        self.unsubscribe(sub)
+                        sub.event.set()
+                        continue
+                sub.alerts.append(message)
+            else:
+                if (kind, key) in sub.pending:
+                    self.coalesced += 1
+                sub.pending[(kind, key)] = message
+            sub.event.set()
+
+    # --- 3. CONSUMING (event loop) ---
+    async def listen(self, sub: Subscriber, heartbeat: float = 15.0):
+        """
+        Yields lists of encoded messages for one client.
+        Yields an empty list on heartbeat timeouts so callers can ping.
+        """
+        while not sub.closed:
+            try:
+                await asyncio.wait_for(sub.event.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+            if sub.closed:
+                break
+            yield sub.drain()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "alerts_dropped": self.dropped,
+            "clients_evicted": self.evicted,
+        }
+
+
+# Global Instance
+telemetry_hub = TelemetryHub()
@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from app.config import settings
+from app.logger import get_logger
+from app.services.snapshot import SnapshotRegion, SnapshotTooLarge
+from app.services.state import grid_state
+from app.services.registry import sensor_registry
+from app.services.prediction import oracle
+from app.services.topology import topology
+from app.services.rollups import rollup_engine
+from app.services.writer import db_writer
+from app.services.dispatch import alert_dispatcher
+from app.services.ledger import event_ledger
+from app.services.aging import aging_engine
+from app.services.incidents import incident_engine
+from app.services.broadcast import telemetry_hub
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so every process is a single-worker owner
+    fcntl = None
+
+log = get_logger()
+
+OWNER, READER = "OWNER", "READER"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return float(value)  # numpy scalars
+
+
+def reset_local_twin():
+    """Wipes this process' in-memory analytics (the DB side is done by the caller)."""
+    grid_state.reset()
+    topology.reset_readings()
+    sensor_registry.clear()
+    oracle.reset()
+    rollup_engine.reset()
+    event_ledger.reset()
+    aging_engine.reset()
+    incident_engine.reset()
+
+
+class IngestElection:
+    """
+    'uvicorn --workers N' starts N copies of the app. The first one to get an
+    exclusive flock() on INGEST_LOCK_FILE owns MQTT + analytics. The kernel
+    drops the lock when that process dies, so a reader can take over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TwinCluster:
+    """
+    Multi-worker mode.
+
+    OWNER: runs ingest and publishes the digital twin (grid_state, fleet
+    predictions, topology, writer / dispatcher stats) into a seqlock'd mmap
+    region every TWIN_SNAPSHOT_INTERVAL while it changes.
+    READER: serves HTTP only. A poller thread copies the newest snapshot into
+    the local grid_state (so every read endpoint works unchanged), forwards
+    new rows to local live-stream subscribers, and keeps trying the election
+    lock to take over if the owner dies.
+    """
+
+    def __init__(self, role="auto", lock_path="grid_ingest.lock", snapshot_path="grid_twin.snap",
+                 snapshot_size=8 * 1024 * 1024, interval=0.2):
+        self.requested_role = role
+        self.role = None
+        self.interval = interval
+        self.election = IngestElection(lock_path)
+        self.region = SnapshotRegion(snapshot_path, snapshot_size)
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._remote = {}          # Owner-only sections from the last snapshot (readers)
+        self._seq = -1
+        self._last_ids = (0, 0)    # Newest reading / event id already forwarded to the hub
+        self._ring_limit = None    # Ring rows that did not fit the region (trim at this size and above)
+
+        # --- COUNTERS ---
+        self.published = 0
+        self.trimmed = 0
+        self.applied = 0
+        self.last_bytes = 0
+        self.last_update = None
+
+    @property
+    def is_reader(self) -> bool:
+        return self.role == READER
+
+    # --- 1. ELECTION ---
+    def elect(self) -> bool:
+        """True if this process must run ingest."""
+        if self.requested_role == "reader":
+            self.role = READER
+        elif self.election.try_acquire():
+            self.role = OWNER
+        elif self.requested_role == "owner":
+            raise RuntimeError(f"INGEST_ROLE=owner but {self.election.path} is held by another process")
+        else:
+            self.role = READER
+        return self.role == OWNER
+
+    # --- 2. OWNER: PUBLISH ---
+    def start_publisher(self):
+        self.region.create()
+        self._reset_seen = self.region.reset_seq()
+        self._start(self._publish_loop, "twin-publisher")
+
+    def _publish_loop(self):
+        published_version = -1
+        last_publish = 0.0
+        while not self._stop.wait(self.interval):
+            try:
+                reset_seq = self.region.reset_seq()
+                if reset_seq != self._reset_seen:
+                    self._reset_seen = reset_seq
+                    log.info("🧹 Twin reset requested by an HTTP worker")
+                    reset_local_twin()
+                # Republish on change, and at least every second for the stats
+                if grid_state.version != published_version or time.monotonic() - last_publish > 1.0:
+                    published_version = grid_state.version
+                    last_publish = time.monotonic()
+                    self.publish()
+            except Exception as e:
+                log.error(f"⚠️ Twin snapshot publish failed: {e}")
+
+    def publish(self):
+        sections = {
+            "published_at": time.time(),
+            "predictions": oracle.predict_fleet(),
+            "topology": topology.report(),
+            "writer": db_writer.stats(),
+            "dispatcher": alert_dispatcher.stats(),
+            "ledger": event_ledger.stats(),
+            "aging": aging_engine.report(),
+            "incidents": incident_engine.report(),
+        }
+        # The twin without the per-sensor rings is serialized once, the rings
+        # only if they are expected to fit (ensure_ascii: characters = bytes)
+        base = json.dumps({**sections, "twin": grid_state.to_snapshot()}, default=_encode)
+        payload = base
+        ring_rows = grid_state.ring_rows()
+        if self._rings_fit(ring_rows, len(base)):
+            rings = json.dumps(grid_state.sensor_rings(), default=_encode)
+            if len(base) + len(rings) + 20 <= self.region.capacity:
+                payload = f'{base[:-1]}, "sensor_rings": {rings}}}'
+            else:
+                self._ring_limit = ring_rows
+        if payload is base:
+            # Too many sensors for the region: readers answer per-sensor history from SQLite
+            self.trimmed += 1
+        payload = payload.encode()
+        try:
+            self.region.write(payload)
+        except SnapshotTooLarge as e:
+            log.error(f"⚠️ Twin snapshot does not fit TWIN_SNAPSHOT_SIZE_MB: {e}")
+            return
+        self.published += 1
+        self.last_bytes = len(payload)
+        self.last_update = time.time()
+
+    def _rings_fit(self, ring_rows: int, base_bytes: int) -> bool:
+        """Sizes the rings from the row count before building them; a miss is remembered."""
+        if self._ring_limit is not None and ring_rows >= self._ring_limit:
+            return False
+        sample = grid_state.latest_reading
+        row_bytes = len(json.dumps(sample, default=_encode)) + 2 if sample else 0
+        if base_bytes + ring_rows * row_bytes > self.region.capacity:
+            self._ring_limit = ring_rows
+            return False
+        return True
+
+    # --- 3. READER: FOLLOW ---
+    def start_follower(self, on_promote=None):
+        self._on_promote = on_promote
+        self._start(self._follow_loop, "twin-follower")
+
+    def _follow_loop(self):
+        next_election = time.monotonic() + 1.0
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                log.error(f"⚠️ Twin snapshot read failed: {e}")
+
+            if self._on_promote and self.requested_role == "auto" and time.monotonic() >= next_election:
+                next_election = time.monotonic() + 1.0
+                if self.election.try_acquire():
+                    log.warning("👑 Ingest owner is gone: this worker takes over MQTT ingest")
+                    self.role = OWNER
+                    self._remote = {}
+                    self._on_promote()     # Starts ingest, and the publisher thread with it
+                    return
+
+    def poll(self) -> bool:
+        """Applies the newest snapshot, if there is one. True if something changed."""
+        result = self.region.read(self._seq)
+        if result is None:
+            return False
+        self._seq, payload = result
+        data = json.loads(payload)
+        twin = data.pop("twin")
+        rings = data.pop("sensor_rings", None)
+        if rings is not None:
+            twin["recent_readings"] = rings
+        grid_state.load_snapshot(twin)
+        self._remote = data
+        self.applied += 1
+        self.last_bytes = len(payload)
+        self.last_update = data.get("published_at")
+        if telemetry_hub.has_subscribers:
+            self._forward(twin)
+        return True
+
+    def _forward(self, twin: dict):
+        """Pushes rows the owner ingested since the last poll to this worker's live clients."""
+        last_reading, last_event = self._last_ids
+        readings = [r for r in twin["recent_readings_all"] if r["id"] > last_reading]
+        events = [e for e in twin["recent_events"] if e["id"] > last_event]
+        for row in reversed(readings):
+            telemetry_hub.publish("reading", row["sensor_id"], row, sensor_id=row["sensor_id"])
+        for row in reversed(events):
+            telemetry_hub.publish("alert", row["event_type"], row, sensor_id=row["sensor_id"])
+        telemetry_hub.publish("grid", "totals", {
+            "transformer_current": grid_state.transformer_current,
+            "total_load": grid_state.total_meter_load,
+            "theft_detected": grid_state.check_for_theft(),
+        })
+        self._last_ids = (
+            readings[0]["id"] if readings else last_reading,
+            events[0]["id"] if events else last_event,
+        )
+
+    def remote(self, section: str):
+        """Owner-only data (predictions, topology, service stats). None when we are the owner."""
+        if not self.is_reader:
+            return None
+        return self._remote.get(section)
+
+    # --- 4. ADMIN ---
+    def reset_twin(self):
+        """Resets the in-memory twin of the ingest owner, wherever that is."""
+        if self.is_reader:
+            self.region.request_reset()
+        reset_local_twin()
+
+    # --- LIFECYCLE ---
+    def _start(self, target, name):
+        self._stop.clear()
+        self._thread = threading.Thread(target=target, name=name, daemon=True)
+        self._thread.start()
+
+    def stop(self, release: bool = True):
+        """
+        Stops the publisher / follower thread. The owner passes release=False and
+        calls release() once everything queued is committed: a reader promoted
+        earlier would prime its ids and ledger while we are still writing.
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(2.0)
+        self._thread = None
+        if release:
+            self.release()
+
+    def release(self):
+        self.election.release()
+
+    def stats(self) -> dict:
+        return {
+            "role": self.role,
+            "pid": os.getpid(),
+            "owner_pid": self.region.owner_pid,
+            "snapshot_seq": self._seq if self.is_reader else self.published * 2,
+            "snapshot_bytes": self.last_bytes,
+            "snapshot_age_sec": round(time.time() - self.last_update, 3) if self.last_update else None,
+            "published": self.published,
+            "applied": self.applied,
+            "trimmed": self.trimmed,
+        }
+
+
+# Global Instance
+twin_cluster = TwinCluster(
+    role=settings.INGEST_ROLE,
+    lock_path=settings.INGEST_LOCK_FILE,
+    snapshot_path=settings.TWIN_SNAPSHOT_FILE,
+    snapshot_size=settings.TWIN_SNAPSHOT_SIZE_MB * 1024 * 1024,
+    interval=settings.TWIN_SNAPSHOT_INTERVAL,
+)
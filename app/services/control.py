@@ -1,9 +1,12 @@
 from app.config import settings
+from app.logger import get_logger
 
 # We need to import the mqtt client to send messages
 # Note: We will fix the circular import in the next step
 import app.services.mqtt as mqtt_service
 
+log = get_logger()
+
 class GridController:
     def __init__(self):
         self.TOPIC_CONTROL = "grid/sentinel/control"
@@ -12,7 +15,7 @@ class GridController:
         """
         Sends the KILL command to the smart plug/relay.
         """
-        print(f"⚡ ACTION: SHEDDING LOAD! Reason: {reason}")
+        log.warning(f"⚡ ACTION: SHEDDING LOAD! Reason: {reason}")
         
         # Payload: simple text or JSON. Let's use JSON for professionalism.
         payload = {
@@ -28,7 +31,7 @@ class GridController:
         """
         Sends the RESTORE command.
         """
-        print("⚡ ACTION: RESTORING POWER.")
+        log.warning("⚡ ACTION: RESTORING POWER.")
         payload = {
             "command": "ON",
             "priority": "NORMAL",
@@ -1,4 +1,5 @@
 import hashlib
+import hmac
 
 def generate_event_hash(sensor_id, event_type, value, timestamp, prev_hash):
     """
@@ -12,4 +13,110 @@ def generate_event_hash(sensor_id, event_type, value, timestamp, prev_hash):
     payload = f"{sensor_id}|{event_type}|{value}|{time_str}|{prev_hash}"
     
     # 3. Hash it
-    return hashlib.sha256(payload.encode()).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def hash_event_rows(rows):
+    """
+    Batch version of generate_event_hash for worker processes.
+    rows = [(sensor_id, event_type, value, timestamp, prev_hash), ...]
+    """
+    return [generate_event_hash(*row) for row in rows]
+
+
+# --- MERKLE BLOCKS ---
+# Leaves and inner nodes are hashed with different prefixes, so an inner node
+# can never be passed off as an event (second-preimage trick on Merkle trees).
+def _leaf(event_hash) -> bytes:
+    return hashlib.sha256(b"\x00" + (event_hash or "").encode()).digest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _levels(event_hashes):
+    """All tree levels, leaves first. An odd last node is carried up unchanged."""
+    level = [_leaf(h) for h in event_hashes]
+    levels = [level]
+    while len(level) > 1:
+        level = [_node(level[i], level[i + 1]) if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(event_hashes) -> str:
+    """Root over the event hashes of one block, in id order."""
+    if not event_hashes:
+        return hashlib.sha256(b"").hexdigest()
+    return _levels(event_hashes)[-1][0].hex()
+
+
+def merkle_proof(event_hashes, index: int) -> list:
+    """
+    Inclusion proof for event_hashes[index]: the sibling on every level,
+    bottom-up, as [{"hash": ..., "side": "left"|"right"}]. log2(block size) entries.
+    """
+    proof = []
+    for level in _levels(event_hashes)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"hash": level[sibling].hex(), "side": "left" if sibling < index else "right"})
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(event_hash, proof: list, root: str) -> bool:
+    node = _leaf(event_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = _node(sibling, node) if step["side"] == "left" else _node(node, sibling)
+    return hmac.compare_digest(node.hex(), root or "")
+
+
+def generate_block_hash(height, first_event_id, last_event_id, root, prev_block_hash):
+    """Header hash of a sealed block: chains each Merkle root to the previous block."""
+    payload = f"{height}|{first_event_id}|{last_event_id}|{root}|{prev_block_hash}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def seal_event_rows(rows):
+    """
+    Worker-process check of one block: recomputes every event hash and the
+    Merkle root over the recomputed hashes.
+    rows = [(sensor_id, event_type, value, timestamp, prev_hash), ...]
+    """
+    hashes = hash_event_rows(rows)
+    return hashes, merkle_root(hashes)
+
+
+def seal_event_blocks(blocks):
+    """seal_event_rows for several blocks per task (one block alone is too little work to ship)."""
+    return [seal_event_rows(rows) for rows in blocks]
+
+
+def sign_checkpoint(key: str, last_event_id, last_event_hash, events_verified):
+    """
+    HMAC-SHA256 signature of a 'verified-up-to' audit checkpoint.
+    Without the key, nobody can forge a checkpoint to skip past tampered rows.
+    """
+    payload = f"{last_event_id}|{last_event_hash}|{events_verified}"
+    return hmac.new(key.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_checkpoint_signature(key: str, last_event_id, last_event_hash, events_verified, signature) -> bool:
+    expected = sign_checkpoint(key, last_event_id, last_event_hash, events_verified)
+    return hmac.compare_digest(expected, signature or "")
+
+
+def sign_anchor(key: str, last_event_id, last_event_hash, events_pruned):
+    """
+    HMAC-SHA256 of a chain anchor (the stand-in for rows removed by retention).
+    Prefixed so a checkpoint signature can never be replayed as an anchor.
+    """
+    payload = f"anchor|{last_event_id}|{last_event_hash}|{events_pruned}"
+    return hmac.new(key.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_anchor_signature(key: str, last_event_id, last_event_hash, events_pruned, signature) -> bool:
+    expected = sign_anchor(key, last_event_id, last_event_hash, events_pruned)
+    return hmac.compare_digest(expected, signature or "")
@@ -0,0 +1,298 @@
+import heapq
+import json
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from app.config import settings
+from app.logger import get_logger
+
+# --- NEW: IMPORT SMS SERVICE ---
+from app.services.sms import send_sms_alert
+
+log = get_logger()
+
+_STOP = object()
+
+
+# ---------------------------------------------------------
+# 1. TRANSPORTS (How an alert leaves the building)
+# ---------------------------------------------------------
+class Transport:
+    """Delivers one payload. Raise on failure so the dispatcher can retry."""
+    name = "base"
+
+    def send(self, payload):
+        raise NotImplementedError
+
+
+class SmsTransport(Transport):
+    name = "sms"
+
+    def send(self, payload):
+        send_sms_alert(payload)
+
+
+class MqttTransport(Transport):
+    """Publishes {'topic': ..., 'payload': {...}} through an MQTT client."""
+    name = "mqtt"
+
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, payload):
+        result = self.client.publish(payload["topic"], json.dumps(payload["payload"]))
+        if getattr(result, "rc", 0) != 0:
+            raise ConnectionError(f"MQTT publish failed (rc={result.rc})")
+
+
+class FileTransport(Transport):
+    """Offline stand-in: appends every alert as one JSON line."""
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, payload):
+        line = json.dumps({"ts": time.time(), "payload": payload}, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class HttpTransport(Transport):
+    """Offline / gateway stand-in: POSTs the alert as JSON to a URL."""
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, payload):
+        body = json.dumps({"payload": payload}, default=str).encode()
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            if resp.status >= 300:
+                raise ConnectionError(f"HTTP {resp.status}")
+
+
+# ---------------------------------------------------------
+# 2. DISPATCHER
+# ---------------------------------------------------------
+class OutboundAlert:
+    __slots__ = ("channel", "payload", "attempts", "created_at")
+
+    def __init__(self, channel, payload):
+        self.channel = channel
+        self.payload = payload
+        self.attempts = 0
+        self.created_at = time.monotonic()
+
+
+class Channel:
+    """A transport plus its own bounded queue, worker threads and counters."""
+
+    def __init__(self, name, transport, concurrency, max_queue):
+        self.name = name
+        self.transport = transport
+        self.concurrency = concurrency
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.workers = []
+
+        # Workers, the retry scheduler and the MQTT thread all update these
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.latencies_ms = deque(maxlen=1000)  # Enqueue -> delivered
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies_ms)
+            sent, failed, retried, dropped = self.sent, self.failed, self.retried, self.dropped
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else None
+
+        return {
+            "transport": self.transport.name,
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "sent": sent,
+            "failed": failed,
+            "retried": retried,
+            "dropped": dropped,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_max": round(latencies[-1], 2) if latencies else None,
+        }
+
+
+class AlertDispatcher:
+    """
+    Moves outbound notifications (SMS, relay commands) off the MQTT thread.
+
+    dispatch() never blocks: it drops (and counts) when a channel's queue is
+    full. Each channel has 'concurrency' workers, so a slow SMS gateway cannot
+    hold up relay commands. Failed sends are retried with exponential backoff
+    by a single scheduler thread.
+    """
+
+    def __init__(self, max_queue=10000, max_retries=3, backoff_base=0.5):
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.channels = {}
+        self.running = False
+
+        # Retry heap: (due_time, seq, alert)
+        self._retries = []
+        self._retry_seq = 0
+        self._retry_cond = threading.Condition()
+        self._scheduler = None
+
+    def register(self, name: str, transport: Transport, concurrency: int = 1):
+        """Adds (or replaces) a channel. Call before start()."""
+        self.channels[name] = Channel(name, transport, concurrency, self.max_queue)
+
+    # --- LIFECYCLE ---
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        for channel in self.channels.values():
+            for i in range(channel.concurrency):
+                worker = threading.Thread(target=self._work, args=(channel,), name=f"dispatch-{channel.name}-{i}", daemon=True)
+                worker.start()
+                channel.workers.append(worker)
+        self._scheduler = threading.Thread(target=self._schedule, name="dispatch-retry", daemon=True)
+        self._scheduler.start()
+        log.info(f"📨 Alert dispatcher started: {', '.join(f'{c.name}x{c.concurrency}' for c in self.channels.values())}")
+
+    def stop(self, timeout: float = 5.0):
+        """Lets queued alerts drain (up to 'timeout'), then stops all workers."""
+        if not self.running:
+            return
+        self.running = False
+        with self._retry_cond:
+            self._retry_cond.notify_all()
+            abandoned, self._retries = self._retries, []
+        # Retries still waiting for their backoff are not sent any more: count them as dropped
+        for _, _, alert in abandoned:
+            channel = self.channels[alert.channel]
+            with channel.lock:
+                channel.dropped += 1
+        if abandoned:
+            log.warning(f"📪 Dispatcher stopped with {len(abandoned)} alert retries pending, dropped")
+        deadline = time.monotonic() + timeout
+        for channel in self.channels.values():
+            for _ in channel.workers:
+                try:
+                    # Bounded: a full queue behind a slow gateway must not hold up shutdown
+                    channel.queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Full:
+                    log.warning(f"📪 Channel '{channel.name}' still busy at shutdown, {channel.queue.qsize()} alerts not delivered")
+                    break
+            for worker in channel.workers:
+                worker.join(max(0.0, deadline - time.monotonic()))
+            channel.workers = []
+
+    # --- PRODUCER SIDE (MQTT thread) ---
+    def dispatch(self, channel_name: str, payload) -> bool:
+        """Queues one notification. Returns False if it had to be dropped."""
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            log.error(f"❌ Unknown alert channel: {channel_name}")
+            return False
+        alert = OutboundAlert(channel_name, payload)
+        if not self.running:
+            # Not started (scripts, tests): deliver inline like before
+            self._deliver(channel, alert)
+            return True
+        try:
+            channel.queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            with channel.lock:
+                channel.dropped += 1
+            log.error(f"📪 Alert queue '{channel_name}' full, dropped: {payload}", extra={"key": f"dispatch-full:{channel_name}"})
+            return False
+
+    # --- CONSUMER SIDE ---
+    def _work(self, channel: Channel):
+        while True:
+            alert = channel.queue.get()
+            if alert is _STOP:
+                return
+            self._deliver(channel, alert)
+
+    def _deliver(self, channel: Channel, alert: OutboundAlert):
+        alert.attempts += 1
+        try:
+            channel.transport.send(alert.payload)
+        except Exception as e:
+            if alert.attempts <= self.max_retries and self.running:
+                with channel.lock:
+                    channel.retried += 1
+                delay = self.backoff_base * (2 ** (alert.attempts - 1))
+                self._schedule_retry(alert, delay)
+            else:
+                with channel.lock:
+                    channel.failed += 1
+                log.error(f"❌ Alert via '{channel.name}' failed after {alert.attempts} attempts: {e}", extra={"key": f"dispatch-failed:{channel.name}"})
+            return
+        latency_ms = (time.monotonic() - alert.created_at) * 1000.0
+        with channel.lock:
+            channel.sent += 1
+            channel.latencies_ms.append(latency_ms)
+
+    def _schedule_retry(self, alert: OutboundAlert, delay: float):
+        with self._retry_cond:
+            self._retry_seq += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._retry_seq, alert))
+            self._retry_cond.notify()
+
+    def _schedule(self):
+        """Moves due retries back onto their channel queue."""
+        while True:
+            with self._retry_cond:
+                while self.running and (not self._retries or self._retries[0][0] > time.monotonic()):
+                    timeout = self._retries[0][0] - time.monotonic() if self._retries else None
+                    self._retry_cond.wait(timeout)
+                if not self.running:
+                    return
+                _, _, alert = heapq.heappop(self._retries)
+            channel = self.channels[alert.channel]
+            try:
+                channel.queue.put_nowait(alert)
+            except queue.Full:
+                with channel.lock:
+                    channel.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending_retries": len(self._retries),
+            "channels": {name: channel.stats() for name, channel in self.channels.items()},
+        }
+
+
+def build_sms_transport() -> Transport:
+    """Picks the real SMS gateway or an offline stand-in (ALERT_TRANSPORT)."""
+    if settings.ALERT_TRANSPORT == "file":
+        return FileTransport(settings.ALERT_FILE_PATH)
+    if settings.ALERT_TRANSPORT == "http":
+        return HttpTransport(settings.ALERT_HTTP_URL)
+    return SmsTransport()
+
+
+# Global Instance (the MQTT service registers its 'control' channel)
+alert_dispatcher = AlertDispatcher(
+    max_queue=settings.DISPATCH_QUEUE_SIZE,
+    max_retries=settings.DISPATCH_MAX_RETRIES,
+    backoff_base=settings.DISPATCH_BACKOFF_SEC,
+)
+alert_dispatcher.register("sms", build_sms_transport(), concurrency=settings.DISPATCH_SMS_CONCURRENCY)
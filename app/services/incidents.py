@@ -0,0 +1,313 @@
+import threading
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from app.config import settings
+from app.models import Incident
+from app.database import row_batches
+from app.services.writer import id_sequence
+
+# Alert states per (sensor_id, event_type). IDLE keys keep no state at all.
+PENDING, OPEN, CLEARED = "PENDING", "OPEN", "CLEARED"
+# observe() result when a reading opened an incident (CLEARED when it closed one)
+OPENED = "OPENED"
+
+# Columns an upsert may change once the incident row exists
+INCIDENT_FIELDS = ("status", "event_id", "message", "count", "peak_value", "last_value", "last_seen_at", "cleared_at")
+
+
+class AlertRule:
+    """Raise above 'raise_at' (held for 'raise_hold' seconds), clear below 'clear_at'."""
+
+    __slots__ = ("raise_at", "clear_at", "raise_hold")
+
+    def __init__(self, raise_at: float, clear_at: float, raise_hold: float = 0.0):
+        self.raise_at = raise_at
+        self.clear_at = clear_at
+        self.raise_hold = raise_hold
+
+
+# Tampering (the coin scratch) and thermal shock (power cut) are short: they open at once
+ALERT_RULES = {
+    "THEFT_DETECTED": AlertRule(0.30, 0.20, settings.INCIDENT_RAISE_HOLD_SEC),   # Amps unaccounted for
+    "CRITICAL_AGING": AlertRule(4.0, 3.0, settings.INCIDENT_RAISE_HOLD_SEC),     # Aging acceleration factor
+    "AUDIO_FAIL": AlertRule(3.0, 2.0, settings.INCIDENT_RAISE_HOLD_SEC),         # Harmonic distortion
+    "PHYSICAL_TAMPERING": AlertRule(0.6, 0.4),                                   # Vibration level
+    "THERMAL_SHOCK": AlertRule(2.0, 1.0),                                        # °C per minute
+}
+
+
+def upsert_incidents(db, rows: list):
+    """Writer row: inserts new incidents and updates the running ones (one statement per batch)."""
+    for batch in row_batches(rows):
+        stmt = insert(Incident).values(batch)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={name: stmt.excluded[name] for name in INCIDENT_FIELDS},
+        ))
+
+
+def _when(ts):
+    return datetime.fromtimestamp(ts) if ts is not None else None
+
+
+class AlertState:
+    """One live alert condition. Exists only while PENDING or OPEN."""
+
+    __slots__ = (
+        "sensor_id", "event_type", "incident_id", "status", "since", "below_since", "last_observed",
+        "last_seen", "cleared_at", "count", "peak", "last_value", "message", "event_id", "event",
+    )
+
+    def __init__(self, sensor_id: str, event_type: str, value: float, ts: float):
+        self.sensor_id = sensor_id
+        self.event_type = event_type
+        self.incident_id = None
+        self.status = PENDING
+        self.since = ts              # First reading over the raise threshold (= opened_at)
+        self.below_since = None      # First reading under the clear threshold (OPEN only)
+        self.last_observed = ts
+        self.last_seen = ts          # Last reading over the raise threshold
+        self.cleared_at = None
+        self.count = 1
+        self.peak = value
+        self.last_value = value
+        self.message = None
+        self.event_id = None
+        self.event = None            # The opening Event until its id has been copied
+
+
+class IncidentEngine:
+    """
+    Alert state machine per (sensor_id, event_type), with hysteresis:
+
+        IDLE --value > raise_at--> PENDING --held raise_hold s--> OPEN
+        OPEN --value < clear_at for clear_hold s, or no reading for stale_after s--> IDLE
+
+    Only the OPEN transition writes an Event and sends a notification; every
+    further reading just bumps the incident's count / peak / last seen in
+    memory. Opened and closed incidents are written right away, running ones
+    in one upsert every persist_interval, so DB writes and SMS grow with the
+    number of incidents, not with the message rate.
+    """
+
+    def __init__(self, rules=ALERT_RULES, clear_hold=30.0, stale_after=300.0, persist_interval=10.0):
+        self.rules = rules
+        self.clear_hold = clear_hold
+        self.stale_after = stale_after
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._states = {}            # (sensor_id, event_type) -> AlertState
+            self._transitions = []       # Opened / closed since the last collect()
+            self._dirty = {}             # incident_id -> running AlertState changed since the last persist
+            self._last_persist = None
+            self.opened = 0
+            self.cleared = 0
+            self.expired = 0             # Closed because the sensor went quiet
+            self.coalesced = 0           # Readings folded into an open incident (no row, no SMS)
+
+    # --- 1. INGEST (MQTT thread) ---
+    def observe(self, event_type: str, sensor_id: str, value: float, ts: float):
+        """
+        Feeds one reading of an alert signal (epoch seconds). Returns OPENED
+        when this reading opened an incident (the caller writes the Event and
+        sends the SMS), CLEARED when it closed one, None otherwise.
+        """
+        rule = self.rules[event_type]
+        key = (sensor_id, event_type)
+        state = self._states.get(key)
+        # Hot path: nothing going on and nothing to raise
+        if state is None and value <= rule.raise_at:
+            return None
+        with self._lock:
+            if state is not None and ts - state.last_observed >= self.stale_after:
+                # Sensor was silent (or we were down) before the sweep got to it: start over
+                self._expire_state(key, state)
+                state = None
+                if value <= rule.raise_at:
+                    return None
+            if state is None:
+                state = self._states[key] = AlertState(sensor_id, event_type, value, ts)
+                return self._open(state) if rule.raise_hold <= 0 else None
+
+            state.last_observed = ts
+            state.last_value = value
+            if value > rule.raise_at:
+                state.count += 1
+                state.last_seen = ts
+                if value > state.peak:
+                    state.peak = value
+
+            if state.status == PENDING:
+                if value <= rule.raise_at:
+                    # Did not persist: noise, forget it
+                    del self._states[key]
+                    return None
+                return self._open(state) if ts - state.since >= rule.raise_hold else None
+
+            # OPEN
+            self._dirty[state.incident_id] = state
+            if value > rule.raise_at:
+                self.coalesced += 1
+            if value >= rule.clear_at:
+                state.below_since = None
+                return None
+            if state.below_since is None:
+                state.below_since = ts
+            if ts - state.below_since < self.clear_hold:
+                return None
+            del self._states[key]
+            self._close(state, ts)
+            self.cleared += 1
+            return CLEARED
+
+    def _open(self, state: AlertState) -> str:
+        state.status = OPEN
+        state.incident_id = id_sequence.next(Incident)
+        self._transitions.append(state)
+        self.opened += 1
+        return OPENED
+
+    def _close(self, state: AlertState, ts: float):
+        state.status = CLEARED
+        state.cleared_at = ts
+        self._dirty.pop(state.incident_id, None)
+        self._transitions.append(state)
+
+    def attach(self, event):
+        """Links the Event written for an incident that just opened (same message)."""
+        state = self._states.get((event.sensor_id, event.event_type))
+        if state is not None and state.status == OPEN:
+            state.event = event
+            state.message = event.message
+
+    def collect(self, now: float):
+        """
+        Writer row (callable) for the incidents that opened or closed, plus
+        the running ones when persist_interval is due. None if nothing to write.
+        Call after the message's events got their ids. Also closes incidents
+        whose sensor has gone quiet.
+        """
+        if self._last_persist is None:
+            self._last_persist = now
+        due = now - self._last_persist >= self.persist_interval
+        if not due and not self._transitions:
+            return None
+        with self._lock:
+            if due:
+                self._last_persist = now
+                self._expire(now)
+                changed = {id(s): s for s in self._transitions}
+                changed.update((id(s), s) for s in self._dirty.values())
+                self._dirty = {}
+            else:
+                changed = {id(s): s for s in self._transitions}
+            self._transitions = []
+            rows = [self._row(state) for state in changed.values()]
+        if not rows:
+            return None
+        return lambda db: upsert_incidents(db, rows)
+
+    def _expire(self, now: float):
+        for key, state in list(self._states.items()):
+            if now - state.last_observed >= self.stale_after:
+                self._expire_state(key, state)
+
+    def _expire_state(self, key, state: AlertState):
+        del self._states[key]
+        if state.status == OPEN:
+            self._close(state, state.last_observed)
+            self.expired += 1
+
+    @staticmethod
+    def _row(state: AlertState) -> dict:
+        if state.event is not None:
+            # Copied now: once submitted, the Event belongs to the writer's session
+            state.event_id = state.event.id
+            state.event = None
+        return {
+            "id": state.incident_id,
+            "sensor_id": state.sensor_id,
+            "event_type": state.event_type,
+            "status": state.status,
+            "event_id": state.event_id,
+            "message": state.message,
+            "count": state.count,
+            "peak_value": state.peak,
+            "last_value": state.last_value,
+            "opened_at": _when(state.since),
+            "last_seen_at": _when(state.last_seen),
+            "cleared_at": _when(state.cleared_at),
+        }
+
+    # --- 2. READ SIDE ---
+    def report(self) -> dict:
+        """Open incidents (live counts, longest running first) and transition counters."""
+        with self._lock:
+            running = [s for s in self._states.values() if s.status == OPEN]
+            running.sort(key=lambda s: s.since)
+            incidents = [
+                {
+                    "incident_id": s.incident_id,
+                    "sensor_id": s.sensor_id,
+                    "event_type": s.event_type,
+                    "message": s.message,
+                    "count": s.count,
+                    "peak_value": round(s.peak, 4),
+                    "last_value": round(s.last_value, 4),
+                    "opened_at": _when(s.since).isoformat(),
+                    "last_seen_at": _when(s.last_seen).isoformat(),
+                    "clearing": s.below_since is not None,
+                }
+                for s in running
+            ]
+            pending = len(self._states) - len(running)
+        return {
+            "open": len(incidents),
+            "pending": pending,
+            "opened": self.opened,
+            "cleared": self.cleared,
+            "expired": self.expired,
+            "readings_coalesced": self.coalesced,
+            "incidents": incidents,
+        }
+
+    # --- 3. PERSISTENCE ---
+    def to_row(self):
+        """Writer row (callable) with every open incident's latest counts (shutdown)."""
+        with self._lock:
+            rows = [self._row(s) for s in self._transitions]
+            rows += [self._row(s) for s in self._states.values() if s.status == OPEN and s not in self._transitions]
+            self._transitions, self._dirty = [], {}
+        if not rows:
+            return None
+        return lambda db: upsert_incidents(db, rows)
+
+    def prime(self, db):
+        """Continues the incidents left open by the previous run (no second SMS after a restart)."""
+        stored = db.scalars(select(Incident).where(Incident.status == OPEN)).all()
+        with self._lock:
+            for row in stored:
+                state = AlertState(row.sensor_id, row.event_type, row.peak_value or 0.0, row.opened_at.timestamp())
+                state.status = OPEN
+                state.incident_id = row.id
+                state.count = row.count
+                state.last_value = row.last_value if row.last_value is not None else state.peak
+                state.last_seen = (row.last_seen_at or row.opened_at).timestamp()
+                # The downtime counts as silence: stale incidents close on the first persist
+                state.last_observed = state.last_seen
+                state.message = row.message
+                state.event_id = row.event_id
+                self._states[(row.sensor_id, row.event_type)] = state
+
+
+# Global Instance
+incident_engine = IncidentEngine(
+    clear_hold=settings.INCIDENT_CLEAR_HOLD_SEC,
+    stale_after=settings.INCIDENT_STALE_SEC,
+    persist_interval=settings.INCIDENT_PERSIST_SEC,
+)
@@ -0,0 +1,249 @@
+import threading
+from datetime import datetime
+from sqlalchemy import select, update
+from app.config import settings
+from app.models import Event, EventBlock, ChainAnchor
+from app.services.crypto import (
+    generate_event_hash,
+    generate_block_hash,
+    merkle_root,
+    merkle_proof,
+    verify_merkle_proof,
+)
+from app.services.audit import GENESIS_HASH
+from app.logger import get_logger
+
+log = get_logger()
+
+
+class EventLedger:
+    """
+    Seals the 'black box' at ingest time, on the MQTT thread:
+
+    - every Event gets previous_hash / event_hash before it is queued, linked
+      to the chain head kept in memory (no lookup of the previous row),
+    - every LEDGER_BLOCK_SIZE events are sealed into an EventBlock: a Merkle
+      root over their hashes, chained to the previous block's header hash.
+
+    The block goes to the writer together with the event that completed it.
+    A block (not the whole chain) is the unit of verification, and one event
+    is proven with log2(block size) sibling hashes.
+    """
+
+    def __init__(self, block_size=64):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self.events_sealed = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.head_hash = GENESIS_HASH        # event_hash of the newest event
+            self.height = 0                      # Newest sealed block
+            self.block_hash = GENESIS_HASH       # ...and its header hash
+            self._pending = []                   # (event_id, event_hash) not sealed yet
+
+    # --- 1. STARTUP ---
+    def prime(self, db):
+        """
+        Continues the chain and the open block from the database. Events stored
+        without a block (older versions, seeded data) are sealed here first,
+        after the ones never hashed at all got their place in the chain.
+        """
+        with self._lock:
+            self._backfill(db)
+            last_block = db.query(EventBlock).order_by(EventBlock.id.desc()).first()
+            if last_block is not None:
+                self.height, self.block_hash = last_block.id, last_block.block_hash
+            last_event = db.query(Event.event_hash).order_by(Event.id.desc()).first()
+            if last_event is not None:
+                self.head_hash = last_event.event_hash or GENESIS_HASH
+            else:
+                anchor = db.query(ChainAnchor.last_event_hash).order_by(ChainAnchor.id.desc()).first()
+                self.head_hash = anchor.last_event_hash if anchor else GENESIS_HASH
+
+            after_id = last_block.last_event_id if last_block else 0
+            sealed = 0
+            while True:
+                rows = (
+                    db.query(Event.id, Event.event_hash)
+                    .filter(Event.id > after_id)
+                    .order_by(Event.id.asc())
+                    .limit(self.block_size)
+                    .all()
+                )
+                self._pending = [(r.id, r.event_hash) for r in rows]
+                if len(rows) < self.block_size:
+                    break
+                db.add(self._seal())
+                sealed += 1
+                after_id = rows[-1].id
+            if sealed:
+                db.commit()
+                log.info(f"🧱 Sealed {sealed} blocks of older events (height {self.height})")
+
+    def _backfill(self, db, chunk: int = 5000):
+        """
+        Older ingest never set previous_hash / event_hash. Links those rows
+        into the chain in id order (from the event before the first of them),
+        so sealing and /audit/verify see a valid chain instead of tampering.
+        """
+        first = db.query(Event.id).filter(Event.event_hash.is_(None)).order_by(Event.id.asc()).first()
+        if first is None:
+            return
+        before = db.query(Event.event_hash).filter(Event.id < first.id).order_by(Event.id.desc()).first()
+        if before is not None:
+            prev = before.event_hash
+        else:
+            anchor = db.query(ChainAnchor.last_event_hash).order_by(ChainAnchor.id.desc()).first()
+            prev = anchor.last_event_hash if anchor else GENESIS_HASH
+
+        after_id, filled = first.id - 1, 0
+        while True:
+            rows = (
+                db.query(Event.id, Event.sensor_id, Event.event_type, Event.value, Event.timestamp, Event.event_hash)
+                .filter(Event.id > after_id)
+                .order_by(Event.id.asc())
+                .limit(chunk)
+                .all()
+            )
+            if not rows:
+                break
+            changes = []
+            for row in rows:
+                if row.event_hash is None:
+                    event_hash = generate_event_hash(row.sensor_id, row.event_type, row.value, row.timestamp, prev)
+                    changes.append({"id": row.id, "previous_hash": prev, "event_hash": event_hash})
+                    prev = event_hash
+                else:
+                    prev = row.event_hash
+            if changes:
+                db.execute(update(Event), changes)
+                filled += len(changes)
+            after_id = rows[-1].id
+        db.commit()
+        log.info(f"🔗 Hashed {filled} events stored without a place in the chain")
+
+    # --- 2. INGEST (MQTT thread) ---
+    def append(self, event: Event):
+        """
+        Links one event (id already assigned) into the chain.
+        Returns the EventBlock it completed, or None.
+        """
+        # Hash exactly what SQLite will hand back at audit time
+        if event.timestamp.tzinfo is not None:
+            event.timestamp = event.timestamp.replace(tzinfo=None)
+        if event.value is not None:
+            event.value = float(event.value)
+        with self._lock:
+            event.previous_hash = self.head_hash
+            event.event_hash = generate_event_hash(event.sensor_id, event.event_type, event.value, event.timestamp, self.head_hash)
+            self.head_hash = event.event_hash
+            self._pending.append((event.id, event.event_hash))
+            if len(self._pending) < self.block_size:
+                return None
+            return self._seal()
+
+    def _seal(self) -> EventBlock:
+        hashes = [h for _, h in self._pending]
+        root = merkle_root(hashes)
+        height = self.height + 1
+        first_id, last_id = self._pending[0][0], self._pending[-1][0]
+        block = EventBlock(
+            id=height,
+            first_event_id=first_id,
+            last_event_id=last_id,
+            event_count=len(hashes),
+            merkle_root=root,
+            previous_block_hash=self.block_hash,
+            block_hash=generate_block_hash(height, first_id, last_id, root, self.block_hash),
+            sealed_at=datetime.now(),
+        )
+        self.height, self.block_hash = height, block.block_hash
+        self.events_sealed += len(hashes)
+        self._pending = []
+        return block
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "height": self.height,
+            "head_block_hash": self.block_hash,
+            "head_event_hash": self.head_hash,
+            "pending_events": len(self._pending),
+            "events_sealed": self.events_sealed,
+        }
+
+
+# --- 3. INCLUSION PROOFS (API, async read pool) ---
+def _block_dict(block: EventBlock) -> dict:
+    return {
+        "height": block.id,
+        "first_event_id": block.first_event_id,
+        "last_event_id": block.last_event_id,
+        "event_count": block.event_count,
+        "merkle_root": block.merkle_root,
+        "previous_block_hash": block.previous_block_hash,
+        "block_hash": block.block_hash,
+        "sealed_at": block.sealed_at,
+    }
+
+
+async def inclusion_proof(db, event_id: int):
+    """
+    Proof that one event is in a sealed block, or None if the event does not exist.
+    Reads one block of hashes (an id range scan); the proof itself is O(log n).
+    """
+    event = await db.get(Event, event_id)
+    if event is None:
+        return None
+    block = await db.scalar(
+        select(EventBlock)
+        .where(EventBlock.last_event_id >= event_id, EventBlock.first_event_id <= event_id)
+        .order_by(EventBlock.last_event_id.asc())
+        .limit(1)
+    )
+    recalc_hash = generate_event_hash(event.sensor_id, event.event_type, event.value, event.timestamp, event.previous_hash)
+    response = {
+        "event_id": event.id,
+        "event_hash": event.event_hash,
+        "content_valid": recalc_hash == event.event_hash,
+    }
+    if block is None:
+        response["status"] = "PENDING"
+        response["message"] = "Event is not sealed into a block yet."
+        return response
+
+    rows = (await db.execute(
+        select(Event.id, Event.event_hash)
+        .where(Event.id >= block.first_event_id, Event.id <= block.last_event_id)
+        .order_by(Event.id.asc())
+    )).all()
+    if len(rows) != block.event_count:
+        # Retention pruned (or the writer dropped) part of this block: the root cannot be rebuilt
+        response["status"] = "PRUNED"
+        response["block"] = _block_dict(block)
+        return response
+
+    index = next(i for i, row in enumerate(rows) if row.id == event_id)
+    proof = merkle_proof([row.event_hash for row in rows], index)
+    proof_valid = verify_merkle_proof(event.event_hash, proof, block.merkle_root)
+    header_valid = generate_block_hash(
+        block.id, block.first_event_id, block.last_event_id, block.merkle_root, block.previous_block_hash
+    ) == block.block_hash
+    head = await db.scalar(select(EventBlock).order_by(EventBlock.id.desc()).limit(1))
+
+    response.update(
+        status="VALID" if response["content_valid"] and proof_valid and header_valid else "INVALID",
+        leaf_index=index,
+        proof=proof,
+        proof_valid=proof_valid,
+        block=_block_dict(block),
+        header_valid=header_valid,
+        head={"height": head.id, "block_hash": head.block_hash},
+    )
+    return response
+
+
+# Global Instance
+event_ledger = EventLedger(block_size=settings.LEDGER_BLOCK_SIZE)
@@ -1,27 +1,34 @@
-import os
-from openai import OpenAI
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from openai import AsyncOpenAI
 from app.config import settings
 from app.services.state import grid_state
+from app.logger import get_logger
 
-# Initialize Client safely
+log = get_logger()
+
+# Initialize Client safely (OPENAI_BASE_URL lets us point at mock_llm_server.py)
 client = None
 if settings.OPENAI_API_KEY and not settings.USE_MOCK_LLM:
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.LLM_TIMEOUT_SEC,
+        )
     except Exception as e:
-        print(f"⚠️ OpenAI Client Init Failed: {e}")
+        log.error(f"⚠️ OpenAI Client Init Failed: {e}")
 
-def ask_grid_sentinel(user_question: str):
-    """
-    Injects Live Grid Data into the AI Context.
-    """
-    
-    # 1. GATHER LIVE CONTEXT (The "Retrieval" part)
-    # We pull raw numbers from the Digital Twin memory
-    total_load = sum(grid_state.smart_meters.values())
+
+# --- 1. CONTEXT (The "Retrieval" part) ---
+def build_context() -> dict:
+    """Raw numbers from the Digital Twin memory, injected into the prompt."""
+    total_load = grid_state.total_meter_load
     theft_amt = grid_state.check_for_theft()
-    
-    context_data = {
+
+    return {
         "transformer_load_amps": f"{grid_state.transformer_current} A",
         "household_load_amps": f"{total_load} A",
         "theft_detected": "YES" if theft_amt > 0.5 else "NO",
@@ -29,25 +36,36 @@ def ask_grid_sentinel(user_question: str):
         "system_status": "CRITICAL" if theft_amt > 0.5 else "NOMINAL"
     }
 
-    # 2. MOCK MODE (The Safety Net)
-    # If internet is down, return this canned response so the demo doesn't crash.
-    if settings.USE_MOCK_LLM or not client:
-        return (
-            f"⚡ [MOCK AI]: I am operating in Offline Mode. \n"
-            f"Current Transformer Load: {context_data['transformer_load_amps']}. \n"
-            f"Theft Status: {context_data['theft_detected']}. \n"
-            f"I received your question: '{user_question}' - but cannot process it without an API Key."
-        )
 
-    # 3. REAL AI MODE (The Magic)
+def _quantize(value: float) -> float:
+    step = settings.LLM_SNAPSHOT_STEP_AMPS
+    return round(round(value / step) * step, 3)
+
+
+def cache_key(question: str) -> tuple:
+    """
+    Normalized question + quantized grid snapshot. Two questions that only
+    differ in case / spacing / trailing punctuation, asked while the grid
+    is in the same state, get the same answer.
+    """
+    normalized = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+    snapshot = (
+        _quantize(grid_state.transformer_current),
+        _quantize(grid_state.total_meter_load),
+        _quantize(grid_state.check_for_theft()),
+    )
+    return normalized, snapshot
+
+
+def _system_prompt(context_data: dict) -> str:
     # We construct a "Persona" for the AI.
-    system_prompt = f"""
+    return f"""
     You are 'Sentinel', an elite autonomous grid protection AI.
-    
+
     --- LIVE TELEMETRY ---
     {context_data}
     ----------------------
-    
+
     Directives:
     1. Answer the user's question based STRICTLY on the Live Telemetry above.
     2. If 'theft_detected' is YES, start your response with "🚨 SECURITY ALERT:".
@@ -55,15 +73,205 @@ def ask_grid_sentinel(user_question: str):
     4. Do not hallucinate data not present in the telemetry.
     """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Or gpt-4o if you have budget
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_question}
-            ],
-            temperature=0.3 # Low temperature = More factual, less creative
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"⚠️ AI Error: {str(e)}"
\ No newline at end of file
+
+def _mock_answer(context_data: dict, user_question: str) -> str:
+    # If internet is down, return this canned response so the demo doesn't crash.
+    return (
+        f"⚡ [MOCK AI]: I am operating in Offline Mode. \n"
+        f"Current Transformer Load: {context_data['transformer_load_amps']}. \n"
+        f"Theft Status: {context_data['theft_detected']}. \n"
+        f"I received your question: '{user_question}' - but cannot process it without an API Key."
+    )
+
+
+# --- 2. ASYNC GATEWAY ---
+class _Completion:
+    """
+    One upstream completion. The producer task appends chunks; every asker
+    (the first one and any coalesced duplicates) replays them as they arrive.
+    """
+    __slots__ = ("chunks", "done", "failed", "changed")
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.failed = False
+        self.changed = asyncio.Event()
+
+    def push(self, text: str):
+        self.chunks.append(text)
+        self._wake()
+
+    def finish(self, failed=False):
+        self.done = True
+        self.failed = failed
+        self._wake()
+
+    def _wake(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def replay(self):
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            await self.changed.wait()
+
+
+class GridGPT:
+    """
+    Async LLM front door for /chat/ask and /chat/stream.
+
+    - At most LLM_MAX_CONCURRENCY upstream calls at once (others wait).
+    - Answers cached for LLM_CACHE_TTL_SEC per (question, grid snapshot).
+    - Identical questions in flight share one upstream call.
+    - Upstream calls run in their own task, so a client disconnecting
+      mid-stream does not cancel the answer for everyone else.
+    """
+
+    def __init__(self, max_concurrency=4, cache_ttl=30.0, cache_size=256):
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # key -> (expires_at, answer)
+        self._inflight = {}             # key -> _Completion
+        self._tasks = set()             # Strong refs so producer tasks are not GC'd
+        self._loop = None
+        self._semaphore = None
+
+        # --- COUNTERS ---
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def _bind_loop(self):
+        # asyncio primitives belong to one loop (tests / scripts may start several)
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+
+    # --- CACHE ---
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key, answer: str):
+        self._cache[key] = (time.monotonic() + self.cache_ttl, answer)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # --- PUBLIC API ---
+    async def stream(self, question: str, meta: dict = None):
+        """
+        Yields the answer in pieces (tokens when live, one piece otherwise).
+        'meta', if given, receives {"source": MOCK|CACHE|COALESCED|UPSTREAM}.
+        """
+        self._bind_loop()
+        self.requests += 1
+        meta = meta if meta is not None else {}
+        context_data = build_context()
+
+        # MOCK MODE (The Safety Net)
+        if settings.USE_MOCK_LLM or not client:
+            meta["source"] = "MOCK"
+            yield _mock_answer(context_data, question)
+            return
+
+        key = cache_key(question)
+        answer = self._cached(key)
+        if answer is not None:
+            self.cache_hits += 1
+            meta["source"] = "CACHE"
+            yield answer
+            return
+
+        completion = self._inflight.get(key)
+        if completion is not None:
+            self.coalesced += 1
+            meta["source"] = "COALESCED"
+        else:
+            meta["source"] = "UPSTREAM"
+            completion = self._inflight[key] = _Completion()
+            task = asyncio.create_task(self._produce(key, question, context_data, completion))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        async for chunk in completion.replay():
+            yield chunk
+
+    async def ask(self, question: str):
+        """Whole answer at once. Returns (answer, source)."""
+        meta = {}
+        parts = [chunk async for chunk in self.stream(question, meta)]
+        return "".join(parts), meta["source"]
+
+    # --- REAL AI MODE (The Magic) ---
+    async def _produce(self, key, question: str, context_data: dict, completion: _Completion):
+        try:
+            async with self._semaphore:
+                self.upstream_calls += 1
+                response = await client.chat.completions.create(
+                    model=settings.LLM_MODEL,
+                    messages=[
+                        {"role": "system", "content": _system_prompt(context_data)},
+                        {"role": "user", "content": question}
+                    ],
+                    temperature=0.3, # Low temperature = More factual, less creative
+                    stream=True,
+                )
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        completion.push(chunk.choices[0].delta.content)
+            self._store(key, "".join(completion.chunks))
+            completion.finish()
+        except Exception as e:
+            self.upstream_errors += 1
+            log.error(f"⚠️ AI Error: {e}")
+            completion.push(f"⚠️ AI Error: {str(e)}")
+            completion.finish(failed=True)
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "MOCK" if settings.USE_MOCK_LLM or not client else "LIVE_OPENAI",
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "in_flight": len(self._inflight),
+            "cache_entries": len(self._cache),
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+# Global Instance
+grid_gpt = GridGPT(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    cache_ttl=settings.LLM_CACHE_TTL_SEC,
+    cache_size=settings.LLM_CACHE_SIZE,
+)
+
+
+async def ask_grid_sentinel(user_question: str) -> str:
+    """
+    Injects Live Grid Data into the AI Context.
+    """
+    answer, _ = await grid_gpt.ask(user_question)
+    return answer
@@ -0,0 +1,307 @@
+import threading
+import time
+from bisect import bisect_left
+from app.config import settings
+from app.logger import get_logger
+
+log = get_logger()
+
+# Bucket upper edges in seconds
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---------------------------------------------------------
+# 1. METRIC TYPES
+# ---------------------------------------------------------
+class Counter:
+    """Monotonic count per label combination."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. observe() is a bisect plus two adds,
+    no allocation, so it is cheap enough for the per-message path.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=STAGE_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(labels)
+        self._series = {}   # label_values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def observe_many(self, values: dict):
+        """{label_value: seconds} for a single-label histogram, under one lock acquire."""
+        buckets = self.buckets
+        with self._lock:
+            for label_value, value in values.items():
+                series = self._series.get((label_value,))
+                if series is None:
+                    series = self._series[(label_value,)] = [0] * (len(buckets) + 1) + [0.0]
+                series[bisect_left(buckets, value)] += 1
+                series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for edge, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.label_names, label_values, f'le="{_number(edge)}"'), cumulative
+            yield f"{self.name}_sum", _labels(self.label_names, label_values), series[-1]
+            yield f"{self.name}_count", _labels(self.label_names, label_values), cumulative
+
+
+# ---------------------------------------------------------
+# 2. REGISTRY + PROMETHEUS TEXT FORMAT
+# ---------------------------------------------------------
+class MetricsRegistry:
+    """
+    Holds every metric and renders them in Prometheus text format (v0.0.4).
+    Service stats() dicts are exposed as gauges at scrape time, so they cost
+    nothing on the hot path.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []   # (prefix, fn, label)
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=STAGE_BUCKETS, labels=()) -> Histogram:
+        metric = Histogram(name, help_text, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def expose_stats(self, prefix: str, fn, label: str = None):
+        """
+        Publishes the numeric fields of a stats() dict as '<prefix>_<field>' gauges.
+        With 'label', fn() returns {label_value: stats_dict} (e.g. per channel).
+        """
+        self._collectors.append((prefix, fn, label))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+
+        for prefix, fn, label in self._collectors:
+            try:
+                stats = fn()
+            except Exception as e:
+                log.error(f"⚠️ Metrics collector '{prefix}' failed: {e}")
+                continue
+            groups = stats.items() if label else [(None, stats)]
+            gauges = {}
+            for label_value, fields in groups:
+                for field, value in fields.items():
+                    if isinstance(value, bool):
+                        value = int(value)
+                    if not isinstance(value, (int, float)):
+                        continue
+                    labels = _labels((label,), (label_value,)) if label else ""
+                    gauges.setdefault(f"{prefix}_{field}", []).append(f"{prefix}_{field}{labels} {_number(value)}")
+            for name, samples in gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------
+# 3. INGEST INSTRUMENTATION (per MQTT message)
+# ---------------------------------------------------------
+class IngestMetrics:
+    """
+    Counters + stage histograms for process_message().
+
+    Counters are always updated. Stage histograms are recorded for every
+    message while the measured bookkeeping cost stays under
+    METRICS_OVERHEAD_BUDGET_US; above it, only every Nth message is timed
+    (N doubles until the average is back under budget, and halves again
+    when there is plenty of headroom).
+    """
+
+    WINDOW = 1024       # Messages between budget checks
+    MAX_SAMPLE_EVERY = 64
+
+    def __init__(self, registry: MetricsRegistry, budget_us: float = 20.0):
+        self.registry = registry
+        self.budget = budget_us / 1e6
+        self.sample_every = 1
+        self._seen = 0
+        self._window_cost = 0.0
+        self._window_count = 0
+        self.last_overhead_us = 0.0
+
+        self.messages = registry.counter("grid_ingest_messages_total", "MQTT messages processed", ("device_type",))
+        self.rejected = registry.counter("grid_ingest_rejected_total", "MQTT messages rejected", ("reason",))
+        self.events = registry.counter("grid_events_total", "Events raised by the ingest path", ("event_type",))
+        self.stages = registry.histogram("grid_ingest_stage_seconds", "Time per ingest stage", STAGE_BUCKETS, ("stage",))
+
+    def start(self):
+        """Returns a dict to collect stage timings into, or None if this message is not sampled."""
+        if not self.registry.enabled:
+            return None
+        self._seen += 1
+        return {} if self._seen % self.sample_every == 0 else None
+
+    def finish(self, device_type: str, cached: list, timings: dict = None):
+        """'cached' = the message's [(kind, row_dict)] from the hot cache step."""
+        if not self.registry.enabled:
+            return
+        started = time.perf_counter()
+        self.messages.inc(device_type)
+        for kind, data in cached:
+            if kind == "alert":
+                self.events.inc(data["event_type"])
+        if timings:
+            self.stages.observe_many(timings)
+        self._account(time.perf_counter() - started)
+
+    def reject(self, reason: str):
+        if self.registry.enabled:
+            self.rejected.inc(reason)
+
+    def _account(self, cost: float):
+        self._window_cost += cost
+        self._window_count += 1
+        if self._window_count < self.WINDOW:
+            return
+        average = self._window_cost / self._window_count
+        self.last_overhead_us = average * 1e6
+        if average > self.budget and self.sample_every < self.MAX_SAMPLE_EVERY:
+            self.sample_every *= 2
+            log.warning(f"📉 Metrics overhead {self.last_overhead_us:.1f}us/msg over budget, timing 1 in {self.sample_every} messages")
+        elif average < self.budget / 4 and self.sample_every > 1:
+            self.sample_every //= 2
+        self._window_cost = 0.0
+        self._window_count = 0
+
+    def stats(self) -> dict:
+        return {
+            "overhead_us_per_msg": round(self.last_overhead_us, 3),
+            "overhead_budget_us": self.budget * 1e6,
+            "stage_sample_every": self.sample_every,
+        }
+
+
+# ---------------------------------------------------------
+# 4. HTTP INSTRUMENTATION (pure ASGI, no BaseHTTPMiddleware overhead)
+# ---------------------------------------------------------
+def _route_label(scope) -> str:
+    """
+    Full template of the matched route, e.g. /api/history/alerts. The route in
+    the scope only knows its path inside its router, so the mount / include
+    prefix is whatever part of the request path its pattern does not cover.
+    Unmatched paths share one label so random URLs cannot blow up the series count.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    path = scope["path"]
+    regex = getattr(route, "path_regex", None)
+    if regex is None or regex.match(path):
+        return template
+    cut = path.find("/", 1)
+    while cut != -1:
+        if regex.match(path[cut:]):
+            return path[:cut] + template
+        cut = path.find("/", cut + 1)
+    return template
+
+
+class MetricsMiddleware:
+    """Counts requests and times them per route template (not per raw URL)."""
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = _route_label(scope)
+            http_requests.inc(scope["method"], path, status["code"])
+            http_seconds.observe(time.perf_counter() - started, scope["method"], path)
+
+
+# Global Instances
+metrics = MetricsRegistry(enabled=settings.METRICS_ENABLED)
+ingest_metrics = IngestMetrics(metrics, budget_us=settings.METRICS_OVERHEAD_BUDGET_US)
+db_flush_seconds = metrics.histogram("grid_db_flush_seconds", "Write-behind commit time per batch", HTTP_BUCKETS)
+db_flush_rows = metrics.counter("grid_db_rows_written_total", "Rows committed by the DB writer")
+http_requests = metrics.counter("grid_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_seconds = metrics.histogram("grid_http_request_seconds", "HTTP request latency", HTTP_BUCKETS, ("method", "route"))
+metrics.expose_stats("grid_ingest_metrics", ingest_metrics.stats)
@@ -1,61 +1,115 @@
 import paho.mqtt.client as mqtt
 import json
+import threading
 import time
 from app.config import settings
 from app.schemas import SensorData
-from app.database import SessionLocal
 from app.models import Reading, Event
 from app.services.physics import physics_engine
-from app.services.audio import audio_engine
-from app.services.state import grid_state
+from app.services.audio import audio_engine, MIN_SAMPLES
+from app.services.state import grid_state, row_to_dict, READING_FIELDS, EVENT_FIELDS
 from app.services.prediction import oracle
+from app.services.registry import sensor_registry
+from app.services.writer import db_writer, id_sequence
+from app.services.ledger import event_ledger
+from app.services.aging import aging_engine
+from app.services.incidents import incident_engine, ALERT_RULES, OPENED, CLEARED
+from app.services.rollups import rollup_engine
+from app.services.broadcast import telemetry_hub
+from app.services.topology import topology
+from app.services.metrics import ingest_metrics
 from app.logger import get_logger 
 from pydantic import ValidationError
-
-# --- NEW: IMPORT SMS SERVICE ---
-from app.services.sms import send_sms_alert
+from pydantic_core import from_json
+from app.services.dispatch import alert_dispatcher, MqttTransport
 
 # Initialize Logger
 log = get_logger()
 
 # --- 1. GLOBAL MEMORY ---
-latest_readings = {
-    "TX_MAIN_01": 0.0,
-    "HOUSE_01": 0.0
-}
-THEFT_THRESHOLD = 0.30  # 300mA difference triggers alert
+# Per-sensor state (latest current, physics memory) lives in sensor_registry,
+# the feeder tree used for energy balance lives in topology.
+# Alert thresholds (raise / clear, hold times) live in incidents.ALERT_RULES
 
 # --- 2. DEFINE CALLBACKS ---
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         log.info(f"✅ Connected to MQTT Broker: {settings.MQTT_BROKER}")
-        client.subscribe(settings.MQTT_TOPIC)
-        print(f"📡 LISTENING ON TOPIC: {settings.MQTT_TOPIC}")
+        # HTTP-only workers keep a publish-only connection (grid control commands)
+        if (userdata or {}).get("subscribe", True):
+            client.subscribe(settings.MQTT_TOPIC)
+            log.info(f"📡 LISTENING ON TOPIC: {settings.MQTT_TOPIC}")
     else:
         log.error(f"❌ Connection Failed with code {rc}")
 
 def on_message(client, userdata, msg):
-    db = SessionLocal()
+    process_message(msg.payload)
+
+# The audio flusher thread also writes alerts: one ingest step at a time
+_ingest_lock = threading.Lock()
+
+def process_message(payload: bytes, timings: dict = None, now: float = None) -> bool:
+    """
+    The full ingest pipeline for one telemetry payload (no broker needed).
+    'timings', if given, receives the seconds spent per stage
+    (decode, validate, prediction, physics, audio, db). Live ingest decodes
+    and validates in one pass, timed as 'decode'.
+    'now' replaces the wall clock for the predictor (replay time-warp).
+    Returns False if the message was rejected.
+    """
+    with _ingest_lock:
+        return _process_message(payload, timings, now)
+
+def _process_message(payload: bytes, timings: dict, now: float) -> bool:
+    # Rows produced by this message. Persisted by the write-behind writer.
+    rows = []
+    clock = time.perf_counter
+    # Stage timings go to the caller's dict and/or the /metrics histograms
+    stage_times = timings if timings is not None else ingest_metrics.start()
     try:
-        payload = msg.payload.decode()
-        data_dict = json.loads(payload)
-        
-        # 1. Validate & Parse
-        clean_data = SensorData(**data_dict)
+        # 1. Decode + Validate in one pass, straight from the payload bytes
+        t_start = clock()
+        t_decoded = None
+        try:
+            if timings is not None:
+                # Replay: JSON parsing and schema validation as two timed steps, so a
+                # schema regression is not mistaken for a decode one
+                try:
+                    data = from_json(payload)
+                except ValueError:
+                    SensorData.model_validate_json(payload)  # Raises the usual json_invalid error
+                    raise
+                t_decoded = clock()
+                clean_data = SensorData.model_validate(data)
+            else:
+                clean_data = SensorData.model_validate_json(payload)
+        except ValidationError as e:
+            reject_payload(e)
+            return False
+        if stage_times is not None:
+            if t_decoded is None:
+                stage_times["decode"] = clock() - t_start
+            else:
+                stage_times["decode"] = t_decoded - t_start
+                stage_times["validate"] = clock() - t_decoded
         
         # ---------------------------------------------------------
         # 2. UPDATE MEMORY (CRITICAL STEP)
         # ---------------------------------------------------------
-        if clean_data.sensor_id in latest_readings:
-            latest_readings[clean_data.sensor_id] = clean_data.current
+        current_time_sec = now if now is not None else time.time()
+        sensor = sensor_registry.get(clean_data.sensor_id)
+        sensor.device_type = clean_data.device_type
+        sensor.current = clean_data.current
             
-        # Perform the Math IMMEDIATELY
-        tx_amps = latest_readings["TX_MAIN_01"]
-        house_amps = latest_readings["HOUSE_01"]
-        diff = tx_amps - house_amps
+        # Perform the Math IMMEDIATELY: O(depth) energy balance update
+        balance_nodes = topology.update(clean_data.sensor_id, clean_data.current)
         
         if clean_data.device_type == "TRANSFORMER":
-            print(f"📊 MONITOR: Tx({tx_amps:.2f}A) - House({house_amps:.2f}A) = Diff({diff:.2f}A)")
+            for node in balance_nodes[:1]:
+                # %-style args: nothing is formatted when the rate limiter drops the line
+                log.info("📊 MONITOR: %s(%.2fA) - Meters(%.2fA) = Diff(%.2fA)",
+                         node.node_id, node.measured, node.metered_sum, node.imbalance,
+                         extra={"key": f"monitor:{node.node_id}"})
 
         # ---------------------------------------------------------
         # 3. PROCESS DEVICE SPECIFIC LOGIC (AI / Physics)
@@ -66,100 +120,247 @@ def on_message(client, userdata, msg):
             grid_state.update_transformer(clean_data.current)
             
             # --- AI PREDICTION LAYER ---
-            current_time_sec = time.time()
-            oracle.add_reading(clean_data.temperature, current_time_sec)
-            prediction_mins = oracle.predict_failure_time(limit_temp=100.0)
+            t_stage = clock()
+            oracle.add_reading(clean_data.sensor_id, clean_data.temperature, current_time_sec)
+            prediction_mins = oracle.predict_failure_time(clean_data.sensor_id, limit_temp=100.0)
+            t_predicted = clock()
             
             if prediction_mins:
-                log.warning(f"🔮 PREDICTION: Critical Failure in {prediction_mins} minutes")
+                log.warning("🔮 PREDICTION: Critical Failure in %s minutes (%s)", prediction_mins, clean_data.sensor_id,
+                            extra={"key": f"prediction:{clean_data.sensor_id}"})
 
             # --- PHYSICS & AUDIO ---
             aging_factor = physics_engine.calculate_aging_factor(clean_data.temperature)
-            rate_of_rise = physics_engine.detect_thermal_shock(clean_data.temperature, clean_data.timestamp)
-            distortion = 0.0
-            if clean_data.audio_waveform:
-                distortion = audio_engine.analyze_health(clean_data.audio_waveform)
+            # Cumulative loss of life: buffered here, integrated fleet-wide in one array pass
+            aging_row = aging_engine.record(sensor.slot, clean_data.temperature, current_time_sec)
+            if aging_row is not None:
+                rows.append(aging_row)
+            rate_of_rise = physics_engine.detect_thermal_shock(sensor, clean_data.temperature, clean_data.timestamp)
+            t_physics = clock()
+            # Waveforms are micro-batched: the scores that come back may include
+            # packets of other transformers queued just before this one
+            waveform = clean_data.audio_waveform
+            if waveform is not None and len(waveform) >= MIN_SAMPLES:
+                audio_scores = audio_engine.submit(clean_data.sensor_id, waveform, clean_data.timestamp, current_time_sec)
+            else:
+                audio_scores = [(clean_data.sensor_id, clean_data.timestamp, current_time_sec, 0.0)]
+            if stage_times is not None:
+                stage_times["prediction"] = t_predicted - t_stage
+                stage_times["physics"] = t_physics - t_predicted
+                stage_times["audio"] = clock() - t_physics
 
             # --- ALERTS & SELF-HEALING ---
-            
+            # Every check feeds the incident state machine; only a reading that
+            # opens an incident writes an Event and notifies (hysteresis + hold times)
+
             # A. AGING CHECK
-            if aging_factor > 4.0:
-                log.critical("🚨 ALERT: ACCELERATED AGING DETECTED!")
-                db.add(Event(sensor_id=clean_data.sensor_id, event_type="CRITICAL_AGING", value=aging_factor, message="Aging High"))
-                
+            transition = incident_engine.observe("CRITICAL_AGING", clean_data.sensor_id, aging_factor, current_time_sec)
+            if transition == OPENED:
+                log.critical("🚨 ALERT: ACCELERATED AGING DETECTED! (%s)", clean_data.sensor_id, extra={"key": f"aging:{clean_data.sensor_id}"})
+                rows.append(Event(sensor_id=clean_data.sensor_id, event_type="CRITICAL_AGING", value=aging_factor, message="Aging High"))
+            elif transition == CLEARED:
+                log.info("✅ Aging back to normal (%s)", clean_data.sensor_id)
+
             # B. THERMAL SHOCK CHECK
-            if rate_of_rise > 2.0 and clean_data.temperature > 29.0:
-                log.critical("🚨 ALERT: THERMAL SHOCK! POSSIBLE SHORT CIRCUIT.")
-                db.add(Event(sensor_id=clean_data.sensor_id, event_type="THERMAL_SHOCK", value=rate_of_rise, message="Rapid Heat"))
-                
-                # Cut Power
-                client.publish("grid/control", json.dumps({"command": "OFF"}))
-                print("⚡ SAFETY CUT TRIGGERED: THERMAL SHOCK")
+            shock = rate_of_rise if clean_data.temperature > 29.0 else 0.0
+            transition = incident_engine.observe("THERMAL_SHOCK", clean_data.sensor_id, shock, current_time_sec)
+            if shock > ALERT_RULES["THERMAL_SHOCK"].raise_at:
+                # Cut Power on EVERY shock reading: the relay may have been restored while
+                # the incident is still open. OFF is idempotent; only Event + SMS are coalesced
+                alert_dispatcher.dispatch("control", {"topic": "grid/control", "payload": {"command": "OFF"}})
+                log.warning("⚡ SAFETY CUT TRIGGERED: THERMAL SHOCK", extra={"key": f"cut:{clean_data.sensor_id}"})
+            if transition == OPENED:
+                log.critical("🚨 ALERT: THERMAL SHOCK! POSSIBLE SHORT CIRCUIT. (%s)", clean_data.sensor_id, extra={"key": f"shock:{clean_data.sensor_id}"})
+                rows.append(Event(sensor_id=clean_data.sensor_id, event_type="THERMAL_SHOCK", value=rate_of_rise, message="Rapid Heat"))
                 
                 # ---> SEND SMS ALERT
-                send_sms_alert(f"Thermal Shock! Temp rose rapidly to {clean_data.temperature}C. Power Cut Triggered.")
+                alert_dispatcher.dispatch("sms", f"Thermal Shock! Temp rose rapidly to {clean_data.temperature}C. Power Cut Triggered.")
+            elif transition == CLEARED:
+                log.info("✅ Thermal shock over (%s)", clean_data.sensor_id)
 
             # C. PHYSICAL TAMPERING CHECK
-            # Threshold set to 0.6 to catch the coin scratch (1.0) but ignore noise (0.3)
-            if clean_data.vibration > 0.6:
-                log.critical(f"🔨 TAMPERING DETECTED! Level: {clean_data.vibration}")
-                db.add(Event(
+            # Raise at 0.6 to catch the coin scratch (1.0) but ignore noise (0.3), clear under 0.4
+            transition = incident_engine.observe("PHYSICAL_TAMPERING", clean_data.sensor_id, clean_data.vibration, current_time_sec)
+            if transition == OPENED:
+                log.critical("🔨 TAMPERING DETECTED! Level: %s (%s)", clean_data.vibration, clean_data.sensor_id,
+                             extra={"key": f"tamper:{clean_data.sensor_id}"})
+                rows.append(Event(
                     sensor_id=clean_data.sensor_id, 
                     event_type="PHYSICAL_TAMPERING", 
                     value=clean_data.vibration, 
                     message="Vibration detected (Hammering/Sawing)"
                 ))
-                print("🚨 ALERT TRIGGERED: PHYSICAL TAMPERING DETECTED!")
                 
                 # ---> SEND SMS ALERT
-                send_sms_alert(f"Physical Tampering Detected! Vibration Level: {clean_data.vibration}")
+                alert_dispatcher.dispatch("sms", f"Physical Tampering Detected! Vibration Level: {clean_data.vibration}")
+            elif transition == CLEARED:
+                log.info("✅ Tampering stopped (%s)", clean_data.sensor_id)
 
             # D. AUDIO HARMONICS CHECK
-            if distortion > 3.0:
-                log.critical("🚨 ALERT: AUDIO FAILURE (HARMONICS)!")
-                db.add(Event(sensor_id=clean_data.sensor_id, event_type="AUDIO_FAIL", value=distortion, message="Bad Sound"))
+            check_audio(audio_scores, rows)
             
             # Save Transformer Reading
-            db.add(Reading(
+            rows.append(Reading(
+                sensor_id=clean_data.sensor_id,
+                timestamp=clean_data.timestamp,
                 temperature=clean_data.temperature,
                 current=clean_data.current,
                 vibration=clean_data.vibration,
                 predicted_failure_min=prediction_mins
             ))
 
+            # Keep the 1m / 1h chart rollups up to date
+            closed_buckets = rollup_engine.add(
+                clean_data.sensor_id, clean_data.timestamp,
+                clean_data.temperature, clean_data.current, clean_data.vibration,
+            )
+            if closed_buckets:
+                rows.append(closed_buckets)
+
         elif clean_data.device_type == "METER":
             grid_state.update_meter(clean_data.sensor_id, clean_data.current)
 
         # ---------------------------------------------------------
-        # 4. THEFT DETECTION
+        # 4. THEFT DETECTION (per transformer / feeder touched by this reading)
         # ---------------------------------------------------------
-        if diff > THEFT_THRESHOLD:
-            log.warning(f"🚫 THEFT DETECTED: {diff:.2f} Amps missing!")
-            print(f"🚨 ALERT TRIGGERED: Theft of {diff:.2f}A")
+        for node in balance_nodes:
+            diff = node.imbalance
+            if diff is None:
+                continue
+            transition = incident_engine.observe("THEFT_DETECTED", node.node_id, diff, current_time_sec)
+            if transition == CLEARED:
+                log.info("✅ Energy balance restored on %s", node.node_id)
+            if transition != OPENED:
+                continue
+
+            log.warning("🚫 THEFT DETECTED on %s: %.2f Amps missing!", node.node_id, diff, extra={"key": f"theft:{node.node_id}"})
             
             new_alert = Event(
-                sensor_id="GRID_SYSTEM",
+                sensor_id=node.node_id,
                 event_type="THEFT_DETECTED",
                 value=diff,
-                message=f"{diff:.2f}A unaccounted for."
+                message=f"{diff:.2f}A unaccounted for downstream of {node.node_id}."
             )
-            db.add(new_alert)
+            rows.append(new_alert)
             
             # ---> SEND SMS ALERT
-            send_sms_alert(f"Power Theft Detected! {diff:.2f}A stolen. Check Grid Line 1.")
+            alert_dispatcher.dispatch("sms", f"Power Theft Detected! {diff:.2f}A stolen. Check {node.kind.title()} {node.node_id}.")
+
+        # ---------------------------------------------------------
+        # 5. HOT CACHE + LIVE DASHBOARDS
+        # ---------------------------------------------------------
+        # Must run before submit(): after that the writer thread owns the rows
+        cached = cache_rows(clean_data.timestamp, rows)
+        # Opened / closed incidents (and, every INCIDENT_PERSIST_SEC, the running ones)
+        incident_row = incident_engine.collect(current_time_sec)
+        if incident_row is not None:
+            rows.append(incident_row)
+        if telemetry_hub.has_subscribers:
+            publish_live(cached)
 
-        db.commit()
+        t_stage = clock()
+        db_writer.submit(rows)
+        if stage_times is not None:
+            stage_times["db"] = clock() - t_stage
+        ingest_metrics.finish(clean_data.device_type, cached, stage_times)
+        return True
 
     except Exception as e:
-        log.error(f"⚠️ Message Error: {e}")
-    finally:
-        db.close()
+        ingest_metrics.reject(type(e).__name__)
+        log.error(f"⚠️ Message Error: {e}", extra={"key": f"error:{type(e).__name__}"})
+        return False
+
+def reject_payload(error: ValidationError):
+    """
+    Malformed payloads are counted per reason (/metrics). The log line is
+    rate limited per reason, so a misbehaving device cannot flood the log
+    with pydantic reports.
+    """
+    first = error.errors(include_url=False, include_context=False, include_input=False)[0]
+    reason = first["type"]
+    ingest_metrics.reject(reason)
+    field = ".".join(str(part) for part in first["loc"]) or "payload"
+    log.warning("⚠️ Rejected payload [%s] %s: %s", reason, field, first["msg"], extra={"key": f"reject:{reason}"})
+
+def check_audio(audio_scores, rows):
+    """Feeds distortion scores [(sensor_id, timestamp, time_sec, score)] to AUDIO_FAIL."""
+    for audio_sensor, audio_ts, audio_time_sec, distortion in audio_scores:
+        transition = incident_engine.observe("AUDIO_FAIL", audio_sensor, distortion, audio_time_sec)
+        if transition == OPENED:
+            log.critical("🚨 ALERT: AUDIO FAILURE (HARMONICS)! (%s)", audio_sensor, extra={"key": f"audio:{audio_sensor}"})
+            rows.append(Event(sensor_id=audio_sensor, event_type="AUDIO_FAIL", value=distortion, message="Bad Sound", timestamp=audio_ts))
+        elif transition == CLEARED:
+            log.info("✅ Audio back to normal (%s)", audio_sensor)
+
+def flush_audio(now: float = None) -> int:
+    """
+    Scores the waveforms still waiting in the audio micro-batch and writes
+    their alerts (traffic stopped, shutdown, end of a replay).
+    'now' is the incident clock (epoch seconds). Returns the waveforms scored.
+    """
+    with _ingest_lock:
+        audio_scores = audio_engine.drain()
+        if not audio_scores:
+            return 0
+        rows = []
+        check_audio(audio_scores, rows)
+        cached = cache_rows(None, rows)
+        incident_row = incident_engine.collect(now if now is not None else time.time())
+        if incident_row is not None:
+            rows.append(incident_row)
+        if cached and telemetry_hub.has_subscribers:
+            publish_live(cached)
+        db_writer.submit(rows)
+        return len(audio_scores)
+
+def cache_rows(timestamp, rows):
+    """
+    Assigns ids/timestamps (events without one get 'timestamp') to this
+    message's rows, links events into the hash chain and copies them into
+    the twin's hot cache. Returns [(kind, row_dict)] for the live feed.
+    """
+    cached, sealed = [], []
+    for row in rows:
+        if isinstance(row, Reading):
+            row.id = id_sequence.next(Reading)
+            data = row_to_dict(row, READING_FIELDS)
+            grid_state.record_reading(data)
+            cached.append(("reading", data))
+        elif isinstance(row, Event):
+            row.id = id_sequence.next(Event)
+            if row.timestamp is None:
+                row.timestamp = timestamp
+            incident_engine.attach(row)
+            block = event_ledger.append(row)
+            if block is not None:
+                sealed.append(block)
+            data = row_to_dict(row, EVENT_FIELDS)
+            grid_state.record_event(data)
+            cached.append(("alert", data))
+    # A sealed block is written in the same transaction as the event that completed it
+    rows.extend(sealed)
+    return cached
+
+def publish_live(cached):
+    """Sends this message's deltas (reading, alerts, grid totals) to live subscribers."""
+    for kind, data in cached:
+        key = data["sensor_id"] if kind == "reading" else data["event_type"]
+        telemetry_hub.publish(kind, key, data, sensor_id=data["sensor_id"])
+
+    telemetry_hub.publish("grid", "totals", {
+        "transformer_current": grid_state.transformer_current,
+        "total_load": grid_state.total_meter_load,
+        "theft_detected": grid_state.check_for_theft(),
+    })
 
 # --- 3. SETUP CLIENT ---
 mqtt_client = mqtt.Client()
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
 
+# Relay commands raised by alerts go out through the dispatcher, not inline
+alert_dispatcher.register("control", MqttTransport(mqtt_client), concurrency=settings.DISPATCH_CONTROL_CONCURRENCY)
+
 # --- 4. PUBLISH FUNCTION ---
 def publish_message(topic: str, payload: dict):
     try:
@@ -170,9 +371,48 @@ def publish_message(topic: str, payload: dict):
         log.error(f"❌ Failed to publish: {e}")
 
 # --- 5. START LOOP ---
-def start_mqtt():
+def start_mqtt(subscribe: bool = True):
     try:
+        mqtt_client.user_data_set({"subscribe": subscribe})
         mqtt_client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
         mqtt_client.loop_start()
     except Exception as e:
-        log.error(f"❌ MQTT Connection Error: {e}")
\ No newline at end of file
+        log.error(f"❌ MQTT Connection Error: {e}")
+
+def stop_mqtt():
+    try:
+        mqtt_client.loop_stop()
+        mqtt_client.disconnect()
+    except Exception as e:
+        log.error(f"❌ MQTT Shutdown Error: {e}")
+
+# --- 6. AUDIO FLUSHER ---
+# submit() only drains when the next packet arrives: when traffic stops, this
+# thread scores what is left so no AUDIO_FAIL alert waits for a packet that never comes
+_audio_stop = threading.Event()
+_audio_thread = None
+
+def _audio_flush_loop():
+    while not _audio_stop.wait(audio_engine.batch_wait):
+        if audio_engine.due():
+            try:
+                flush_audio()
+            except Exception as e:
+                log.error(f"⚠️ Audio flush error: {e}", extra={"key": "audio_flush"})
+
+def start_audio_flush():
+    global _audio_thread
+    if _audio_thread is not None and _audio_thread.is_alive():
+        return
+    _audio_stop.clear()
+    _audio_thread = threading.Thread(target=_audio_flush_loop, name="audio-flush", daemon=True)
+    _audio_thread.start()
+
+def stop_audio_flush():
+    """Stops the flusher and scores the last waveforms (call after stop_mqtt, before the writer stops)."""
+    global _audio_thread
+    _audio_stop.set()
+    if _audio_thread is not None:
+        _audio_thread.join()
+        _audio_thread = None
+    flush_audio()
\ No newline at end of file
@@ -1,22 +1,27 @@
-import numpy as np
+import math
 from app.config import settings # <-- Need this to check mode
 
 # IEEE C57.91 CONSTANTS
 HST_GRADIENT = 15000.0
+REFERENCE_HOTSPOT_K = 383.0   # 110°C: aging factor 1.0 (65°C rise insulation)
+HOTSPOT_RISE_C = 15.0         # Hot spot estimated as measured temperature + 15°C
 
 class TransformerPhysics:
-    def __init__(self):
-        self.last_temp = None
-        self.last_time = None
+    """
+    Stateless physics formulas. Per-sensor memory (last_temp / last_time)
+    lives in the SensorState passed in by the caller.
+    """
 
     def calculate_aging_factor(self, temp_c: float) -> float:
         """
         Calculates Aging Acceleration Factor (FAA).
+        Instantaneous value for the alert check; the cumulative aging of the
+        whole fleet is integrated in batches by the AgingEngine (aging.py).
         """
-        hottest_spot_temp_k = temp_c + 273.0 + 15.0
+        hottest_spot_temp_k = temp_c + 273.0 + HOTSPOT_RISE_C
         
-        # Real Physics Formula
-        aging_factor = np.exp((HST_GRADIENT / 383.0) - (HST_GRADIENT / hottest_spot_temp_k))
+        # Real Physics Formula (math.exp: a Python float does not need NumPy)
+        aging_factor = math.exp((HST_GRADIENT / REFERENCE_HOTSPOT_K) - (HST_GRADIENT / hottest_spot_temp_k))
         
         # --- HACKATHON DEMO MODE ---
         if settings.DEMO_MODE and aging_factor > 1.0:
@@ -26,24 +31,24 @@ class TransformerPhysics:
             
         return round(aging_factor, 2)
 
-    def detect_thermal_shock(self, current_temp: float, timestamp) -> float:
+    def detect_thermal_shock(self, state, current_temp: float, timestamp) -> float:
         """
-        Calculates Rate of Rise (RoR).
+        Calculates Rate of Rise (RoR) for one sensor.
         """
-        if self.last_temp is None:
-            self.last_temp = current_temp
-            self.last_time = timestamp
+        if state.last_temp is None:
+            state.last_temp = current_temp
+            state.last_time = timestamp
             return 0.0
 
-        time_diff = (timestamp - self.last_time).total_seconds() / 60.0
+        time_diff = (timestamp - state.last_time).total_seconds() / 60.0
         
         if time_diff == 0:
             return 0.0
             
-        rate_of_rise = (current_temp - self.last_temp) / time_diff
+        rate_of_rise = (current_temp - state.last_temp) / time_diff
         
-        self.last_temp = current_temp
-        self.last_time = timestamp
+        state.last_temp = current_temp
+        state.last_time = timestamp
         
         return round(rate_of_rise, 3)
 
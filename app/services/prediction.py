@@ -1,61 +1,193 @@
+import threading
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from app.services.registry import sensor_registry
+
+# Column layout of the running-sum table (one row per sensor slot)
+N, SX, SY, SXX, SXY = range(5)
+
+# Re-center a sensor's time axis once its newest point is this far from the origin.
+# Keeps x*x small so the running sums do not lose float64 precision. The origin moves
+# to the newest point, so a sparse sensor (window wider than this) still rebases at
+# most once per REBASE_AFTER_SEC, not on every reading.
+REBASE_AFTER_SEC = 3600.0
 
 class Predictor:
-    def __init__(self):
-        # We need to store history to train the model on the fly
-        # X = Time (seconds), Y = Temperature
-        self.history_x = []
-        self.history_y = []
-        self.MAX_HISTORY = 60  # Keep last 60 seconds of data
+    """
+    Online least-squares time-to-failure engine.
+
+    Each sensor slot keeps a ring buffer of (time, temperature) plus the running
+    sums n, Σx, Σy, Σx², Σxy over that window. Adding a point and predicting are
+    both O(1); the sums are rebuilt from the ring once per window wrap so
+    rounding error never accumulates.
+    """
+
+    def __init__(self, registry=sensor_registry, max_history=60, initial_capacity=64):
+        # X = Time (seconds, relative to a per-sensor origin), Y = Temperature
+        self.registry = registry
+        self.MAX_HISTORY = max_history  # Keep last 60 seconds of data
+        self.MIN_POINTS = 10            # We need at least 10 points to make a decent guess
+        self.MAX_HORIZON_SEC = 3600     # Predictions further out than 1 hour are ignored
+
+        self._lock = threading.Lock()
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity: int):
+        self.history_x = np.zeros((capacity, self.MAX_HISTORY), dtype=np.float64)
+        self.history_y = np.zeros((capacity, self.MAX_HISTORY), dtype=np.float64)
+        self.head = np.zeros(capacity, dtype=np.int64)   # Next write position
+        self.count = np.zeros(capacity, dtype=np.int64)  # Points in the window
+        self.origin = np.zeros(capacity, dtype=np.float64)
+        self.sums = np.zeros((capacity, 5), dtype=np.float64)
 
-        # The AI Model
-        self.model = LinearRegression()
+    def _ensure_capacity(self, slot: int):
+        capacity = self.history_x.shape[0]
+        if slot < capacity:
+            return
+        with self._lock:
+            capacity = self.history_x.shape[0]
+            if slot < capacity:
+                return
+            # Double the storage so growth is amortized O(1)
+            new_capacity = max(capacity * 2, slot + 1)
+            old = (self.history_x, self.history_y, self.head, self.count, self.origin, self.sums)
+            self._allocate(new_capacity)
+            self.history_x[:capacity] = old[0]
+            self.history_y[:capacity] = old[1]
+            self.head[:capacity] = old[2]
+            self.count[:capacity] = old[3]
+            self.origin[:capacity] = old[4]
+            self.sums[:capacity] = old[5]
 
-    def add_reading(self, temp: float, timestamp_sec: float):
+    def add_reading(self, sensor_id: str, temp: float, timestamp_sec: float):
         """
-        Add a new data point to the training set.
+        Add a new data point to this sensor's window. O(1).
         """
-        self.history_x.append([timestamp_sec]) # Scikit needs 2D array
-        self.history_y.append(temp)
+        slot = self.registry.get(sensor_id).slot
+        self._ensure_capacity(slot)
+
+        n = int(self.count[slot])
+        if n == 0:
+            self.origin[slot] = timestamp_sec
+        x = timestamp_sec - float(self.origin[slot])
+        pos = int(self.head[slot])
+        row = self.sums[slot]
+
+        # Sliding window: take the oldest point out of the sums before overwriting it
+        if n == self.MAX_HISTORY:
+            old_x = float(self.history_x[slot, pos])
+            old_y = float(self.history_y[slot, pos])
+            row[SX] -= old_x
+            row[SY] -= old_y
+            row[SXX] -= old_x * old_x
+            row[SXY] -= old_x * old_y
+        else:
+            n += 1
+            self.count[slot] = n
+            row[N] = n
+
+        self.history_x[slot, pos] = x
+        self.history_y[slot, pos] = temp
+        row[SX] += x
+        row[SY] += temp
+        row[SXX] += x * x
+        row[SXY] += x * temp
+
+        pos = (pos + 1) % self.MAX_HISTORY
+        self.head[slot] = pos
+
+        if pos == 0 or x > REBASE_AFTER_SEC:
+            self._rebuild(slot)
+
+    def _window(self, slot: int):
+        """Returns (x, y) of one sensor in chronological order."""
+        n = int(self.count[slot])
+        order = (int(self.head[slot]) - n + np.arange(n)) % self.MAX_HISTORY
+        return self.history_x[slot, order], self.history_y[slot, order]
 
-        # Keep buffer small (sliding window)
-        if len(self.history_x) > self.MAX_HISTORY:
-            self.history_x.pop(0)
-            self.history_y.pop(0)
+    def _rebuild(self, slot: int):
+        """Moves the origin to the newest point and recomputes the sums exactly."""
+        n = int(self.count[slot])
+        newest = (int(self.head[slot]) - 1) % self.MAX_HISTORY
+        shift = float(self.history_x[slot, newest])
+        self.origin[slot] += shift
+        self.history_x[slot] -= shift
 
-    def predict_failure_time(self, limit_temp=100.0):
+        x, y = self._window(slot)
+        self.sums[slot] = (n, x.sum(), y.sum(), (x * x).sum(), (x * y).sum())
+
+    def predict_failure_time(self, sensor_id: str, limit_temp=100.0):
         """
-        Predicts how many minutes until we hit the 'limit_temp'.
+        Predicts how many minutes until this sensor hits the 'limit_temp'.
         Returns: Minutes (float) or None (if safe).
         """
-        # We need at least 10 points to make a decent guess
-        if len(self.history_x) < 10:
+        state = self.registry.peek(sensor_id)
+        if state is None or state.slot >= self.count.shape[0]:
             return None
 
-        # 1. Train the Model (Real-time Learning)
-        self.model.fit(self.history_x, self.history_y)
+        slot = state.slot
+        n, sx, sy, sxx, sxy = self.sums[slot].tolist()
+        if n < self.MIN_POINTS:
+            return None
 
-        # 2. Get the Slope (Rate of Change)
-        slope = self.model.coef_[0]
-        intercept = self.model.intercept_
+        # 1. Least squares from the running sums (same fit LinearRegression gives)
+        sxx_c = sxx - sx * sx / n
+        if sxx_c <= 0:
+            return None
+        slope = (sxy - sx * sy / n) / sxx_c
+        intercept = (sy - slope * sx) / n
 
         # If slope is negative or zero, we are cooling down (Safe)
         if slope <= 0:
             return None
 
-        # 3. Solve for Time: Y = mX + c  ->  X = (Y - c) / m
-        # predicted_time = (Target_Temp - Intercept) / Slope
-        current_time = self.history_x[-1][0]
+        # 2. Solve for Time: Y = mX + c  ->  X = (Y - c) / m
+        current_time = float(self.history_x[slot, (int(self.head[slot]) - 1) % self.MAX_HISTORY])
         predicted_timestamp = (limit_temp - intercept) / slope
-        
+
         seconds_left = predicted_timestamp - current_time
 
         # If prediction is too far in future (> 1 hour), ignore it
-        if seconds_left > 3600 or seconds_left < 0:
+        if seconds_left > self.MAX_HORIZON_SEC or seconds_left < 0:
             return None
 
         return round(seconds_left / 60.0, 1) # Return minutes
 
+    def predict_all(self, limit_temp=100.0):
+        """
+        Batch API: slope (°C/s) and minutes-to-limit for every tracked sensor
+        in one vectorized pass. Sensors without a prediction get NaN minutes.
+        Returns (slopes, minutes) indexed by registry slot.
+        """
+        total = min(len(self.registry), self.count.shape[0])
+        sums = self.sums[:total]
+        n, sx, sy, sxx, sxy = sums.T
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sxx_c = sxx - sx * sx / n
+            slopes = (sxy - sx * sy / n) / sxx_c
+            intercepts = (sy - slopes * sx) / n
+
+            last = (self.head[:total] - 1) % self.MAX_HISTORY
+            current_time = self.history_x[np.arange(total), last]
+            seconds_left = (limit_temp - intercepts) / slopes - current_time
+
+        slopes = np.where((n >= self.MIN_POINTS) & (sxx_c > 0), slopes, np.nan)
+        valid = (slopes > 0) & (seconds_left >= 0) & (seconds_left <= self.MAX_HORIZON_SEC)
+        minutes = np.where(valid, np.round(seconds_left / 60.0, 1), np.nan)
+        return slopes, minutes
+
+    def predict_fleet(self, limit_temp=100.0) -> dict:
+        """Returns {sensor_id: minutes} for every sensor heading towards 'limit_temp'."""
+        _, minutes = self.predict_all(limit_temp)
+        hits = np.flatnonzero(~np.isnan(minutes))
+        return {self.registry.by_slot(int(i)).sensor_id: float(minutes[i]) for i in hits}
+
+    def reset(self):
+        with self._lock:
+            self.head[:] = 0
+            self.count[:] = 0
+            self.origin[:] = 0.0
+            self.sums[:] = 0.0
+
 # Global Instance
-oracle = Predictor()
\ No newline at end of file
+oracle = Predictor()
@@ -0,0 +1,87 @@
+import threading
+
+
+class SensorState:
+    """
+    Per-sensor analytics state. Uses __slots__ so 10k+ sensors stay compact.
+    'slot' is a dense integer index into the array-backed engines (prediction etc.).
+    """
+    __slots__ = ("sensor_id", "slot", "device_type", "current", "last_temp", "last_time")
+
+    def __init__(self, sensor_id: str, slot: int):
+        self.sensor_id = sensor_id
+        self.slot = slot
+        self.device_type = None
+        self.current = 0.0
+        # Physics (Rate of Rise) memory
+        self.last_temp = None
+        self.last_time = None
+
+
+class SensorRegistry:
+    """
+    Sharded registry of SensorState keyed by sensor_id.
+    Entries are created lazily on the first message from a sensor.
+    Lookups are a plain dict hit; only creation takes the shard lock.
+    """
+
+    def __init__(self, shards: int = 16):
+        # Power of two so we can mask instead of modulo
+        self._num_shards = 1 << max(0, (shards - 1).bit_length())
+        self._mask = self._num_shards - 1
+        self._shards = [{} for _ in range(self._num_shards)]
+        self._locks = [threading.Lock() for _ in range(self._num_shards)]
+
+        # Slot allocation is global so slots stay dense (0..N-1)
+        self._slot_lock = threading.Lock()
+        self._by_slot = []
+
+    def _shard(self, sensor_id: str) -> int:
+        return hash(sensor_id) & self._mask
+
+    def get(self, sensor_id: str) -> SensorState:
+        """Returns the state for a sensor, creating it on first use."""
+        index = self._shard(sensor_id)
+        state = self._shards[index].get(sensor_id)
+        if state is not None:
+            return state
+
+        with self._locks[index]:
+            # Another thread may have created it while we waited
+            state = self._shards[index].get(sensor_id)
+            if state is None:
+                with self._slot_lock:
+                    state = SensorState(sensor_id, len(self._by_slot))
+                    self._by_slot.append(state)
+                self._shards[index][sensor_id] = state
+        return state
+
+    def peek(self, sensor_id: str):
+        """Returns the state if the sensor is known, else None (never creates)."""
+        return self._shards[self._shard(sensor_id)].get(sensor_id)
+
+    def current_of(self, sensor_id: str) -> float:
+        state = self.peek(sensor_id)
+        return state.current if state is not None else 0.0
+
+    def by_slot(self, slot: int) -> SensorState:
+        return self._by_slot[slot]
+
+    def states(self) -> list:
+        """Snapshot of all known sensors, ordered by slot."""
+        return list(self._by_slot)
+
+    def __len__(self):
+        return len(self._by_slot)
+
+    def clear(self):
+        """Forgets every sensor (used by /admin/reset)."""
+        for index in range(self._num_shards):
+            with self._locks[index]:
+                self._shards[index].clear()
+        with self._slot_lock:
+            self._by_slot = []
+
+
+# Global Instance
+sensor_registry = SensorRegistry()
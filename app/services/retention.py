@@ -0,0 +1,282 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models import Reading, Event, AuditCheckpoint
+from app.services.rollups import RESOLUTIONS
+from app.logger import get_logger
+
+log = get_logger()
+
+# SQLite text form of a rollup bucket, identical to what SQLAlchemy stores for bucket_start
+_BUCKET_FORMATS = {60: "%Y-%m-%d %H:%M:00.000000", 3600: "%Y-%m-%d %H:00:00.000000"}
+
+# Rollups for raw rows about to be pruned. Buckets the ingest path already
+# wrote are complete, so existing rows win (INSERT OR IGNORE).
+_BACKFILL_SQL = """
+INSERT OR IGNORE INTO reading_rollups (
+    sensor_id, resolution, bucket_start, count,
+    temperature_min, temperature_max, temperature_sum,
+    current_min, current_max, current_sum,
+    vibration_min, vibration_max, vibration_sum
+)
+SELECT sensor_id, :resolution, strftime(:fmt, timestamp), count(*),
+       min(temperature), max(temperature), sum(temperature),
+       min(current), max(current), sum(current),
+       min(vibration), max(vibration), sum(vibration)
+FROM readings
+WHERE timestamp >= :start AND timestamp < :end
+GROUP BY sensor_id, strftime(:fmt, timestamp)
+"""
+
+KEEP_CHECKPOINTS = 100
+
+
+def _floor_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _sql_ts(ts: datetime) -> str:
+    # Raw SQL compares text: use the exact format SQLAlchemy stores DateTime in
+    return ts.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class RetentionEngine:
+    """
+    Keeps grid.db at a steady size:
+
+    - raw readings older than RETAIN_RAW_DAYS are rolled up (missing 1m / 1h
+      buckets are backfilled first) and deleted,
+    - 1m / 1h rollups older than RETAIN_ROLLUP_1M_DAYS / RETAIN_ROLLUP_1H_DAYS
+      are deleted,
+    - events older than RETAIN_EVENTS_DAYS are deleted, but only the part of
+      the chain an audit checkpoint has already verified; a signed anchor
+      takes their place so /audit/verify keeps working,
+    - freed pages are returned to the OS with PRAGMA incremental_vacuum.
+
+    Deletes run in RETENTION_BATCH_ROWS transactions with a pause in between,
+    so the ingest writer is never locked out for long. 0 days = keep forever.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval=3600.0, batch_rows=2000, pause=0.05, vacuum_pages=1000):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self._thread = None
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+
+        # --- COUNTERS ---
+        self.runs = 0
+        self.last_run = None
+        self.totals = {"readings": 0, "rollups": 0, "events": 0, "backfilled_buckets": 0, "vacuumed_pages": 0}
+
+    # --- POLICY ---
+    @staticmethod
+    def _cutoff(days: int, now: datetime):
+        # Hour-aligned, so a 1h rollup bucket is never split between two runs
+        return _floor_hour(now - timedelta(days=days)) if days > 0 else None
+
+    def raw_cutoff(self, now: datetime = None):
+        """Readings older than this may already be pruned (charts should use rollups)."""
+        return self._cutoff(settings.RETAIN_RAW_DAYS, now or datetime.now())
+
+    # --- 1. ONE PASS ---
+    def run_once(self, now: datetime = None) -> dict:
+        if not self._run_lock.acquire(blocking=False):
+            return {"status": "ALREADY_RUNNING"}
+        started = time.perf_counter()
+        now = now or datetime.now()
+        report = {"readings": 0, "rollups": 0, "events": 0, "backfilled_buckets": 0, "vacuumed_pages": 0}
+        try:
+            if settings.RETENTION_EXPORT_FIRST:
+                # Imported here: the archive is optional for retention
+                from app.services.archive import archive
+                archive.export()
+
+            raw_cutoff = self.raw_cutoff(now)
+            if raw_cutoff is not None:
+                report["backfilled_buckets"], report["readings"] = self._prune_readings(raw_cutoff)
+
+            for name, days in (("1m", settings.RETAIN_ROLLUP_1M_DAYS), ("1h", settings.RETAIN_ROLLUP_1H_DAYS)):
+                cutoff = self._cutoff(days, now)
+                if cutoff is not None:
+                    report["rollups"] += self._prune_rollups(RESOLUTIONS[name], cutoff)
+
+            events_cutoff = self._cutoff(settings.RETAIN_EVENTS_DAYS, now)
+            if events_cutoff is not None:
+                report["events"] = self._prune_events(events_cutoff)
+            self._prune_checkpoints()
+
+            if report["readings"] or report["rollups"] or report["events"]:
+                report["vacuumed_pages"] = self._vacuum()
+        except Exception as e:
+            log.error(f"⚠️ Retention pass failed: {e}")
+            report["error"] = str(e)
+        finally:
+            self._run_lock.release()
+
+        for key in self.totals:
+            self.totals[key] += report[key]
+        self.runs += 1
+        self.last_run = {**report, "elapsed_sec": round(time.perf_counter() - started, 3), "at": now.isoformat()}
+        if report["readings"] or report["rollups"] or report["events"]:
+            log.info(f"🧹 Retention: -{report['readings']} readings, -{report['rollups']} rollups, "
+                     f"-{report['events']} events, {report['vacuumed_pages']} pages released")
+        return self.last_run
+
+    # --- 2. READINGS (backfill, then delete) ---
+    def _prune_readings(self, cutoff: datetime):
+        backfilled = deleted = 0
+        while not self._stop.is_set():
+            with self.session_factory() as db:
+                oldest = db.query(func.min(Reading.timestamp)).filter(Reading.timestamp < cutoff).scalar()
+                if oldest is None:
+                    break
+                # One day at a time: its rollups are complete before any row goes
+                start = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+                end = min(start + timedelta(days=1), cutoff)
+                for resolution, fmt in _BUCKET_FORMATS.items():
+                    result = db.execute(text(_BACKFILL_SQL), {"resolution": resolution, "fmt": fmt, "start": _sql_ts(start), "end": _sql_ts(end)})
+                    backfilled += result.rowcount
+                db.commit()
+            deleted += self._delete_batches(
+                "DELETE FROM readings WHERE id IN (SELECT id FROM readings WHERE timestamp >= :start AND timestamp < :end LIMIT :n)",
+                {"start": _sql_ts(start), "end": _sql_ts(end)},
+            )
+        return backfilled, deleted
+
+    # --- 3. ROLLUPS ---
+    def _prune_rollups(self, resolution: int, cutoff: datetime) -> int:
+        return self._delete_batches(
+            "DELETE FROM reading_rollups WHERE id IN "
+            "(SELECT id FROM reading_rollups WHERE resolution = :resolution AND bucket_start < :cutoff LIMIT :n)",
+            {"resolution": resolution, "cutoff": _sql_ts(cutoff)},
+        )
+
+    # --- 4. EVENTS (verified prefix only, anchored) ---
+    def _prune_events(self, cutoff: datetime) -> int:
+        # Imported here: audit.py pulls in the process pool machinery
+        from app.services.audit import chain_verifier
+
+        with self.session_factory() as db:
+            checkpoint = chain_verifier.latest_checkpoint(db)
+            if checkpoint is None:
+                return 0
+            # The chain is pruned as a prefix: stop before the first event that is still young
+            first_young = db.query(func.min(Event.id)).filter(Event.timestamp >= cutoff).scalar()
+            limit_id = checkpoint.last_event_id
+            if first_young is not None:
+                limit_id = min(limit_id, first_young - 1)
+
+        deleted = 0
+        while not self._stop.is_set():
+            with self.session_factory() as db:
+                rows = (
+                    db.query(Event.id, Event.event_hash)
+                    .filter(Event.id <= limit_id)
+                    .order_by(Event.id.asc())
+                    .limit(self.batch_rows)
+                    .all()
+                )
+                if not rows:
+                    break
+                anchor = chain_verifier.latest_anchor(db)
+                pruned = (anchor.events_pruned if anchor else 0) + len(rows)
+                last = rows[-1]
+                # Anchor and delete commit together: the chain is never left without a head
+                chain_verifier.add_anchor(db, last.id, last.event_hash, pruned)
+                db.query(Event).filter(Event.id <= last.id).delete(synchronize_session=False)
+                db.commit()
+            deleted += len(rows)
+            self._stop.wait(self.pause)
+        return deleted
+
+    def _prune_checkpoints(self):
+        """Every incremental audit adds a checkpoint; only the newest ones matter."""
+        with self.session_factory() as db:
+            keep_from = (
+                db.query(AuditCheckpoint.id).order_by(AuditCheckpoint.id.desc())
+                .offset(KEEP_CHECKPOINTS - 1).limit(1).scalar()
+            )
+            if keep_from is not None:
+                db.query(AuditCheckpoint).filter(AuditCheckpoint.id < keep_from).delete(synchronize_session=False)
+                db.commit()
+
+    # --- HELPERS ---
+    def _delete_batches(self, sql: str, params: dict) -> int:
+        """Runs a LIMIT :n delete until it deletes nothing, one short transaction per batch."""
+        deleted = 0
+        while not self._stop.is_set():
+            with self.session_factory() as db:
+                count = db.execute(text(sql), {**params, "n": self.batch_rows}).rowcount
+                db.commit()
+            deleted += count
+            if count < self.batch_rows:
+                break
+            self._stop.wait(self.pause)
+        return deleted
+
+    def _vacuum(self) -> int:
+        """Releases free pages in small steps (needs auto_vacuum=INCREMENTAL, see database.py)."""
+        released = 0
+        with engine.connect() as conn:
+            # executescript() steps the pragma to completion; a plain execute() frees a single page
+            raw = conn.connection.driver_connection
+            while not self._stop.is_set():
+                free = raw.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    break
+                raw.executescript(f"PRAGMA incremental_vacuum({min(free, self.vacuum_pages)});")
+                after = raw.execute("PRAGMA freelist_count").fetchone()[0]
+                if after >= free:
+                    break   # auto_vacuum is off for this file
+                released += free - after
+                self._stop.wait(self.pause)
+        return released
+
+    # --- LIFECYCLE ---
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self._thread.start()
+        log.info(f"🧹 Retention every {self.interval:.0f}s (raw {settings.RETAIN_RAW_DAYS}d, "
+                 f"1m {settings.RETAIN_ROLLUP_1M_DAYS}d, 1h {settings.RETAIN_ROLLUP_1H_DAYS}d, events {settings.RETAIN_EVENTS_DAYS}d)")
+
+    def _loop(self):
+        # First pass a minute after startup (not during the cache warm-up), then every interval
+        delay = min(60.0, self.interval)
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.interval > 0,
+            "interval_sec": self.interval,
+            "raw_cutoff": self.raw_cutoff(),
+            "runs": self.runs,
+            "totals": self.totals,
+            "last_run": self.last_run,
+        }
+
+
+# Global Instance
+retention_engine = RetentionEngine(
+    interval=settings.RETENTION_INTERVAL_SEC,
+    batch_rows=settings.RETENTION_BATCH_ROWS,
+    pause=settings.RETENTION_BATCH_PAUSE_SEC,
+    vacuum_pages=settings.VACUUM_PAGES_PER_STEP,
+)
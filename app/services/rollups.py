@@ -0,0 +1,265 @@
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import func, select
+from app.models import Reading, ReadingRollup
+from app.database import row_batches
+
+# Rollup tiers maintained at ingest (bucket width in seconds)
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+
+# A tier is good enough if it returns at most this many times max_points
+# (we downsample the rest in memory)
+DOWNSAMPLE_HEADROOM = 10
+
+METRICS = ("temperature", "current", "vibration")
+
+
+def bucket_start(ts: datetime, resolution: int) -> datetime:
+    """Floors a timestamp to the start of its bucket."""
+    seconds = (ts.hour * 3600 + ts.minute * 60 + ts.second) // resolution * resolution
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(seconds=seconds)
+
+
+class RollupBucket:
+    """One open (still filling) min/max/sum/count bucket."""
+    __slots__ = (
+        "sensor_id", "resolution", "start", "count",
+        "temperature_min", "temperature_max", "temperature_sum",
+        "current_min", "current_max", "current_sum",
+        "vibration_min", "vibration_max", "vibration_sum",
+    )
+
+    def __init__(self, sensor_id, resolution, start, temperature, current, vibration):
+        self.sensor_id = sensor_id
+        self.resolution = resolution
+        self.start = start
+        self.count = 1
+        self.temperature_min = self.temperature_max = self.temperature_sum = temperature
+        self.current_min = self.current_max = self.current_sum = current
+        self.vibration_min = self.vibration_max = self.vibration_sum = vibration
+
+    def add(self, temperature, current, vibration):
+        self.count += 1
+        if temperature < self.temperature_min: self.temperature_min = temperature
+        if temperature > self.temperature_max: self.temperature_max = temperature
+        self.temperature_sum += temperature
+        if current < self.current_min: self.current_min = current
+        if current > self.current_max: self.current_max = current
+        self.current_sum += current
+        if vibration < self.vibration_min: self.vibration_min = vibration
+        if vibration > self.vibration_max: self.vibration_max = vibration
+        self.vibration_sum += vibration
+
+    def to_row(self) -> dict:
+        row = {"sensor_id": self.sensor_id, "resolution": self.resolution, "bucket_start": self.start, "count": self.count}
+        for name in METRICS:
+            row[f"{name}_min"] = getattr(self, f"{name}_min")
+            row[f"{name}_max"] = getattr(self, f"{name}_max")
+            row[f"{name}_sum"] = getattr(self, f"{name}_sum")
+        return row
+
+
+def upsert_rollups(db, rows: list):
+    """
+    Merges finished buckets into reading_rollups inside the caller's transaction.
+    Merging (not replacing) keeps restarts and late readings correct.
+    """
+    table = ReadingRollup.__table__
+    # A shutdown drain holds one row per sensor and tier: one statement per batch of them
+    for batch in row_batches(rows):
+        stmt = insert(table).values(batch)
+        merged = {"count": table.c.count + stmt.excluded.count}
+        for name in METRICS:
+            merged[f"{name}_min"] = func.min(table.c[f"{name}_min"], stmt.excluded[f"{name}_min"])
+            merged[f"{name}_max"] = func.max(table.c[f"{name}_max"], stmt.excluded[f"{name}_max"])
+            merged[f"{name}_sum"] = table.c[f"{name}_sum"] + stmt.excluded[f"{name}_sum"]
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["sensor_id", "resolution", "bucket_start"],
+            set_=merged,
+        ))
+
+
+class RollupEngine:
+    """
+    Maintains 1-minute and 1-hour rollups incrementally at ingest.
+    Each sensor has one open bucket per tier; when a reading lands in a later
+    bucket, the old one is closed and handed to the DB writer as an upsert.
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = tuple(resolutions.values())
+        self._open = {}   # (sensor_id, resolution) -> RollupBucket
+        self._lock = threading.Lock()
+
+    def add(self, sensor_id: str, ts: datetime, temperature: float, current: float, vibration: float):
+        """
+        Folds one reading into every tier.
+        Returns a writer row (callable) for the buckets it closed, or None.
+        """
+        closed = []
+        with self._lock:
+            for resolution in self.resolutions:
+                start = bucket_start(ts, resolution)
+                key = (sensor_id, resolution)
+                bucket = self._open.get(key)
+                if bucket is not None and bucket.start == start:
+                    bucket.add(temperature, current, vibration)
+                    continue
+                if bucket is not None and start < bucket.start:
+                    # Late reading for an older bucket: merge it straight into the DB
+                    closed.append(RollupBucket(sensor_id, resolution, start, temperature, current, vibration).to_row())
+                    continue
+                if bucket is not None:
+                    closed.append(bucket.to_row())
+                self._open[key] = RollupBucket(sensor_id, resolution, start, temperature, current, vibration)
+        return partial(upsert_rollups, rows=closed) if closed else None
+
+    def open_buckets(self, sensor_id: str, resolution: int) -> list:
+        """The still-filling bucket (if any), so charts include the newest data."""
+        bucket = self._open.get((sensor_id, resolution))
+        return [bucket.to_row()] if bucket is not None else []
+
+    def drain(self):
+        """Closes every open bucket (shutdown). Returns a writer row or None."""
+        with self._lock:
+            rows = [bucket.to_row() for bucket in self._open.values()]
+            self._open = {}
+        return partial(upsert_rollups, rows=rows) if rows else None
+
+    def reset(self):
+        with self._lock:
+            self._open = {}
+
+
+# --- DOWNSAMPLING ---
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets. Returns the indices of 'threshold' points
+    that keep the visual shape of (x, y): peaks and dips survive.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the *next* bucket is the third triangle corner
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point in this bucket with the biggest triangle area
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def merge_buckets(points: list, max_points: int) -> list:
+    """Folds consecutive rollup points together (min of mins, max of maxes)."""
+    if len(points) <= max_points:
+        return points
+    group = -(-len(points) // max_points)  # ceil
+    merged = []
+    for i in range(0, len(points), group):
+        chunk = points[i:i + group]
+        out = {"timestamp": chunk[0]["timestamp"], "count": sum(p["count"] for p in chunk)}
+        for name in METRICS:
+            out[name] = sum(p[name] * p["count"] for p in chunk) / out["count"]
+            out[f"{name}_min"] = min(p[f"{name}_min"] for p in chunk)
+            out[f"{name}_max"] = max(p[f"{name}_max"] for p in chunk)
+        merged.append(out)
+    return merged
+
+
+def _rollup_point(row: dict) -> dict:
+    point = {"timestamp": row["bucket_start"], "count": row["count"]}
+    for name in METRICS:
+        point[name] = row[f"{name}_sum"] / row["count"]
+        point[f"{name}_min"] = row[f"{name}_min"]
+        point[f"{name}_max"] = row[f"{name}_max"]
+    return point
+
+
+def pick_resolution(window_sec: float, max_points: int) -> str:
+    """Cheapest tier that still gives enough detail for 'max_points'."""
+    budget = max_points * DOWNSAMPLE_HEADROOM
+    # Raw telemetry arrives at ~1 Hz per sensor
+    if window_sec <= budget:
+        return "raw"
+    for name, seconds in RESOLUTIONS.items():
+        if window_sec / seconds <= budget:
+            return name
+    return list(RESOLUTIONS)[-1]
+
+
+async def chart_series(db, engine: RollupEngine, sensor_id: str, start: datetime, end: datetime, max_points: int, resolution: str = "auto", raw_since: datetime = None) -> dict:
+    """
+    Resolution-aware history for one sensor, at most 'max_points' points.
+    'db' is an AsyncSession from the read pool.
+    'raw_since' = retention cutoff: older windows come from the 1m rollups.
+    """
+    if resolution == "auto":
+        resolution = pick_resolution((end - start).total_seconds(), max_points)
+        if resolution == "raw" and raw_since is not None and start < raw_since:
+            resolution = "1m"
+
+    if resolution == "raw":
+        result = await db.execute(
+            select(Reading.timestamp, Reading.temperature, Reading.current, Reading.vibration)
+            .where(Reading.sensor_id == sensor_id, Reading.timestamp >= start, Reading.timestamp <= end)
+            .order_by(Reading.timestamp.asc())
+        )
+        rows = result.all()
+        if len(rows) > max_points:
+            x = np.array([r.timestamp.timestamp() for r in rows])
+            y = np.array([r.temperature for r in rows], dtype=np.float64)
+            rows = [rows[i] for i in lttb(x, y, max_points)]
+        points = [
+            {"timestamp": r.timestamp, "temperature": r.temperature, "current": r.current, "vibration": r.vibration}
+            for r in rows
+        ]
+        return {"sensor_id": sensor_id, "resolution": "raw", "points": points}
+
+    seconds = RESOLUTIONS[resolution]
+    table = ReadingRollup.__table__
+    result = await db.execute(
+        table.select()
+        .where(table.c.sensor_id == sensor_id, table.c.resolution == seconds)
+        .where(table.c.bucket_start >= bucket_start(start, seconds), table.c.bucket_start <= end)
+        .order_by(table.c.bucket_start.asc())
+    )
+    rows = [dict(r._mapping) for r in result]
+
+    # The open bucket is only in memory until it closes
+    stored = {row["bucket_start"] for row in rows}
+    for live in engine.open_buckets(sensor_id, seconds):
+        if live["bucket_start"] in stored:
+            row = next(r for r in rows if r["bucket_start"] == live["bucket_start"])
+            row["count"] += live["count"]
+            for name in METRICS:
+                row[f"{name}_min"] = min(row[f"{name}_min"], live[f"{name}_min"])
+                row[f"{name}_max"] = max(row[f"{name}_max"], live[f"{name}_max"])
+                row[f"{name}_sum"] += live[f"{name}_sum"]
+        elif live["bucket_start"] <= end:
+            rows.append(live)
+
+    points = merge_buckets([_rollup_point(r) for r in rows], max_points)
+    return {"sensor_id": sensor_id, "resolution": resolution, "points": points}
+
+
+# Global Instance
+rollup_engine = RollupEngine()
@@ -0,0 +1,129 @@
+import mmap
+import os
+import struct
+import time
+
+# Memory-mapped region shared by the ingest owner (one writer) and the HTTP
+# workers (many readers). Layout:
+#
+#   0   magic     8s   b"GRIDSNAP"
+#   8   seq       u64  seqlock counter: odd while the owner is writing
+#   16  length    u32  payload bytes
+#   20  owner_pid u32
+#   24  reset_seq u64  bumped by any worker to ask the owner for a twin reset
+#   32  payload   ...  JSON document
+MAGIC = b"GRIDSNAP"
+HEADER = 32
+_SEQ, _LEN, _PID, _RESET = 8, 16, 20, 24
+
+
+class SnapshotTooLarge(ValueError):
+    pass
+
+
+class SnapshotRegion:
+    """
+    Seqlock over an mmap'd file. The writer never blocks readers and readers
+    never block the writer: a reader copies the payload and retries if the
+    sequence number moved (or was odd) while it was copying.
+    """
+
+    def __init__(self, path: str, size: int = 8 * 1024 * 1024):
+        self.path = path
+        self.size = size
+        self._mm = None
+        self._seq = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.size - HEADER
+
+    # --- 1. WRITER (ingest owner) ---
+    def create(self):
+        """Owner side: (re)creates the file at full size and maps it."""
+        self.close()   # A promoted reader may still have the old mapping
+        with open(self.path, "a+b") as f:
+            f.truncate(self.size)
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            self._mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self._seq = struct.unpack_from("<Q", self._mm, _SEQ)[0]
+        if self._seq & 1:
+            # A previous owner died mid-write: make the counter even again
+            self._seq += 1
+        self._mm[0:8] = MAGIC
+        struct.pack_into("<QII", self._mm, _SEQ, self._seq, 0, os.getpid())
+
+    def write(self, payload: bytes):
+        if len(payload) > self.capacity:
+            raise SnapshotTooLarge(f"{len(payload)} bytes > {self.capacity}")
+        mm = self._mm
+        struct.pack_into("<Q", mm, _SEQ, self._seq + 1)          # odd: write in progress
+        mm[HEADER:HEADER + len(payload)] = payload
+        struct.pack_into("<I", mm, _LEN, len(payload))
+        self._seq += 2
+        struct.pack_into("<Q", mm, _SEQ, self._seq)              # even: consistent
+
+    # --- 2. READERS (HTTP workers) ---
+    def open(self) -> bool:
+        """Reader side: maps the owner's file. False if it does not exist yet."""
+        if self._mm is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            if os.fstat(fd).st_size < HEADER:
+                return False
+            self._mm = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        if self._mm[0:8] != MAGIC:
+            self._mm.close()
+            self._mm = None
+            return False
+        return True
+
+    def read(self, since_seq: int = -1, retries: int = 100):
+        """
+        Returns (seq, payload_bytes), or None if nothing newer than 'since_seq'
+        is available (or the writer kept us out for 'retries' attempts).
+        """
+        if self._mm is None and not self.open():
+            return None
+        mm = self._mm
+        for attempt in range(retries):
+            seq = struct.unpack_from("<Q", mm, _SEQ)[0]
+            if seq & 1:
+                time.sleep(0 if attempt < 10 else 0.0005)
+                continue
+            if seq == since_seq:
+                return None
+            length = struct.unpack_from("<I", mm, _LEN)[0]
+            payload = mm[HEADER:HEADER + length]
+            if struct.unpack_from("<Q", mm, _SEQ)[0] == seq:
+                return seq, payload
+        return None
+
+    @property
+    def owner_pid(self) -> int:
+        return struct.unpack_from("<I", self._mm, _PID)[0] if self._mm is not None else 0
+
+    # --- 3. CONTROL WORD (readers -> owner) ---
+    def request_reset(self) -> bool:
+        if self._mm is None and not self.open():
+            return False
+        value = struct.unpack_from("<Q", self._mm, _RESET)[0]
+        struct.pack_into("<Q", self._mm, _RESET, value + 1)
+        return True
+
+    def reset_seq(self) -> int:
+        return struct.unpack_from("<Q", self._mm, _RESET)[0] if self._mm is not None else 0
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
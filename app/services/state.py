@@ -1,36 +1,208 @@
+import threading
+from collections import deque
+from app.config import settings
+
+# Columns copied into the hot cache (same keys the ORM rows serialize to)
+READING_FIELDS = ("id", "sensor_id", "temperature", "current", "vibration", "timestamp", "predicted_failure_min")
+EVENT_FIELDS = ("id", "sensor_id", "event_type", "value", "message", "timestamp", "previous_hash", "event_hash")
+
+
+def row_to_dict(row, fields) -> dict:
+    return {name: getattr(row, name) for name in fields}
+
+
 class GridState:
-    def __init__(self):
+    def __init__(self, readings_per_sensor=50, max_readings=200, max_events=100):
         # The main transformer load (The Source)
         self.transformer_current = 0.0
-        
+
         # A dictionary to store downstream meters (House 1, House 2...)
         # Key = Sensor ID, Value = Current (Amps)
         self.smart_meters = {}
-        
+        # Running sum of smart_meters, so theft checks never re-sum the dict
+        self.total_meter_load = 0.0
+
         # Configuration: How much mismatch is allowed before flagging theft?
         self.THEFT_THRESHOLD = 2.0  # Amps
 
+        # --- HOT CACHE ---
+        # Newest readings per sensor and newest events, filled by the ingest path
+        # so the live / alert endpoints never have to touch SQLite.
+        self.readings_per_sensor = readings_per_sensor
+        self.recent_readings = {}                    # sensor_id -> deque (newest first)
+        self.recent_readings_all = deque(maxlen=max_readings)  # all sensors, newest first
+        self.latest_reading = None
+        self.recent_events = deque(maxlen=max_events)  # newest first
+        self.has_sensor_rings = True   # False if a trimmed snapshot left them out
+        self._cache_lock = threading.Lock()
+
+        # Bumped on every change, so the snapshot publisher can skip idle ticks
+        self.version = 0
+
     def update_transformer(self, current: float):
         self.transformer_current = current
+        self.version += 1
 
     def update_meter(self, meter_id: str, current: float):
+        self.total_meter_load += current - self.smart_meters.get(meter_id, 0.0)
         self.smart_meters[meter_id] = current
+        self.version += 1
 
     def check_for_theft(self) -> float:
         """
         Calculates the missing current.
         Returns the stolen amount in Amps.
         """
-        total_consumption = sum(self.smart_meters.values())
-        
+        total_consumption = self.total_meter_load
+
         # Loss = Input - Output
         loss = self.transformer_current - total_consumption
-        
+
         # If loss is negative, it just means sensors are slightly off (noise)
         if loss < 0:
             return 0.0
-            
+
         return round(loss, 2)
 
+    # --- HOT CACHE: WRITERS (ingest path) ---
+    def record_reading(self, reading: dict):
+        with self._cache_lock:
+            ring = self.recent_readings.get(reading["sensor_id"])
+            if ring is None:
+                ring = self.recent_readings[reading["sensor_id"]] = deque(maxlen=self.readings_per_sensor)
+            ring.appendleft(reading)
+            self.recent_readings_all.appendleft(reading)
+            self.latest_reading = reading
+            self.version += 1
+
+    def record_event(self, event: dict):
+        with self._cache_lock:
+            self.recent_events.appendleft(event)
+            self.version += 1
+
+    # --- HOT CACHE: READERS (API) ---
+    def latest_events(self, limit: int) -> list:
+        with self._cache_lock:
+            return list(self.recent_events)[:limit]
+
+    def latest_readings(self, limit: int, sensor_id: str = None):
+        """
+        Newest readings (all sensors or one) or None if the cache cannot
+        answer, i.e. it may hold fewer rows than the database has.
+        """
+        with self._cache_lock:
+            if sensor_id is None:
+                ring, capacity = self.recent_readings_all, self.recent_readings_all.maxlen
+            else:
+                if not self.has_sensor_rings:
+                    return None
+                ring, capacity = self.recent_readings.get(sensor_id), self.readings_per_sensor
+            if limit > capacity:
+                return None
+            if ring is None:
+                # Unknown sensor: warm_from_db() saw no rows for it either
+                return []
+            return list(ring)[:limit]
+
+    def latest_temperatures(self) -> dict:
+        """{sensor_id: temperature} of each sensor's newest cached reading."""
+        with self._cache_lock:
+            return {sensor_id: ring[0]["temperature"] for sensor_id, ring in self.recent_readings.items() if ring}
+
+    def can_serve_events(self, limit: int) -> bool:
+        return limit <= self.recent_events.maxlen
+
+    def warm_from_db(self, db):
+        """Cold start: fills the cache from the newest rows already in SQLite."""
+        # Imported here: app.models pulls in SQLAlchemy, state.py should stay light
+        from sqlalchemy import func
+        from app.models import Reading, Event
+
+        events = db.query(Event).order_by(Event.timestamp.desc()).limit(self.recent_events.maxlen).all()
+        newest = db.query(Reading).order_by(Reading.timestamp.desc()).limit(self.recent_readings_all.maxlen).all()
+        # Every sensor's newest rows in one query instead of one per sensor. Only ids are
+        # ranked, so the window runs on the (sensor_id, timestamp) index alone
+        rank = func.row_number().over(
+            partition_by=Reading.sensor_id, order_by=(Reading.timestamp.desc(), Reading.id.desc())
+        ).label("rank")
+        ranked = db.query(Reading.id, rank).subquery()
+        rows = (
+            db.query(*(getattr(Reading, name) for name in READING_FIELDS))
+            .join(ranked, Reading.id == ranked.c.id)
+            .filter(ranked.c.rank <= self.readings_per_sensor)
+            .order_by(Reading.sensor_id, ranked.c.rank)
+            .all()
+        )
+        rings = {}
+        for row in rows:
+            ring = rings.get(row.sensor_id)
+            if ring is None:
+                ring = rings[row.sensor_id] = deque(maxlen=self.readings_per_sensor)
+            ring.append(row_to_dict(row, READING_FIELDS))
+
+        with self._cache_lock:
+            self.recent_events.clear()
+            self.recent_events.extend(row_to_dict(e, EVENT_FIELDS) for e in events)
+            self.recent_readings_all.clear()
+            self.recent_readings_all.extend(row_to_dict(r, READING_FIELDS) for r in newest)
+            self.latest_reading = self.recent_readings_all[0] if newest else None
+            self.recent_readings = rings
+
+    # --- SHARED SNAPSHOT (multi-worker mode) ---
+    def to_snapshot(self) -> dict:
+        """Plain-data copy of the twin for the ingest owner to publish (without the per-sensor rings)."""
+        with self._cache_lock:
+            return {
+                "transformer_current": self.transformer_current,
+                "smart_meters": dict(self.smart_meters),
+                "latest_reading": self.latest_reading,
+                "recent_readings_all": list(self.recent_readings_all),
+                "recent_events": list(self.recent_events),
+            }
+
+    def ring_rows(self) -> int:
+        """Readings held in the per-sensor rings (sizes the snapshot before anything is copied)."""
+        with self._cache_lock:
+            return sum(len(ring) for ring in self.recent_readings.values())
+
+    def sensor_rings(self) -> dict:
+        with self._cache_lock:
+            return {sid: list(ring) for sid, ring in self.recent_readings.items()}
+
+    def load_snapshot(self, data: dict):
+        """
+        HTTP worker side: replaces this process' copy with the owner's.
+        Without per-sensor rings, per-sensor requests fall back to SQLite.
+        """
+        meters = data["smart_meters"]
+        with self._cache_lock:
+            self.transformer_current = data["transformer_current"]
+            self.smart_meters = meters
+            self.total_meter_load = sum(meters.values())
+            self.latest_reading = data["latest_reading"]
+            self.recent_readings_all = deque(data["recent_readings_all"], maxlen=self.recent_readings_all.maxlen)
+            self.recent_events = deque(data["recent_events"], maxlen=self.recent_events.maxlen)
+            rings = data.get("recent_readings")
+            self.has_sensor_rings = rings is not None
+            self.recent_readings = {
+                sid: deque(rows, maxlen=self.readings_per_sensor) for sid, rows in (rings or {}).items()
+            }
+            self.version += 1
+
+    def reset(self):
+        self.transformer_current = 0.0
+        self.smart_meters = {}
+        self.total_meter_load = 0.0
+        with self._cache_lock:
+            self.recent_readings = {}
+            self.recent_readings_all.clear()
+            self.latest_reading = None
+            self.recent_events.clear()
+            self.version += 1
+
 # Create a single global instance
-grid_state = GridState()
\ No newline at end of file
+grid_state = GridState(
+    readings_per_sensor=settings.HOT_CACHE_READINGS_PER_SENSOR,
+    max_readings=settings.HOT_CACHE_READINGS,
+    max_events=settings.HOT_CACHE_EVENTS,
+)
@@ -0,0 +1,251 @@
+import time
+import numpy as np
+from app.config import settings
+from app.services.physics import HST_GRADIENT, REFERENCE_HOTSPOT_K
+from app.services.aging import NORMAL_LIFE_HOURS
+
+# Per-transformer parameters (IEEE C57.91 clause 7). Each may be a scalar or one value per transformer.
+PARAMS = (
+    "top_oil_rise",       # Top-oil rise over ambient at rated load (°C)
+    "hotspot_rise",       # Hot-spot rise over top oil at rated load (°C)
+    "loss_ratio",         # R = load losses / no-load losses at rated load
+    "oil_exponent",       # n (0.8 ONAN, 0.9 ONAF, 1.0 OFAF)
+    "winding_exponent",   # m (0.8 ONAN / ONAF, 1.0 ODAF)
+    "oil_tau_min",        # Top-oil time constant (minutes)
+    "winding_tau_min",    # Winding (hot-spot) time constant (minutes)
+)
+
+# Accepted range (exclusive low, inclusive high) of each parameter; outside it the equations go NaN / negative
+PARAM_RANGES = {
+    "top_oil_rise": (0.0, 150.0),
+    "hotspot_rise": (0.0, 150.0),
+    "loss_ratio": (0.0, 100.0),
+    "oil_exponent": (0.0, 2.0),
+    "winding_exponent": (0.0, 2.0),
+    "oil_tau_min": (0.0, 10000.0),
+    "winding_tau_min": (0.0, 1000.0),
+}
+
+
+def check_params(params: dict) -> list:
+    """Problems with user supplied parameter overrides (empty if they are usable)."""
+    problems = []
+    for name, value in params.items():
+        if name not in PARAM_RANGES:
+            problems.append(f"unknown param '{name}' (allowed: {', '.join(PARAMS)})")
+            continue
+        low, high = PARAM_RANGES[name]
+        if not (low < value <= high):
+            problems.append(f"{name} must be in ({low:g}, {high:g}], got {value}")
+    return problems
+
+
+def default_params() -> dict:
+    return {
+        "top_oil_rise": settings.THERMAL_TOP_OIL_RISE_C,
+        "hotspot_rise": settings.THERMAL_HOTSPOT_RISE_C,
+        "loss_ratio": settings.THERMAL_LOSS_RATIO,
+        "oil_exponent": settings.THERMAL_OIL_EXPONENT,
+        "winding_exponent": settings.THERMAL_WINDING_EXPONENT,
+        "oil_tau_min": settings.THERMAL_OIL_TAU_MIN,
+        "winding_tau_min": settings.THERMAL_WINDING_TAU_MIN,
+    }
+
+
+def step_profile(values, steps: int) -> np.ndarray:
+    """
+    Stretches a profile over 'steps' (each value holds for an equal share),
+    e.g. 24 hourly values -> 1440 one-minute steps. 1-D = the same for every
+    transformer, 2-D = (values, transformers).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    index = (np.arange(steps) * len(values)) // steps
+    return values[index]
+
+
+class ThermalSimulator:
+    """
+    Top-oil / hot-spot dynamics of IEEE C57.91 clause 7, stepped for a whole
+    fleet at once (one array element per transformer, one loop turn per step):
+
+        ultimate top-oil rise  Δθ_TO,U = Δθ_TO,R · ((K²R + 1) / (R + 1))^n
+        ultimate hot-spot rise Δθ_H,U  = Δθ_H,R · K^2m
+        τ_TO · dθ_TO/dt = Δθ_TO,U + θ_A - θ_TO
+        τ_W  · dΔθ_H/dt = Δθ_H,U - Δθ_H
+        θ_H = θ_TO + Δθ_H
+
+    Each step uses the exact solution for a load held constant over the step
+    (x' = x_U + (x - x_U)·e^(-Δt/τ)), so it stays stable at any step size.
+    Aging (FAA, equivalent aging, loss of life) is integrated along the way.
+    Only per-transformer summaries are kept unless keep_series is set.
+    """
+
+    def __init__(self, block_steps=60):
+        # Steps whose ultimate rises are computed together (bounds the temporary arrays)
+        self.block_steps = block_steps
+
+    def simulate(self, load, ambient, step_min: float = 1.0, params: dict = None, initial_top_oil=None,
+                 hotspot_limit: float = 140.0, keep_series: bool = False) -> dict:
+        """
+        load: per-unit load K, shape (steps, transformers).
+        ambient: °C, scalar, (steps,) or (steps, transformers).
+        initial_top_oil: °C per transformer, NaN = steady state at the first step's load.
+        Returns {name: array per transformer} (+ 'series' of shape (steps, transformers)).
+        """
+        started = time.perf_counter()
+        load = np.asarray(load, dtype=np.float64)
+        steps, count = load.shape
+        ambient = np.asarray(ambient, dtype=np.float64)
+        if ambient.ndim == 1:
+            ambient = ambient[:, None]   # One value per step, shared by all transformers
+
+        p = {**default_params(), **(params or {})}
+        to_rated, h_rated, ratio, n, m, tau_oil, tau_w = (
+            np.broadcast_to(np.asarray(p[name], dtype=np.float64), (count,)) for name in PARAMS
+        )
+        decay_oil = np.exp(-step_min / tau_oil)
+        decay_w = np.exp(-step_min / tau_w)
+        step_hours = step_min / 60.0
+
+        def ultimates(i0: int, i1: int):
+            # The state-independent part (the powers), for a block of steps at once
+            k2 = load[i0:i1] * load[i0:i1]
+            amb = ambient[i0:i1] if ambient.ndim else ambient
+            top_oil_u = to_rated * ((k2 * ratio + 1.0) / (ratio + 1.0)) ** n + amb
+            return top_oil_u, h_rated * k2 ** m
+
+        # Start: measured top oil where known, steady state at the first load otherwise
+        top_oil_u, hotspot_u = ultimates(0, 1)
+        top_oil = top_oil_u[0].copy()
+        if initial_top_oil is not None:
+            measured = np.broadcast_to(np.asarray(initial_top_oil, dtype=np.float64), (count,))
+            top_oil = np.where(np.isnan(measured), top_oil, measured)
+        hotspot_rise = hotspot_u[0].copy()
+
+        peak_hotspot = np.full(count, -np.inf)
+        peak_top_oil = np.full(count, -np.inf)
+        peak_step = np.zeros(count, dtype=np.int64)
+        steps_above = np.zeros(count, dtype=np.int64)
+        first_above = np.full(count, -1, dtype=np.int64)
+        equivalent_aging = np.zeros(count)
+        series = np.empty((steps, count)) if keep_series else None
+
+        hotspot = np.empty(count)
+        faa = np.empty(count)
+        above = np.empty(count, dtype=bool)
+        new_peak = np.empty(count, dtype=bool)
+        for block in range(0, steps, self.block_steps):
+            top_oil_u, hotspot_u = ultimates(block, min(block + self.block_steps, steps))
+            for j in range(len(top_oil_u)):
+                i = block + j
+                # x' = x_U + (x - x_U) * decay, in place
+                top_oil -= top_oil_u[j]
+                top_oil *= decay_oil
+                top_oil += top_oil_u[j]
+                hotspot_rise -= hotspot_u[j]
+                hotspot_rise *= decay_w
+                hotspot_rise += hotspot_u[j]
+                np.add(top_oil, hotspot_rise, out=hotspot)
+
+                np.maximum(peak_top_oil, top_oil, out=peak_top_oil)
+                np.greater(hotspot, peak_hotspot, out=new_peak)
+                np.copyto(peak_hotspot, hotspot, where=new_peak)
+                np.copyto(peak_step, i, where=new_peak)
+                np.greater(hotspot, hotspot_limit, out=above)
+                steps_above += above
+                np.copyto(first_above, i, where=above & (first_above < 0))
+
+                # FAA = exp(B/383 - B/(θ_H + 273))
+                np.add(hotspot, 273.0, out=faa)
+                np.divide(-HST_GRADIENT, faa, out=faa)
+                faa += HST_GRADIENT / REFERENCE_HOTSPOT_K
+                np.exp(faa, out=faa)
+                equivalent_aging += faa
+                if keep_series:
+                    series[i] = hotspot
+
+        equivalent_aging *= step_hours
+        horizon_hours = steps * step_hours
+        result = {
+            "peak_hotspot": peak_hotspot,
+            "peak_top_oil": peak_top_oil,
+            "peak_at_min": (peak_step + 1) * step_min,
+            "minutes_above_limit": steps_above * step_min,
+            "first_above_limit_min": np.where(first_above >= 0, (first_above + 1) * step_min, np.nan),
+            "final_top_oil": top_oil,
+            "final_hotspot": hotspot,
+            "equivalent_aging_hours": equivalent_aging,
+            "feqa": equivalent_aging / horizon_hours,
+            "loss_of_life_pct": equivalent_aging / NORMAL_LIFE_HOURS * 100.0,
+            "elapsed_sec": time.perf_counter() - started,
+        }
+        if keep_series:
+            result["series"] = series
+        return result
+
+    def what_if(self, sensor_ids: list, initial_temps: dict, hours: float, step_min: float, load_profile: list,
+                load_profiles: dict = None, load_steps: list = None, ambient=None, params: dict = None,
+                hotspot_limit: float = None, include_series: bool = False) -> dict:
+        """
+        API scenario: builds the (steps, transformers) load matrix, runs one
+        simulation for all of them and returns JSON-ready rows, hottest first.
+        load_steps = [{"load": 1.3, "start_hour": 2, "hours": 2}, ...] override the profiles.
+        """
+        steps = max(1, int(round(hours * 60.0 / step_min)))
+        load = np.repeat(step_profile(load_profile, steps)[:, None], len(sensor_ids), axis=1)
+        for col, sensor_id in enumerate(sensor_ids):
+            if load_profiles and sensor_id in load_profiles:
+                load[:, col] = step_profile(load_profiles[sensor_id], steps)
+        minutes = np.arange(steps) * step_min
+        for step in load_steps or []:
+            window = (minutes >= step["start_hour"] * 60.0) & (minutes < (step["start_hour"] + step["hours"]) * 60.0)
+            load[window] = step["load"]
+
+        ambient = step_profile(ambient if ambient else [settings.THERMAL_AMBIENT_C], steps)
+        initial = np.array([initial_temps.get(sensor_id, np.nan) for sensor_id in sensor_ids], dtype=np.float64)
+        limit = settings.THERMAL_HOTSPOT_LIMIT_C if hotspot_limit is None else hotspot_limit
+        result = self.simulate(load, ambient, step_min, params, initial, limit, keep_series=include_series)
+
+        def clean(value, digits):
+            # NaN / ±inf are not JSON
+            return round(float(value), digits) if np.isfinite(value) else None
+
+        rows = [
+            {
+                "sensor_id": sensor_id,
+                "initial_top_oil": clean(initial[i], 2),
+                "peak_load": round(float(load[:, i].max()), 3),
+                "peak_top_oil": clean(result["peak_top_oil"][i], 2),
+                "peak_hotspot": clean(result["peak_hotspot"][i], 2),
+                "peak_at_min": float(result["peak_at_min"][i]),
+                "minutes_above_limit": float(result["minutes_above_limit"][i]),
+                "first_above_limit_min": clean(result["first_above_limit_min"][i], 1),
+                "final_hotspot": clean(result["final_hotspot"][i], 2),
+                "feqa": clean(result["feqa"][i], 4),
+                "equivalent_aging_hours": clean(result["equivalent_aging_hours"][i], 4),
+                "loss_of_life_pct": clean(result["loss_of_life_pct"][i], 6),
+            }
+            for i, sensor_id in enumerate(sensor_ids)
+        ]
+        order = np.argsort(-result["peak_hotspot"], kind="stable")
+        response = {
+            "transformers": len(sensor_ids),
+            "steps": steps,
+            "step_minutes": step_min,
+            "hotspot_limit": limit,
+            "over_limit": int((result["minutes_above_limit"] > 0).sum()),
+            "elapsed_sec": round(result["elapsed_sec"], 3),
+            "results": [rows[i] for i in order],
+        }
+        if include_series:
+            response["series"] = {
+                "minutes": (minutes + step_min).tolist(),
+                "hotspot": {
+                    sensor_id: [clean(value, 2) for value in result["series"][:, i]] for i, sensor_id in enumerate(sensor_ids)
+                },
+            }
+        return response
+
+
+# Global Instance
+thermal_simulator = ThermalSimulator()
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+from app.config import settings
+from app.logger import get_logger
+
+log = get_logger()
+
+SUBSTATION, TRANSFORMER, FEEDER, METER = "SUBSTATION", "TRANSFORMER", "FEEDER", "METER"
+KINDS = (SUBSTATION, TRANSFORMER, FEEDER, METER)
+
+# Used when no TOPOLOGY_FILE exists: the original demo wiring
+# (TX_MAIN_01 feeds HOUSE_01, SIM-001 feeds METER-01)
+DEFAULT_TOPOLOGY = {
+    "id": "SUBSTATION_01", "kind": SUBSTATION, "children": [
+        {"id": "TX_MAIN_01", "kind": TRANSFORMER, "children": [
+            {"id": "FEEDER_01", "kind": FEEDER, "children": [
+                {"id": "HOUSE_01", "kind": METER},
+            ]},
+        ]},
+        {"id": "SIM-001", "kind": TRANSFORMER, "children": [
+            {"id": "METER-01", "kind": METER},
+        ]},
+    ],
+}
+
+
+class TopologyNode:
+    """
+    One element of the feeder tree.
+    'measured' = this node's own sensor reading (None if not instrumented).
+    'metered_sum' = sum of all meter readings below it, maintained incrementally.
+    """
+    __slots__ = ("node_id", "kind", "parent", "children", "measured", "metered_sum", "depth")
+
+    def __init__(self, node_id: str, kind: str, parent=None):
+        self.node_id = node_id
+        self.kind = kind
+        self.parent = parent
+        self.children = []
+        self.measured = None
+        self.metered_sum = 0.0
+        self.depth = parent.depth + 1 if parent else 0
+
+    @property
+    def imbalance(self):
+        """Input - metered output below this node. None if the node has no sensor."""
+        if self.measured is None or self.kind == METER:
+            return None
+        return self.measured - self.metered_sum
+
+
+class FeederTopology:
+    """
+    Substation -> transformer -> feeder -> meter tree for energy-balance theft detection.
+
+    A meter update walks up its ancestors adjusting metered_sum (O(depth)),
+    so the imbalance of any transformer or feeder is always an O(1) read,
+    however many meters hang below it.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.roots = []
+        self._lock = threading.Lock()
+
+    # --- 1. LOADING ---
+    def load(self, tree):
+        """Builds the tree from a nested dict (or a list of root dicts)."""
+        with self._lock:
+            self.nodes = {}
+            self.roots = []
+            for root in (tree if isinstance(tree, list) else [tree]):
+                self.roots.append(self._build(root, None))
+        log.info(f"🗺️ Topology loaded: {len(self.nodes)} nodes")
+
+    def _build(self, spec: dict, parent):
+        kind = spec.get("kind", METER).upper()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown node kind '{kind}' for {spec.get('id')}")
+        if spec["id"] in self.nodes:
+            raise ValueError(f"Duplicate node id '{spec['id']}'")
+        node = TopologyNode(spec["id"], kind, parent)
+        self.nodes[node.node_id] = node
+        for child in spec.get("children", []):
+            node.children.append(self._build(child, node))
+        return node
+
+    def load_file(self, path: str):
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.load(json.load(f))
+        else:
+            self.load(DEFAULT_TOPOLOGY)
+
+    # --- 2. UPDATES (ingest path) ---
+    def update(self, sensor_id: str, current: float) -> list:
+        """
+        Records a reading. Returns the instrumented nodes whose imbalance
+        may have changed (the node itself and its ancestors), nearest first.
+        Unknown sensors return [].
+        """
+        node = self.nodes.get(sensor_id)
+        if node is None:
+            return []
+
+        if node.kind == METER:
+            delta = current - (node.measured or 0.0)
+            node.measured = current
+            affected = []
+            parent = node.parent
+            while parent is not None:
+                parent.metered_sum += delta
+                if parent.measured is not None:
+                    affected.append(parent)
+                parent = parent.parent
+            return affected
+
+        node.measured = current
+        affected = [node]
+        parent = node.parent
+        while parent is not None:
+            if parent.measured is not None:
+                affected.append(parent)
+            parent = parent.parent
+        return affected
+
+    # --- 3. REPORTING (API) ---
+    def segment_loss(self, node: TopologyNode):
+        """
+        Loss inside this node's own segment: its input minus what its direct
+        children account for (their own sensor if they have one, else their meters).
+        Separates 'lost between transformer and feeder' from 'lost on the feeder'.
+        """
+        if node.measured is None or node.kind == METER:
+            return None
+        accounted = 0.0
+        for child in node.children:
+            if child.measured is not None:
+                accounted += child.measured
+            else:
+                accounted += child.metered_sum
+        return node.measured - accounted
+
+    def report(self, threshold: float = 0.0) -> list:
+        """Imbalance per instrumented transformer / feeder, biggest loss first."""
+        rows = []
+        for node in list(self.nodes.values()):
+            imbalance = node.imbalance
+            if imbalance is None or node.kind not in (TRANSFORMER, FEEDER):
+                continue
+            if imbalance < threshold:
+                continue
+            rows.append({
+                "node_id": node.node_id,
+                "kind": node.kind,
+                "parent": node.parent.node_id if node.parent else None,
+                "measured": round(node.measured, 3),
+                "metered_downstream": round(node.metered_sum, 3),
+                "imbalance": round(imbalance, 3),
+                "segment_loss": round(self.segment_loss(node), 3),
+            })
+        rows.sort(key=lambda r: r["imbalance"], reverse=True)
+        return rows
+
+    def reset_readings(self):
+        """Forgets readings but keeps the wiring (used by /admin/reset)."""
+        for node in self.nodes.values():
+            node.measured = None
+            node.metered_sum = 0.0
+
+
+# Global Instance
+topology = FeederTopology()
+topology.load_file(settings.TOPOLOGY_FILE)
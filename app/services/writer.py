@@ -0,0 +1,244 @@
+import queue
+import threading
+import time
+from sqlalchemy import func
+from app.config import settings
+from app.database import SessionLocal
+from app.logger import get_logger
+from app.services.metrics import db_flush_seconds, db_flush_rows
+
+log = get_logger()
+
+# Sentinel pushed onto the queue to tell the writer thread to exit
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    Write-behind persistence stage for the ingest path.
+
+    The MQTT thread hands over the rows produced by one message with submit().
+    A dedicated writer thread batches them and commits in bulk transactions,
+    flushing when DB_BATCH_SIZE rows are waiting or DB_FLUSH_INTERVAL expires.
+
+    A row is either an ORM object (added to the session) or a callable
+    fn(session) for writes that are not plain inserts, e.g. upserts.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_queue=10000, batch_size=500, flush_interval=0.5, enabled=True):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        # One queue item = the rows of one message (kept together in one transaction)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = False     # Stop requested: new rows are committed inline
+
+        # --- COUNTERS ---
+        # Inline commits (MQTT thread) and the writer thread both update these
+        self._stats_lock = threading.Lock()
+        self.rows_written = 0
+        self.batches_written = 0
+        self.sync_commits = 0      # Commits done inline (disabled or queue full)
+        self.queue_full_events = 0
+        self.failed_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    # --- 1. LIFECYCLE ---
+    def start(self):
+        if not self.enabled or self.is_running():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        log.info(f"💾 Write-behind DB writer started (batch={self.batch_size}, interval={self.flush_interval}s)")
+
+    def stop(self, timeout: float = 10.0):
+        """Flushes everything still queued, then stops the writer thread."""
+        if not self.is_running():
+            self._thread = None     # Finished after an earlier stop() timed out
+            return
+        self._stopping = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Still flushing: keep the thread so is_running() tells the truth
+            log.warning(f"⚠️ DB writer still flushing after {timeout}s ({self._queue.qsize()} messages queued)")
+            return
+        self._thread = None
+        log.info(f"💾 DB writer stopped. {self.rows_written} rows in {self.batches_written} batches.")
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- 2. PRODUCER SIDE (MQTT thread) ---
+    def submit(self, rows: list):
+        """Queues the rows of one message. Falls back to a direct commit if needed."""
+        if not rows:
+            return
+        if self._stopping or not self.is_running():
+            # Rows queued behind the stop marker would never be written
+            with self._stats_lock:
+                self.sync_commits += 1
+            self._commit([rows])
+            return
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            # Backpressure: the writer is behind, so pay for this commit inline
+            with self._stats_lock:
+                self.queue_full_events += 1
+                self.sync_commits += 1
+            self._commit([rows])
+
+    # --- 3. CONSUMER SIDE (writer thread) ---
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is _STOP:
+                break
+
+            batch = [first]
+            pending = len(first)
+            deadline = time.monotonic() + self.flush_interval
+
+            # Keep collecting until the batch is full or the interval expires
+            while pending < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                pending += len(item)
+
+            self._commit(batch)
+
+        # Shutdown: drain whatever arrived before the stop marker
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit(leftovers)
+
+    def _commit(self, batch: list):
+        """Writes a list of per-message row groups in one transaction."""
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            for rows in batch:
+                self._apply(db, rows)
+            db.commit()
+            with self._stats_lock:
+                self.rows_written += sum(len(rows) for rows in batch)
+                self.batches_written += 1
+        except Exception as e:
+            db.rollback()
+            log.error(f"⚠️ Batch commit failed ({e}), retrying per message")
+            self._commit_one_by_one(db, batch)
+        finally:
+            db.close()
+
+        elapsed = time.perf_counter() - start
+        db_flush_seconds.observe(elapsed)
+        db_flush_rows.inc(amount=sum(len(rows) for rows in batch))
+        elapsed_ms = elapsed * 1000.0
+        with self._stats_lock:
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    @staticmethod
+    def _apply(db, rows: list):
+        for row in rows:
+            if callable(row):
+                row(db)
+            else:
+                db.add(row)
+
+    def _commit_one_by_one(self, db, batch: list):
+        # One bad message must not throw away the whole batch
+        for rows in batch:
+            try:
+                self._apply(db, rows)
+                db.commit()
+                with self._stats_lock:
+                    self.rows_written += len(rows)
+            except Exception as e:
+                db.rollback()
+                with self._stats_lock:
+                    self.failed_rows += len(rows)
+                log.error(f"⚠️ Dropped {len(rows)} rows: {e}")
+        with self._stats_lock:
+            self.batches_written += 1
+
+    # --- 4. STATS ---
+    def stats(self) -> dict:
+        with self._stats_lock:
+            flushes = self.batches_written
+            return {
+                "mode": "WRITE_BEHIND" if self.is_running() else "SYNC",
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "rows_written": self.rows_written,
+                "batches_written": flushes,
+                "sync_commits": self.sync_commits,
+                "queue_full_events": self.queue_full_events,
+                "failed_rows": self.failed_rows,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "avg_flush_ms": round(self._total_flush_ms / flushes, 2) if flushes else 0.0,
+                "max_flush_ms": round(self.max_flush_ms, 2),
+            }
+
+
+class IdSequence:
+    """
+    Hands out primary keys at ingest time, before the row is committed.
+    Lets the hot cache and live feed refer to rows the writer has not flushed yet.
+    Safe because the ingest process is the only writer of these tables.
+    """
+
+    def __init__(self):
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def prime(self, db, *models):
+        """Continues after the highest id already in the database."""
+        with self._lock:
+            for model in models:
+                highest = db.query(func.max(model.id)).scalar() or 0
+                self._next[model] = max(self._next.get(model, 1), highest + 1)
+
+    def next(self, model) -> int:
+        with self._lock:
+            value = self._next.get(model, 1)
+            self._next[model] = value + 1
+            return value
+
+
+# Global Instances
+id_sequence = IdSequence()
+db_writer = WriteBehindWriter(
+    max_queue=settings.DB_QUEUE_SIZE,
+    batch_size=settings.DB_BATCH_SIZE,
+    flush_interval=settings.DB_FLUSH_INTERVAL,
+    enabled=settings.DB_WRITE_BEHIND,
+)
@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import math
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field, ValidationError
+
+# Micro-benchmark for the MQTT payload decode step only (no DB, no analytics):
+#
+#   python bench_decode.py                          # default waveform sizes
+#   python bench_decode.py --sizes 0 1000 8000 --seconds 2
+#
+# "legacy" = payload.decode() -> json.loads() -> SensorData(**dict), waveform as list[float]
+# "fast"   = SensorData.model_validate_json(payload), waveform as a float64 numpy array
+# Both paths end with the waveform as an ndarray, since that is what the FFT consumes.
+
+
+class LegacySensorData(BaseModel):
+    """The schema as it was before the fast path, kept here for comparison."""
+    sensor_id: str
+    device_type: str = "TRANSFORMER"
+    temperature: float
+    current: float
+    vibration: float
+    audio_waveform: Optional[List[float]] = None
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
+def make_payload(samples: int) -> bytes:
+    # 50Hz hum sampled at 1kHz plus a little noise, 4 decimals like the ESP32 sends
+    rng = np.random.default_rng(7)
+    t = np.arange(samples) / 1000.0
+    wave = np.sin(2 * math.pi * 50 * t) + rng.normal(0, 0.05, samples)
+    return json.dumps({
+        "sensor_id": "TX_MAIN_01", "device_type": "TRANSFORMER",
+        "temperature": 61.3, "current": 12.4, "vibration": 0.04,
+        "audio_waveform": [round(float(x), 4) for x in wave],
+        "timestamp": "2026-01-01T12:00:00",
+    }).encode()
+
+
+MALFORMED = [
+    b'{"sensor_id": "TX_MAIN_01", "temperature": 61.3',                                # truncated
+    b'{"sensor_id": "TX_MAIN_01", "current": 1.0, "vibration": 0}',                    # missing field
+    b'{"sensor_id": "TX_MAIN_01", "temperature": "hot", "current": 1, "vibration": 0}',  # wrong type
+]
+
+
+def legacy_decode(payload: bytes):
+    data = LegacySensorData(**json.loads(payload.decode()))
+    if data.audio_waveform is not None:
+        np.asarray(data.audio_waveform, dtype=np.float64)
+    return data
+
+
+def legacy_reject(payload: bytes, log):
+    # What process_message used to do: exception -> full pydantic report in the log
+    try:
+        legacy_decode(payload)
+    except Exception as e:
+        log.error(f"⚠️ Message Error: {e}")
+
+
+def rate(fn, payload, seconds: float) -> float:
+    """Messages per second for fn(payload), best of 3 runs."""
+    best = 0.0
+    for _ in range(3):
+        count, started = 0, time.perf_counter()
+        deadline = started + seconds / 3
+        while True:
+            for _ in range(50):
+                fn(payload)
+            count += 50
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+        best = max(best, count / (now - started))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-Sentinel payload decode benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 64, 256, 1000, 4000], help="Waveform lengths")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time per measurement")
+    args = parser.parse_args()
+
+    # Imported late so the argparse --help works without the app's env
+    from app.schemas import SensorData
+    from app.services.mqtt import reject_payload
+    from app.services.metrics import ingest_metrics
+    from app.logger import get_logger
+
+    def fast_decode(payload: bytes):
+        return SensorData.model_validate_json(payload)
+
+    def fast_reject(payload: bytes):
+        try:
+            fast_decode(payload)
+        except ValidationError as e:
+            reject_payload(e)
+
+    # Both paths log to the same (silenced) logger, so formatting cost is counted but not printed
+    quiet = logging.getLogger("bench_decode")
+    quiet.addHandler(logging.NullHandler())
+    quiet.propagate = False
+    get_logger().setLevel(logging.CRITICAL + 1)
+
+    # Same result on both paths before timing anything
+    sample = make_payload(256)
+    legacy, fast = legacy_decode(sample), fast_decode(sample)
+    assert np.array_equal(np.asarray(legacy.audio_waveform), fast.audio_waveform)
+    assert legacy.model_dump(exclude={"audio_waveform"}) == fast.model_dump(exclude={"audio_waveform"})
+
+    print(f"🔬 DECODE BENCHMARK ({args.seconds}s per cell, msgs/s)")
+    print(f"   {'samples':>8}{'bytes':>9}{'legacy':>12}{'fast':>12}{'speedup':>10}")
+    for size in args.sizes:
+        payload = make_payload(size)
+        old = rate(legacy_decode, payload, args.seconds)
+        new = rate(fast_decode, payload, args.seconds)
+        print(f"   {size:>8}{len(payload):>9}{old:>12,.0f}{new:>12,.0f}{new / old:>9.2f}x")
+
+    print("🚫 MALFORMED PAYLOADS (msgs/s)")
+    for payload in MALFORMED:
+        old = rate(lambda p: legacy_reject(p, quiet), payload, args.seconds)
+        new = rate(fast_reject, payload, args.seconds)
+        print(f"   {payload[:40].decode():<42}{old:>12,.0f}{new:>12,.0f}{new / old:>9.2f}x")
+    rejected = {labels[0]: count for labels, count in ingest_metrics.rejected._values.items()}
+    print(f"   reject counters: {rejected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import tempfile
+import time
+from app.services.dispatch import AlertDispatcher, FileTransport, HttpTransport, Transport
+
+# Offline load test for the outbound alert dispatcher.
+# No SMS gateway or broker needed: alerts go to a file, an HTTP stand-in,
+# or a fake gateway that just sleeps.
+
+
+class SlowGateway(Transport):
+    """Pretends to be a gateway that takes 'latency' seconds per send."""
+    name = "slow"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def send(self, payload):
+        time.sleep(self.latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-Sentinel alert dispatcher load test")
+    parser.add_argument("--alerts", type=int, default=20000)
+    parser.add_argument("--transport", choices=["file", "http", "slow"], default="file")
+    parser.add_argument("--url", default="http://127.0.0.1:9000/alerts")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds per send for --transport slow")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    outbox = None
+    if args.transport == "file":
+        outbox = os.path.join(tempfile.mkdtemp(), "outbox.jsonl")
+        transport = FileTransport(outbox)
+    elif args.transport == "http":
+        transport = HttpTransport(args.url)
+    else:
+        transport = SlowGateway(args.latency)
+
+    dispatcher = AlertDispatcher(max_queue=args.alerts)
+    dispatcher.register("load", transport, concurrency=args.concurrency)
+    dispatcher.start()
+
+    print(f"🔥 DISPATCHING {args.alerts} ALERTS via '{args.transport}' ({args.concurrency} workers)...")
+    start = time.perf_counter()
+    for i in range(args.alerts):
+        dispatcher.dispatch("load", f"Load test alert #{i}")
+    enqueue_time = time.perf_counter() - start
+
+    # Wait until everything is delivered (or given up on)
+    channel = dispatcher.channels["load"]
+    while channel.sent + channel.failed + channel.dropped < args.alerts:
+        time.sleep(0.01)
+    total_time = time.perf_counter() - start
+    dispatcher.stop()
+
+    stats = channel.stats()
+    print(f"✅ Enqueue: {args.alerts / enqueue_time:,.0f} alerts/sec (caller side)")
+    print(f"✅ Delivery: {stats['sent'] / total_time:,.0f} alerts/sec")
+    print(f"   sent={stats['sent']} failed={stats['failed']} dropped={stats['dropped']} retried={stats['retried']}")
+    print(f"   latency p50={stats['latency_ms_p50']}ms p95={stats['latency_ms_p95']}ms max={stats['latency_ms_max']}ms")
+    if outbox:
+        print(f"   outbox: {outbox}")
+
+
+if __name__ == "__main__":
+    main()
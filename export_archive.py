@@ -0,0 +1,55 @@
+import argparse
+import time
+from datetime import datetime
+
+# Columnar export of grid.db for offline analysis (no server needed):
+#
+#   python export_archive.py                          # incremental export into EXPORT_DIR
+#   python export_archive.py --load TX_MAIN_01        # then time an mmap load of one sensor
+#   python export_archive.py --load TX_MAIN_01 --start 2026-01-01 --end 2026-03-31
+#
+# In a notebook:
+#
+#   from app.services.archive import ColumnarArchive
+#   cols = ColumnarArchive("exports").load("readings", sensor_id="TX_MAIN_01")
+#   cols["temperature"].mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-Sentinel columnar archive export")
+    parser.add_argument("--dir", help="Archive directory (default: EXPORT_DIR)")
+    parser.add_argument("--no-export", action="store_true", help="Only load, do not export new rows")
+    parser.add_argument("--load", metavar="SENSOR_ID", help="Time loading this sensor's readings from the archive")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    from app.config import settings
+    from app.database import init_db
+    from app.services.archive import ColumnarArchive
+
+    archive = ColumnarArchive(root=args.dir or settings.EXPORT_DIR, batch_rows=settings.EXPORT_BATCH_ROWS)
+
+    if not args.no_export:
+        init_db()
+        print(f"🗄️ EXPORTING {settings.DATABASE_URL} -> {archive.root} ...")
+        run = archive.export()
+        for kind in ("readings", "events"):
+            print(f"   {kind:<9} +{run[kind]['rows']:>10,} rows in {run[kind]['chunks']:>5} chunks")
+        print(f"✅ Done in {run['elapsed_sec']}s")
+
+    stats = archive.stats()
+    print(f"📦 Archive: {stats['readings_rows']:,} readings ({stats['readings_chunks']} chunks), "
+          f"{stats['events_rows']:,} events ({stats['events_chunks']} chunks)")
+
+    if args.load:
+        started = time.perf_counter()
+        cols = archive.load("readings", sensor_id=args.load, start=args.start, end=args.end)
+        temps = cols["temperature"]
+        peak = float(temps.max()) if len(temps) else float("nan")
+        elapsed = time.perf_counter() - started
+        print(f"⚡ {len(temps):,} readings of {args.load} loaded + scanned in {elapsed:.3f}s (peak {peak:.1f}°C)")
+
+
+if __name__ == "__main__":
+    main()
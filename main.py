@@ -1,10 +1,26 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.services.mqtt import start_mqtt
+from fastapi.responses import PlainTextResponse
+from app.services.mqtt import start_mqtt, stop_mqtt, start_audio_flush, stop_audio_flush
+from app.services.writer import db_writer, id_sequence
+from app.services.rollups import rollup_engine
+from app.services.broadcast import telemetry_hub
+from app.services.audit import chain_verifier
+from app.services.dispatch import alert_dispatcher
+from app.services.metrics import metrics, MetricsMiddleware
+from app.services.llm import grid_gpt
+from app.services.cluster import twin_cluster
+from app.services.retention import retention_engine
+from app.services.ledger import event_ledger
+from app.services.aging import aging_engine
+from app.services.incidents import incident_engine
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, SessionLocal, async_engine
+from app.models import Reading, Event, Incident
+from app.services.state import grid_state
 from app.routes import router as api_router
-from app.logger import get_logger
+from app.logger import get_logger, log_stats
 
 # --- 1. IMPORT THE NEW BRIDGE FILE ---
 from app.routers import api  # <--- NEW IMPORT
@@ -29,8 +45,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The dashboard pages /history/readings with this header
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Per-route request counts and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Service stats become gauges, read only when Prometheus scrapes
+metrics.expose_stats("grid_writer", db_writer.stats)
+metrics.expose_stats("grid_dispatch", lambda: {name: ch.stats() for name, ch in alert_dispatcher.channels.items()}, label="channel")
+metrics.expose_stats("grid_stream", telemetry_hub.stats)
+metrics.expose_stats("grid_llm", grid_gpt.stats)
+metrics.expose_stats("grid_log", log_stats)
+metrics.expose_stats("grid_incidents", incident_engine.report)
+
 # 3. Include Existing Routes (Keep this if you have other stuff there)
 app.include_router(api_router, prefix="/api")
 
@@ -38,19 +67,84 @@ app.include_router(api_router, prefix="/api")
 # This connects the /api/live endpoint we just built
 app.include_router(api.router)  # <--- NEW LINE
 
-@app.on_event("startup")
-async def startup_event():
-    log.info("🚀 Grid-Sentinel System Starting Up...")
+def start_ingest():
+    """Everything only the ingest owner runs: DB writer, dispatcher, MQTT subscribe, twin publisher."""
     log.info("🔹 Initializing Database...")
     init_db()
+    log.info("🔹 Warming Digital Twin cache...")
+    with SessionLocal() as db:
+        id_sequence.prime(db, Reading, Event, Incident)
+        event_ledger.prime(db)
+        aging_engine.prime(db)
+        incident_engine.prime(db)
+        grid_state.warm_from_db(db)
+    db_writer.start()
+    alert_dispatcher.start()
     log.info("🔹 Connecting to MQTT Grid...")
     start_mqtt()
+    start_audio_flush()
+    twin_cluster.start_publisher()
+    retention_engine.start()
+
+def promote_to_owner():
+    # The previous owner died: swap the publish-only MQTT session for a subscribing one
+    stop_mqtt()
+    start_ingest()
+
+@app.on_event("startup")
+async def startup_event():
+    log.info("🚀 Grid-Sentinel System Starting Up...")
+    # Live feed: the MQTT thread (or the twin follower) hands updates to this loop
+    telemetry_hub.bind_loop(asyncio.get_running_loop())
+    if twin_cluster.elect():
+        log.info("👑 Ingest owner for this deployment")
+        start_ingest()
+    else:
+        log.info("🔹 HTTP worker: serving the Digital Twin shared by the ingest owner")
+        start_mqtt(subscribe=False)
+        twin_cluster.start_follower(on_promote=promote_to_owner)
     log.info("✅ System Online and Ready.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    log.info("🛑 Grid-Sentinel Shutting Down...")
+    stop_mqtt()
+    await async_engine.dispose()
+    if twin_cluster.is_reader:
+        twin_cluster.stop()
+        return
+    # Stop ingest first so nothing new lands in the queue, then flush it.
+    # The ingest lock is kept until the flush is done (see below)
+    twin_cluster.stop(release=False)
+    retention_engine.stop()
+    # Waveforms still waiting for a batch: their alerts go in before the incidents are saved
+    stop_audio_flush()
+    open_buckets = rollup_engine.drain()
+    if open_buckets:
+        db_writer.submit([open_buckets])
+    aging_totals = aging_engine.to_row()
+    if aging_totals:
+        db_writer.submit([aging_totals])
+    open_incidents = incident_engine.to_row()
+    if open_incidents:
+        db_writer.submit([open_incidents])
+    db_writer.stop()
+    # Everything is committed: a waiting HTTP worker may take over ingest now
+    twin_cluster.release()
+    alert_dispatcher.stop()
+    chain_verifier.shutdown()
+
 @app.get("/")
 def health_check():
     return {
         "system": "Grid-Sentinel", 
         "status": "OPERATIONAL", 
         "environment": settings.APP_ENV
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint (text format)"""
+    if not metrics.enabled:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Local stand-in for the OpenAI chat completions API, for testing Grid-GPT
+# without a key or internet:
+#
+#   python mock_llm_server.py --port 9100 --latency 1.5
+#   USE_MOCK_LLM=false OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:9100/v1 uvicorn main:app
+#
+# GET /stats shows how many completions actually reached the "model",
+# which is how cache hits and coalescing can be checked.
+
+app = FastAPI(title="Mock LLM")
+config = {"latency": 1.0, "token_delay": 0.02}
+stats = {"completions": 0, "streamed": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def _answer(messages: list) -> str:
+    question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    prefix = "🚨 SECURITY ALERT: " if "'theft_detected': 'YES'" in system else ""
+    return f"{prefix}Sentinel copies. Question received: {question} Telemetry nominal within reported limits."
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    body = {
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    answer = _answer(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    stats["completions"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+
+    if not body.get("stream"):
+        try:
+            await asyncio.sleep(config["latency"])
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(answer.split()), "total_tokens": len(answer.split())},
+        }
+
+    stats["streamed"] += 1
+
+    async def events():
+        try:
+            # Time to first token, then one word per token_delay
+            await asyncio.sleep(config["latency"])
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for i, word in enumerate(answer.split(" ")):
+                yield _chunk(completion_id, model, {"content": word if i == 0 else " " + word})
+                await asyncio.sleep(config["token_delay"])
+            yield _chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def get_stats():
+    return {**stats, **config}
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    config.update(latency=args.latency, token_delay=args.token_delay)
+    print(f"🤖 MOCK LLM on http://{args.host}:{args.port}/v1 (latency={args.latency}s)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Offline ingest benchmark: feeds recorded or synthetic telemetry straight into
+# the MQTT processing pipeline (process_message), no broker involved.
+#
+#   python replay.py --synthetic 20000                      # as fast as possible
+#   python replay.py --input capture.jsonl --speed 10       # 10x real time
+#   python replay.py --synthetic 20000 --save-baseline baseline.json
+#   python replay.py --synthetic 20000 --compare baseline.json
+#
+# One JSONL line = one MQTT payload (what the ESP32 / simulators publish).
+# A "timestamp" field is optional; without it lines are spaced --interval apart.
+
+# decode = JSON parsing, validate = SensorData schema (live ingest runs both in one pass)
+STAGES = ("decode", "validate", "prediction", "physics", "audio", "db", "total")
+
+
+# --- 1. INPUT ---
+def synthetic_messages(count: int, transformers: int, audio_samples: int, fault_rate: float, interval: float, seed: int):
+    """
+    Yields payload dicts that look like the simulators' traffic: each tick every
+    transformer reports, followed by its downstream meter. A small share of
+    ticks carries a fault (heat spike, theft, arcing noise, tampering).
+    """
+    rng = random.Random(seed)
+    # The first two use the demo topology, so energy balance runs on them too
+    pairs = [("SIM-001", "METER-01"), ("TX_MAIN_01", "HOUSE_01")]
+    pairs += [(f"DT-{i:03d}", f"DT-{i:03d}-M") for i in range(len(pairs), transformers)]
+    pairs = pairs[:transformers]
+    temps = {tx: 40.0 for tx, _ in pairs}
+    start = datetime.now() - timedelta(seconds=interval * count)
+    t = np.linspace(0, 1, audio_samples, endpoint=False) if audio_samples else None
+
+    sent = 0
+    tick = 0
+    while sent < count:
+        ts = start + timedelta(seconds=tick * interval)
+        for tx, meter in pairs:
+            fault = rng.random() < fault_rate and rng.choice(["shock", "theft", "audio", "tamper"])
+            temps[tx] = temps[tx] + 3.0 if fault == "shock" else max(30.0, temps[tx] + rng.uniform(-0.02, 0.025))
+            if temps[tx] > 95.0:
+                temps[tx] = 40.0
+            load = 10.0 + rng.uniform(-0.05, 0.05)
+
+            waveform = None
+            if t is not None:
+                wave = np.sin(2 * np.pi * 50 * t)
+                if fault == "audio":
+                    wave = wave + np.array([rng.uniform(-1.0, 1.0) for _ in range(audio_samples)])
+                waveform = [round(v, 4) for v in wave.tolist()]
+
+            yield {
+                "sensor_id": tx, "device_type": "TRANSFORMER",
+                "temperature": round(temps[tx], 2), "current": round(load, 3),
+                "vibration": 1.0 if fault == "tamper" else round(rng.uniform(0.01, 0.3), 3),
+                "audio_waveform": waveform, "timestamp": ts.isoformat(),
+            }
+            sent += 1
+            if sent >= count:
+                return
+            yield {
+                "sensor_id": meter, "device_type": "METER",
+                "temperature": 0, "current": round(load - (5.0 if fault == "theft" else 0.0), 3),
+                "vibration": 0, "audio_waveform": [], "timestamp": ts.isoformat(),
+            }
+            sent += 1
+            if sent >= count:
+                return
+        tick += 1
+
+
+def load_messages(path: str, interval: float):
+    """Reads a JSONL capture. Returns [(payload_bytes, epoch_seconds)]."""
+    messages = []
+    clock = time.time()
+    with open(path) as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            messages.append(_prepare(json.loads(line), clock + i * interval))
+    return messages
+
+
+def _prepare(payload: dict, fallback_ts: float):
+    ts = payload.get("timestamp")
+    epoch = datetime.fromisoformat(ts).timestamp() if isinstance(ts, str) else fallback_ts
+    return json.dumps(payload).encode(), epoch
+
+
+# --- 2. REPLAY ---
+def replay(messages, speed: float):
+    """
+    Pushes every message through process_message().
+    speed = 0 means as fast as possible, otherwise gaps between message
+    timestamps are divided by 'speed' (10 = ten times real time).
+    """
+    from app.services.mqtt import process_message
+
+    samples = {stage: [] for stage in STAGES}
+    rejected = 0
+    first_ts = messages[0][1] if messages else 0.0
+    clock = time.perf_counter
+    started = clock()
+
+    for payload, ts in messages:
+        if speed > 0:
+            due = started + (ts - first_ts) / speed
+            delay = due - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+        timings = {}
+        t0 = clock()
+        ok = process_message(payload, timings=timings, now=ts)
+        timings["total"] = clock() - t0
+        if not ok:
+            rejected += 1
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+
+    return samples, rejected, clock() - started
+
+
+def summarize(samples: dict) -> dict:
+    stages = {}
+    for stage in STAGES:
+        values = samples.get(stage)
+        if not values:
+            continue
+        ms = np.asarray(values) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        stages[stage] = {
+            "count": len(values),
+            "p50_ms": round(float(p50), 4),
+            "p95_ms": round(float(p95), 4),
+            "p99_ms": round(float(p99), 4),
+            "max_ms": round(float(ms.max()), 4),
+        }
+    return stages
+
+
+# --- 3. BASELINES ---
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a list of human readable regressions (empty = all good)."""
+    problems = []
+    old_rate, new_rate = baseline.get("msgs_per_sec"), result["msgs_per_sec"]
+    if old_rate and new_rate < old_rate * (1 - tolerance):
+        problems.append(f"throughput {new_rate:,.0f} msg/s vs baseline {old_rate:,.0f} msg/s")
+
+    for stage, old in baseline.get("stages", {}).items():
+        new = result["stages"].get(stage)
+        if not new:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            # Ignore sub-10us noise on stages that barely cost anything
+            if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > 0.01:
+                problems.append(f"{stage} {key} {new[key]:.4f} vs baseline {old[key]:.4f}")
+    return problems
+
+
+def print_report(result: dict):
+    print(f"✅ {result['messages']} messages in {result['elapsed_sec']}s "
+          f"-> {result['msgs_per_sec']:,.0f} msgs/sec ({result['rejected']} rejected)")
+    print(f"   {'stage':<11}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for stage, row in result["stages"].items():
+        print(f"   {stage:<11}{row['count']:>8}{row['p50_ms']:>11.4f}{row['p95_ms']:>11.4f}{row['p99_ms']:>11.4f}{row['max_ms']:>11.4f}")
+    writer = result["writer"]
+    print(f"   db writer: {writer['mode']}, {writer['rows_written']} rows, {writer['batches_written']} commits, "
+          f"avg {writer['avg_flush_ms']}ms / max {writer['max_flush_ms']}ms per commit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-Sentinel offline ingest replay")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--input", help="JSONL file, one MQTT payload per line")
+    source.add_argument("--synthetic", type=int, default=10000, help="Number of generated messages")
+    parser.add_argument("--transformers", type=int, default=4, help="Synthetic: transformers (each with one meter)")
+    parser.add_argument("--audio-samples", type=int, default=64, help="Synthetic: waveform length (0 = no audio)")
+    parser.add_argument("--fault-rate", type=float, default=0.01, help="Synthetic: share of readings carrying a fault")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--record", help="Also write the synthetic stream to this JSONL file")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between messages without a timestamp / per synthetic tick")
+    parser.add_argument("--speed", type=float, default=0.0, help="Time-warp factor (0 = as fast as possible)")
+    parser.add_argument("--db", help="SQLAlchemy URL (default: scratch SQLite file, never grid.db)")
+    parser.add_argument("--sync-db", action="store_true", help="Commit every message inline instead of write-behind")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's prints and logs")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against (exit 1 on regression)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # Must be set before the app modules read their settings
+    workdir = tempfile.mkdtemp(prefix="grid-replay-")
+    os.environ["DATABASE_URL"] = args.db or f"sqlite:///{os.path.join(workdir, 'replay.db')}"
+    os.environ["DB_WRITE_BEHIND"] = "false" if args.sync_db else "true"
+    os.environ["ALERT_TRANSPORT"] = "file"
+    os.environ["ALERT_FILE_PATH"] = os.path.join(workdir, "alerts_outbox.jsonl")
+
+    if args.input:
+        messages = load_messages(args.input, args.interval)
+    else:
+        generated = list(synthetic_messages(args.synthetic, args.transformers, args.audio_samples,
+                                            args.fault_rate, args.interval, args.seed))
+        if args.record:
+            with open(args.record, "w") as f:
+                f.writelines(json.dumps(m) + "\n" for m in generated)
+        messages = [_prepare(m, 0.0) for m in generated]
+
+    from app.database import init_db, SessionLocal
+    from app.models import Reading, Event, Incident
+    from app.services.writer import db_writer, id_sequence
+    from app.services.ledger import event_ledger
+    from app.services.incidents import incident_engine
+    from app.services.aging import aging_engine
+    from app.services.rollups import rollup_engine
+    from app.services.dispatch import alert_dispatcher, FileTransport
+    from app.services.mqtt import flush_audio
+
+    init_db()
+    with SessionLocal() as db:
+        id_sequence.prime(db, Reading, Event, Incident)
+        event_ledger.prime(db)
+        incident_engine.prime(db)
+    # Relay commands would go to a broker we are not connected to
+    alert_dispatcher.register("control", FileTransport(os.environ["ALERT_FILE_PATH"]))
+    alert_dispatcher.start()
+    db_writer.start()
+
+    print(f"🔥 REPLAYING {len(messages)} MESSAGES ({'max speed' if args.speed <= 0 else f'{args.speed}x'})...")
+    console = sys.stdout
+    if not args.verbose:
+        # The pipeline prints a MONITOR line per transformer reading and logs
+        # every alert; rejected messages are still counted in the report
+        logging.getLogger("grid_sentinel").setLevel(logging.CRITICAL + 1)
+        sys.stdout = open(os.devnull, "w")
+    try:
+        samples, rejected, elapsed = replay(messages, args.speed)
+
+        # Throughput includes flushing everything still queued for SQLite
+        flush_start = time.perf_counter()
+        # Waveforms still waiting for a batch (their alerts belong to this run)
+        flush_audio(now=messages[-1][1] if messages else None)
+        open_buckets = rollup_engine.drain()
+        if open_buckets:
+            db_writer.submit([open_buckets])
+        aging_engine.flush()
+        aging_totals = aging_engine.to_row()
+        if aging_totals:
+            db_writer.submit([aging_totals])
+        open_incidents = incident_engine.to_row()
+        if open_incidents:
+            db_writer.submit([open_incidents])
+        db_writer.stop()
+        alert_dispatcher.stop()
+        elapsed += time.perf_counter() - flush_start
+    finally:
+        if sys.stdout is not console:
+            sys.stdout.close()
+            sys.stdout = console
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": args.input or f"synthetic:{args.synthetic}x{args.transformers}tx/audio{args.audio_samples}",
+        "speed": args.speed,
+        "messages": len(messages),
+        "rejected": rejected,
+        "elapsed_sec": round(elapsed, 3),
+        "msgs_per_sec": round(len(messages) / elapsed, 1) if elapsed > 0 else math.inf,
+        "stages": summarize(samples),
+        "writer": {**db_writer.stats(), "mode": "SYNC" if args.sync_db else "WRITE_BEHIND"},
+    }
+    print_report(result)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Baseline saved: {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance)
+        if problems:
+            print(f"❌ REGRESSION vs {args.compare} (tolerance {args.tolerance:.0%}):")
+            for problem in problems:
+                print(f"   - {problem}")
+            sys.exit(1)
+        print(f"✅ No regression vs {args.compare}")
+
+
+if __name__ == "__main__":
+    main()